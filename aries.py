@@ -1,4 +1,26 @@
+import argparse
+import heapq
 import json
+import os
+from typing import Iterable
+
+import checkpoint
+import columnar
+import incremental
+import parallel
+import pipeline
+import spill
+import vectorized
+from binwal import BinaryWal, is_binary_wal
+from bufferpool import POLICIES, BufferPool
+from delta import PageOriginals, write_delta, write_pages
+from metrics import RecoveryMetrics
+from pageindex import PageUpdateIndex
+from pagestore import PageStore, is_page_store
+from pagetable import PageTable
+from segments import SegmentedWal, SegmentIndex, is_segmented_wal, read_segments
+from walfile import WalFile
+from walindex import LsnLookup, WalIndex
 
 # 1.) Analysis
 # - We first reconstruct the transaction and dirty page table to determine which transactions were commited and not commited.
@@ -43,18 +65,38 @@ import json
 DEFAULT_WAL_FILE_PATH = "./files/wal.jsonl"
 DEFAULT_DISK_PAGES_PATH = "./files/disk_pages.json"
 DISK_PAGES_OUT_PATH = "./disk_pages_after.json"
+DISK_PAGES_DELTA_PATH = "./disk_pages_delta.jsonl"
+OUTPUT_FORMATS = ("full", "compact", "delta")
+
+
+def is_redoable(wal_entry: dict) -> bool:
+    # UPDATEs and CLRs both carry an after-image for a single page.
+    # (CLRs written before they were redoable only had an LSN, skip those.)
+    return wal_entry["type"] in ("UPDATE", "CLR") and "page" in wal_entry
 
 
 def redo(
-    wal: list[dict],
+    wal: Iterable[dict],
     dirty_page_table: dict[str, int],
     disk_pages: dict[str, dict],
+    stats: dict | None = None,
 ) -> list[int]:
     # Redo all updates starting from the recovery lsn.
     # We do this in order to ensure that winners are written to disk (fix no-force), and
     # to put losers in a state that we can undo from (fix steal).
+    # CLRs are redone too, so undo work done before a crash doesn't have to be repeated.
+    # If stats is given, the skip counts are added to it.
+
+    columns = columnar.as_range(wal)
+    if columns is not None:
+        # Same thing, straight off the arrays of a ColumnarWal.
+        return columns.redo(dirty_page_table, disk_pages, stats)
+    if isinstance(disk_pages, PageTable):
+        # Same thing, straight on the page table's columns.
+        return disk_pages.redo(wal, dirty_page_table, stats)
 
     redone_lsns = []
+    skipped_below_rec_lsn = skipped_page_lsn = 0
 
     if not dirty_page_table.values():
         # Nothing to do...
@@ -66,69 +108,245 @@ def redo(
     for wal_entry in wal:
         # No need to process entries until we reach recovery lsn.
         if wal_entry["LSN"] < min_recovery_lsn:
+            skipped_below_rec_lsn += 1
             continue
 
-        if wal_entry["type"] != "UPDATE":
+        if not is_redoable(wal_entry):
             continue
 
         wal_lsn = wal_entry["LSN"]
-        wal_page = wal_entry["page"]
-        page_lsn = disk_pages[wal_page]["pageLSN"]
+        # One lookup per record, so a buffer pool only brings the page in once.
+        page = disk_pages[wal_entry["page"]]
+        page_lsn = page["pageLSN"]
 
         # If wal LSN is less than or equal to the page LSN no need to redo...
         if wal_lsn <= page_lsn:
             # This page has been redone already in a previous recovery...
+            skipped_page_lsn += 1
             continue
 
-        disk_pages[wal_page]["value"] = wal_entry["after"]
-        disk_pages[wal_page]["pageLSN"] = wal_lsn
+        page["value"] = wal_entry["after"]
+        page["pageLSN"] = wal_lsn
         redone_lsns.append(wal_lsn)
 
+    if stats is not None:
+        stats["skipped_below_rec_lsn"] = skipped_below_rec_lsn
+        stats["skipped_page_lsn"] = skipped_page_lsn
     return redone_lsns
 
 
+def redo_records_from(
+    wal, start_offset: int | None, min_recovery_lsn: int | None
+) -> Iterable[dict]:
+    # wal.records_from(start_offset) for redo. Records redo won't look at more
+    # than the LSN and type of (below min_recovery_lsn, or not an UPDATE or
+    # CLR) come as just those two fields and are never decoded.
+    if (
+        min_recovery_lsn is None
+        or columnar.as_range(wal) is not None
+        or not hasattr(wal, "scan_lazy")
+    ):
+        # Nothing to redo without a recLSN, and nothing to decode for a ColumnarWal.
+        return wal.records_from(start_offset)
+    return _redo_records(wal, start_offset, min_recovery_lsn)
+
+
+def _redo_records(wal, start_offset: int | None, min_recovery_lsn: int):
+    for _, _, lsn, record_type, raw in wal.scan_lazy(start_offset):
+        if lsn >= min_recovery_lsn and record_type in ("UPDATE", "CLR"):
+            yield wal.decode_raw(raw)
+        else:
+            yield {"LSN": lsn, "type": record_type}
+    yield from wal.tail
+
+
+def _undo_update(
+    wal: list[dict] | WalFile | BinaryWal,
+    wal_entry: dict,
+    disk_pages: dict[str, dict],
+    clr_lsn: int,
+    undo_next_lsn: int | None,
+    prev_lsn: int | None,
+    log=None,
+) -> None:
+    # Let's undo the change and write a CLR to the WAL.
+    # The CLR is redo-only: redo replays its after-image (our before-image) like
+    # an UPDATE, and undoNextLSN says where rolling back this transaction continues.
+    # So if we crash part way through undo, the next restart picks up from there.
+    page_number = wal_entry["page"]
+
+    clr = {"LSN": clr_lsn, "type": "CLR", "tx": wal_entry["tx"]}
+    if prev_lsn is not None:
+        clr["prevLSN"] = prev_lsn
+    clr["page"] = page_number
+    clr["after"] = wal_entry["before"]
+    clr["undoNextLSN"] = undo_next_lsn
+
+    # Log first, then change the page.
+    if log is not None:
+        log.append(clr)
+    wal.append(clr)
+
+    if isinstance(disk_pages, PageTable):
+        disk_pages.write(page_number, clr["LSN"], wal_entry["before"])
+        return
+    page = disk_pages[page_number]
+    page["pageLSN"] = clr["LSN"]
+    page["value"] = wal_entry["before"]
+
+
+def _has_prev_lsn_chains(lookup: LsnLookup, last_lsns: list[int]) -> bool:
+    # Logs written before records carried prevLSN can't be undone by following chains.
+    for lsn in last_lsns:
+        try:
+            wal_entry = lookup(lsn)
+        except KeyError:
+            return False
+        if wal_entry["type"] != "BEGIN" and "prevLSN" not in wal_entry:
+            return False
+    return True
+
+
+def _end_losers(
+    wal: list[dict] | WalFile | BinaryWal,
+    loser_last_lsns: dict[str, int],
+    next_lsn: int,
+    log,
+) -> None:
+    # Once a loser is fully rolled back it gets an END, so a restart that reads
+    # the log file again doesn't have to look at it. loser_last_lsns holds the
+    # last record each loser wrote (its last CLR, if undo wrote any).
+    for tx, last_lsn in loser_last_lsns.items():
+        end = {"LSN": next_lsn, "type": "END", "tx": tx, "prevLSN": last_lsn}
+        log.append(end)
+        wal.append(end)
+        next_lsn += 1
+
+
+def _loser_last_lsns(transaction_table: dict[str, dict]) -> dict[str, int]:
+    return {
+        tx: info["lastLSN"]
+        for tx, info in transaction_table.items()
+        if info["status"] not in ("COMMITTED", "END")
+    }
+
+
 def undo(
-    wal: list[dict],
+    wal: list[dict] | WalFile | BinaryWal,
     transaction_table: dict[str, dict],
     disk_pages: dict[str, dict],
+    wal_index: WalIndex | None = None,
+    log=None,
 ) -> list[int]:
-    # Perform a single backward scan of the log to simultaneously
-    # undo all operations belonging to uncommitted "loser" transactions in reverse chronological order.
+    # Undo all operations belonging to uncommitted "loser" transactions in reverse chronological order.
+    # With a log (checkpoint.WalAppender) every CLR is also appended to the WAL
+    # file as it is written, and each loser gets an END there once it is rolled back.
 
     if not transaction_table:
         # Nothing to undo!
         return []
 
-    # Since we don't have prevLSN in wal we do the following:
+    undone_lsns = []
+    # The last record in the log, read without materializing the log.
+    next_lsn_to_write = next(reversed(wal))["LSN"] + 1
+
+    # We assume the transaction has ended if not in transaction table following analysis...
+    # Loser -> the last record it wrote, which becomes the prevLSN of its next CLR.
+    loser_last_lsns = _loser_last_lsns(transaction_table)
+
+    # Textbook ARIES: walk each loser's prevLSN chain back from its lastLSN,
+    # always undoing the largest outstanding LSN next (a max-heap, so negated LSNs).
+    # The work is proportional to the loser records, not to the length of the log.
+    lookup = LsnLookup(wal, wal_index)
+    if _has_prev_lsn_chains(lookup, list(loser_last_lsns.values())):
+        to_undo = [-lsn for lsn in loser_last_lsns.values()]
+        heapq.heapify(to_undo)
+
+        while to_undo:
+            wal_entry = lookup(-heapq.heappop(to_undo))
+
+            match wal_entry:
+                case {"type": "CLR", "undoNextLSN": next_lsn}:
+                    # Everything after undoNextLSN was already rolled back
+                    # before we crashed, jump straight past it.
+                    pass
+                case {"type": "BEGIN"}:
+                    # Reached the start of this transaction.
+                    next_lsn = None
+                case {"prevLSN": next_lsn}:
+                    pass
+                case _:
+                    raise ValueError(
+                        f"WAL record {wal_entry['LSN']} is missing its prevLSN"
+                    )
+
+            if wal_entry["type"] == "UPDATE":
+                txn_id = wal_entry["tx"]
+                _undo_update(
+                    wal,
+                    wal_entry,
+                    disk_pages,
+                    next_lsn_to_write,
+                    next_lsn,
+                    loser_last_lsns[txn_id],
+                    log,
+                )
+                loser_last_lsns[txn_id] = next_lsn_to_write
+                undone_lsns.append(wal_entry["LSN"])
+                next_lsn_to_write += 1
+
+            if next_lsn is not None:
+                heapq.heappush(to_undo, -next_lsn)
+
+        if log is not None:
+            _end_losers(wal, loser_last_lsns, next_lsn_to_write, log)
+        return undone_lsns
+
+    # Otherwise we do the following:
     # Scan up and undo anything part of a loser tranasction (not commited transaction or not in table (end)).
 
-    undone_lsns = []
-    next_lsn_to_write = wal[-1]["LSN"] + 1
+    # Loser -> undoNextLSN of its latest CLR. Updates above it were undone before we crashed.
+    undo_next_lsns = {}
 
     for wal_entry in reversed(wal):
+        match wal_entry:
+            case {"type": "CLR", "tx": clr_tx, "undoNextLSN": undo_next_lsn}:
+                # The latest CLR comes first since we are going backward.
+                undo_next_lsns.setdefault(clr_tx, undo_next_lsn)
+                continue
+
         if wal_entry["type"] != "UPDATE":
             continue
 
-        # We assume the transaction has ended if not in transaction table following analysis...
         txn_id = wal_entry["tx"]
         txn_status = transaction_table.get(txn_id, {"status": "END"})["status"]
         if txn_status in ("COMMITTED", "END"):
             continue
 
-        # Let's undo the change and write a CLR to the WAL.
-        page_number = wal_entry["page"]
-
-        clr = {"LSN": next_lsn_to_write, "type": "CLR"}
-
-        disk_pages[page_number]["pageLSN"] = clr["LSN"]
-        disk_pages[page_number]["value"] = wal_entry["before"]
+        if txn_id in undo_next_lsns:
+            undo_next_lsn = undo_next_lsns[txn_id]
+            if undo_next_lsn is None or wal_entry["LSN"] > undo_next_lsn:
+                continue
 
+        # Without prevLSN we don't know which record of this transaction comes
+        # next, but everything of it above LSN - 1 is now rolled back, and that
+        # is all a later scan needs to know.
+        # iterating in the reverse direction so appending CLRs is okay.
+        _undo_update(
+            wal,
+            wal_entry,
+            disk_pages,
+            next_lsn_to_write,
+            wal_entry["LSN"] - 1,
+            None,
+            log,
+        )
         undone_lsns.append(wal_entry["LSN"])
-
-        # iterating in the reverse direction so we will be okay.
-        wal.append(clr)
+        loser_last_lsns[txn_id] = next_lsn_to_write
         next_lsn_to_write += 1
 
+    if log is not None:
+        _end_losers(wal, loser_last_lsns, next_lsn_to_write, log)
     return undone_lsns
 
 
@@ -168,9 +386,26 @@ def _print_analysis_report(transaction_table, dirty_page_table, ended_txns):
         print(f"\t\t{page}, {rec_lsn}")
 
 
-def analysis(wal: list[dict]) -> tuple[dict, dict, list]:
+def _transaction_entry(transaction_table: dict[str, dict], tx: str, lsn: int) -> dict:
+    # Records before a checkpoint can belong to transactions whose BEGIN is no
+    # longer in the log, so treat an unknown transaction as running (textbook ARIES).
+    # Whatever we get wrong here is thrown away when we reach the checkpoint.
+    if tx not in transaction_table:
+        transaction_table[tx] = {"status": "RUNNING", "lastLSN": lsn}
+    return transaction_table[tx]
+
+
+def analysis(wal: Iterable[dict], page_index=None) -> tuple[dict, dict, list]:
     # TODO: Fill me in with what I do!
     """I return the transaction table then the dirty page table."""
+    columns = columnar.as_range(wal)
+    if columns is not None:
+        # Same thing, straight off the arrays of a ColumnarWal.
+        # It can also fill in a per-page update index for redo (see pageindex.py).
+        return columns.analysis(page_index)
+    if page_index is not None:
+        raise ValueError("a page update index needs a ColumnarWal")
+
     dirty_page_table = {}
 
     # Page mumber -> recLSN (the earliest LSN where that page was modified since it became dirty).
@@ -182,35 +417,19 @@ def analysis(wal: list[dict]) -> tuple[dict, dict, list]:
     # - Construct dirty page table.
     # - Construct transaction table.
 
-    # 1.) Scan from the large lsn to low lsn and determine the latest checkpoint.
-    # 2.) Initialize the tables from the checkpoint.
-    # 3.) Then scan from small lsn to large lsn to update the tables to latest state.
-
-    # 1.) Find the index of the latest checkpoint (if any).
-    checkpoint_index = None
-    for i in range(len(wal) - 1, -1, -1):
-        wal_entry = wal[i]
+    # The WAL may be a stream that can only be read once, front to back, so we
+    # can't search backward for the latest checkpoint first. Instead:
+    # 1.) Scan from small lsn to large lsn, keeping the tables up to date.
+    # 2.) Whenever we hit a checkpoint, throw away what we had and start over from its snapshot.
+    # After the last checkpoint this is exactly the same as seeking to it and scanning forward.
 
+    for wal_entry in wal:
         match wal_entry:
             case {"type": "CHECKPOINT", "DPT": dpt_snapshot, "TT": tt_snapshot}:
-                dirty_page_table = dpt_snapshot
-                transaction_table = tt_snapshot
-                checkpoint_index = i
-                break
-            case _:
-                continue
-
-    # 2.) Now process all logs after the latest checkpoint.
-    # to ensure we have the most up to date tables...
-
-    # There was no checkpoint, we should start from 0 and include log at 0.
-    if checkpoint_index is None:
-        checkpoint_index = -1
-
-    for i in range(checkpoint_index + 1, len(wal), 1):
-        wal_entry = wal[i]
-
-        match wal_entry:
+                # Copy so we don't modify the checkpoint record itself.
+                dirty_page_table = dict(dpt_snapshot)
+                transaction_table = {tx: dict(info) for tx, info in tt_snapshot.items()}
+                ended_transactions = []
             case {"LSN": lsn, "type": "BEGIN", "tx": tx}:
                 # Add this transaction to the transaction table...
                 transaction_table[tx] = {
@@ -219,70 +438,421 @@ def analysis(wal: list[dict]) -> tuple[dict, dict, list]:
                 }
             case {
                 "LSN": lsn,
-                "type": "UPDATE",
+                "type": "UPDATE" | "CLR",
                 "tx": tx,
                 "page": page,
             }:
                 # Update the last lsn for this transaction, and update the pages
                 # dirty page table entry for redo later if earliest update.
-                transaction_table[tx]["lastLSN"] = lsn
+                # CLRs change a page just like updates do.
+                _transaction_entry(transaction_table, tx, lsn)["lastLSN"] = lsn
                 # Add this page to the dirty page table if not already in there.
                 if page not in dirty_page_table:
                     dirty_page_table[page] = lsn
 
             case {"LSN": lsn, "type": "COMMIT", "tx": tx}:
-                transaction_table[tx]["lastLSN"] = lsn
+                entry = _transaction_entry(transaction_table, tx, lsn)
+                entry["lastLSN"] = lsn
                 # Will consider this transaction a winnner later doing undo...
-                transaction_table[tx]["status"] = "COMMITTED"
+                entry["status"] = "COMMITTED"
 
             case {"LSN": lsn, "type": "ABORT", "tx": tx}:
-                transaction_table[tx]["lastLSN"] = lsn
+                entry = _transaction_entry(transaction_table, tx, lsn)
+                entry["lastLSN"] = lsn
                 # Add this transaction to the transaction table...
-                transaction_table[tx]["status"] = "ABORTED"
+                entry["status"] = "ABORTED"
             case {"LSN": _, "type": "END", "tx": tx}:
                 # No longer need to manage this transaction...
                 # A winner of sorts...
-                transaction_table.pop(tx)
+                transaction_table.pop(tx, None)
                 ended_transactions.append(tx)
 
     return transaction_table, dirty_page_table, ended_transactions
 
 
-def _load_wal(path: str) -> list[dict]:
+def _load_wal(path: str) -> WalFile | BinaryWal | SegmentedWal:
+    # Records are decoded lazily as each phase streams through the file.
+    # A directory is a segmented WAL (see segments.py); binary WALs (see
+    # binwal.py) are recognized by their magic bytes.
+    if is_segmented_wal(path):
+        return SegmentedWal(path)
+    if is_binary_wal(path):
+        return BinaryWal(path)
+    return WalFile(path)
+
+
+def _open_index(wal) -> WalIndex | SegmentIndex:
+    # The sidecar index of a WAL file, or the segment headers of a segmented WAL.
+    if wal.path is not None and is_segmented_wal(wal.path):
+        return SegmentIndex(read_segments(wal.path))
+    return WalIndex.open(wal)
+
+
+def _load_pages(path: str, page_table: bool = False) -> dict | PageStore | PageTable:
+    # Page stores (see pagestore.py) are recognized by their magic bytes and
+    # opened in place; anything else is the disk_pages.json layout, loaded as a
+    # dict or, with page_table, into a PageTable (see pagetable.py).
+    if is_page_store(path):
+        return PageStore(path)
+    if page_table:
+        return PageTable.load(path)
     with open(path) as f:
-        return [json.loads(line) for line in f]
+        return json.load(f)
 
 
-def _load_pages(path: str) -> dict:
-    with open(path) as f:
-        return json.load(f)
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="ARIES recovery simulation.")
+    parser.add_argument(
+        "--redo-workers",
+        type=int,
+        default=1,
+        metavar="N",
+        help="read and replay byte ranges of the WAL file for redo on N worker processes (default: 1, serial)",
+    )
+    parser.add_argument(
+        "--analysis-workers",
+        type=int,
+        default=1,
+        metavar="N",
+        help="read and summarize byte ranges of the WAL file for analysis on N worker processes (default: 1, serial)",
+    )
+    parser.add_argument(
+        "--buffer-frames",
+        type=int,
+        metavar="N",
+        help="keep at most N pages in memory during redo and undo, "
+        "writing modified pages back on eviction (default: every page)",
+    )
+    parser.add_argument(
+        "--buffer-policy",
+        choices=POLICIES,
+        default="lru",
+        help="buffer pool eviction policy (default: lru)",
+    )
+    parser.add_argument(
+        "--page-table",
+        action="store_true",
+        help="hold JSON disk pages in an interned, array-backed page table instead of "
+        "a dict per page (see pagetable.py; page stores are used as they are)",
+    )
+    parser.add_argument(
+        "--redo-memory-budget",
+        type=int,
+        metavar="MIB",
+        help="redo page by page through an external sort that spills to disk past "
+        "MIB MiB of buffered updates (see spill.py)",
+    )
+    parser.add_argument(
+        "--spill-dir",
+        metavar="DIR",
+        help="where --redo-memory-budget spills to (default: the system temporary directory)",
+    )
+    parser.add_argument(
+        "--wal",
+        default=DEFAULT_WAL_FILE_PATH,
+        help=f"WAL to recover from, JSONL, binary or a directory of segments (default: {DEFAULT_WAL_FILE_PATH})",
+    )
+    parser.add_argument(
+        "--pages",
+        default=DEFAULT_DISK_PAGES_PATH,
+        help="disk pages, JSON or a page store, which is recovered in place "
+        f"(default: {DEFAULT_DISK_PAGES_PATH})",
+    )
+    parser.add_argument(
+        "--out",
+        help="where to write the recovered JSON pages, a page store is recovered "
+        f"in place instead (default: {DISK_PAGES_OUT_PATH}, or "
+        f"{DISK_PAGES_DELTA_PATH} for a delta)",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=OUTPUT_FORMATS,
+        default="full",
+        help="full: every page, indented; compact: every page, no whitespace; "
+        "delta: only the pages recovery changed, also for a page store, to apply "
+        "with delta.py (default: full)",
+    )
+
+    parser.add_argument(
+        "--columnar",
+        action="store_true",
+        help="load the WAL into compact in-memory arrays (see columnar.py) before recovering",
+    )
+    parser.add_argument(
+        "--vectorized-redo",
+        action="store_true",
+        help="run redo with NumPy over the columnar WAL (implies --columnar, needs numpy)",
+    )
+    parser.add_argument(
+        "--page-index",
+        action="store_true",
+        help="index each page's updates during analysis and redo every dirty page "
+        "from its own recLSN (implies --columnar, see pageindex.py)",
+    )
+    parser.add_argument(
+        "--incremental-analysis",
+        action="store_true",
+        help="resume analysis from the state saved next to the WAL last time and "
+        "only analyze what was appended since (see incremental.py)",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="decode the WAL once on a reader thread and overlap analysis and redo "
+        "(see pipeline.py)",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="write per-phase timings and counters as JSON to PATH (- for stdout)",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="record each phase's peak traced memory in the metrics (slow)",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="run each phase under cProfile and tracemalloc and dump the stats into DIR",
+    )
+
+    subcommands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    checkpoint_parser = subcommands.add_parser(
+        "checkpoint",
+        help="append a checkpoint to the WAL and optionally drop the prefix recovery no longer needs",
+    )
+    checkpoint_parser.add_argument(
+        "--wal", default=DEFAULT_WAL_FILE_PATH, help="WAL file to checkpoint"
+    )
+    truncation = checkpoint_parser.add_mutually_exclusive_group()
+    truncation.add_argument(
+        "--truncate",
+        action="store_true",
+        help="delete the log prefix below the checkpoint's truncation point",
+    )
+    truncation.add_argument(
+        "--archive-dir",
+        metavar="DIR",
+        help="move the log prefix below the truncation point into DIR",
+    )
+
+    args = parser.parse_args(argv)
+    if args.incremental_analysis and (
+        args.columnar or args.vectorized_redo or args.page_index or args.pipeline
+    ):
+        parser.error(
+            "--incremental-analysis reads the WAL file, it can't be combined with "
+            "--columnar, --vectorized-redo, --page-index or --pipeline"
+        )
+    if args.command == "checkpoint" and is_segmented_wal(args.wal):
+        parser.error("segmented WALs are archives, a checkpoint can't be appended")
+    if args.incremental_analysis and is_segmented_wal(args.wal):
+        parser.error("--incremental-analysis follows a WAL file, not segments")
+    if (
+        args.command is None
+        and is_segmented_wal(args.wal)
+        and os.path.isfile(args.pages)
+        and is_page_store(args.pages)
+    ):
+        parser.error(
+            "a page store is recovered in place, which needs a WAL file to log "
+            "its CLRs to; segmented WALs are read-only"
+        )
+    return args
+
+
+def _checkpoint(args: argparse.Namespace) -> None:
+    # Take the tables from analysis and write them into the log as a checkpoint.
+    with _load_wal(args.wal) as wal:
+        wal_index = _open_index(wal)
+        transaction_table, dirty_page_table, _ = analysis(
+            wal.records_from(wal_index.last_checkpoint_offset())
+        )
+
+    checkpoint_record, dropped, archive_path = checkpoint.checkpoint_and_truncate(
+        args.wal,
+        transaction_table,
+        dirty_page_table,
+        truncate=args.truncate,
+        archive_dir=args.archive_dir,
+    )
+
+    print(f"Wrote CHECKPOINT at LSN {checkpoint_record['LSN']} to {args.wal}")
+    if not args.truncate and args.archive_dir is None:
+        return
+    if dropped == 0:
+        print("Nothing in the WAL is old enough to drop yet")
+    elif archive_path is not None:
+        print(f"Archived {dropped} WAL records to {archive_path}")
+    else:
+        print(f"Truncated {dropped} WAL records")
+
+
+def main(argv: list[str] | None = None):
+    args = _parse_args(argv)
 
+    if args.command == "checkpoint":
+        _checkpoint(args)
+        return
+
+    metrics = RecoveryMetrics(trace_memory=args.trace_memory, profile_dir=args.profile)
+    instrumented = args.metrics is not None or args.profile is not None
 
-def main():
     # Load pages and WAL.
-    wal = _load_wal(DEFAULT_WAL_FILE_PATH)
-    disk_pages = _load_pages(DEFAULT_DISK_PAGES_PATH)
+    with metrics.phase("load_wal"):
+        wal = _load_wal(args.wal)
+        if isinstance(wal, SegmentedWal):
+            metrics.watch_segments(wal)
+        if args.columnar or args.vectorized_redo or args.page_index:
+            with wal as source:
+                wal = columnar.ColumnarWal.load(source)
+    metrics.watch_wal(wal)
+    with metrics.phase("load_pages"):
+        disk_pages = _load_pages(args.pages, args.page_table)
+
+    # The sidecar index lets each phase seek to where its work starts.
+    with metrics.phase("index"):
+        wal_index = _open_index(wal)
+
+    # Redo and undo see the pages through a bounded buffer pool, if asked for one.
+    pages = disk_pages
+    buffer_pool = None
+    if args.buffer_frames is not None:
+        pages = buffer_pool = BufferPool(
+            disk_pages, args.buffer_frames, args.buffer_policy
+        )
+    # For a delta, remember what each page looked like before recovery changed it.
+    originals = None
+    if args.output_format == "delta":
+        pages = originals = PageOriginals(pages)
+    if instrumented:
+        pages = metrics.track_pages(pages)
+
+    if args.pipeline:
+        # Analysis and redo together, over one pass of decoding the log.
+        with metrics.phase("analysis_redo") as counters:
+            transaction_table, dirty_page_table, ended_txns, redone_lsns = (
+                pipeline.recover_pipelined(wal, wal_index, pages, counters)
+            )
+            counters["redone"] = len(redone_lsns)
+    else:
+        # Perform Analysis (starting at the latest checkpoint).
+        page_index = PageUpdateIndex(wal) if args.page_index else None
+        with metrics.phase("analysis"):
+            analysis_start = wal_index.last_checkpoint_offset()
+            if page_index is not None:
+                transaction_table, dirty_page_table, ended_txns = analysis(
+                    wal.records_from(analysis_start), page_index
+                )
+            elif args.incremental_analysis:
+                transaction_table, dirty_page_table, ended_txns = (
+                    incremental.IncrementalAnalysis.open(wal, wal_index).tables()
+                )
+            else:
+                transaction_table, dirty_page_table, ended_txns = (
+                    parallel.analysis_parallel(wal, args.analysis_workers, wal_index)
+                )
+
+        # Perform Redo.
+        with metrics.phase("redo") as counters:
+            # Skip straight past everything below the smallest recLSN.
+            redo_start = None
+            if dirty_page_table:
+                redo_start = wal_index.offset_for_lsn(min(dirty_page_table.values()))
+            if page_index is not None:
+                redone_lsns = page_index.redo(dirty_page_table, pages, counters)
+            elif args.redo_memory_budget is not None:
+                redone_lsns = spill.redo_spilled(
+                    redo_records_from(
+                        wal, redo_start, min(dirty_page_table.values(), default=None)
+                    ),
+                    dirty_page_table,
+                    pages,
+                    args.redo_memory_budget << 20,
+                    counters,
+                    args.spill_dir,
+                )
+            elif args.vectorized_redo:
+                redone_lsns = vectorized.redo_vectorized(
+                    wal.records_from(redo_start), dirty_page_table, pages, counters
+                )
+            else:
+                redone_lsns = parallel.redo_parallel(
+                    wal,
+                    dirty_page_table,
+                    pages,
+                    args.redo_workers,
+                    counters,
+                    wal_index,
+                )
+            counters["redone"] = len(redone_lsns)
 
-    # Perform Analysis.
-    transaction_table, dirty_page_table, ended_txns = analysis(wal)
     _print_analysis_report(transaction_table, dirty_page_table, ended_txns)
-
-    # Perform Redo.
     print("Page Update Report:")
     print("\tRedone WAL Enrties By LSN:")
-    redone_lsns = redo(wal, dirty_page_table, disk_pages)
     for lsn in redone_lsns:
         print(f"\t\t{str(lsn)}")
+    if isinstance(redone_lsns, spill.SpilledLsns):
+        redone_lsns.close()
 
     # Perform Undo.
     print("\tUndone WAL Enrties By LSN:")
-    undone_lsns = undo(wal, transaction_table, disk_pages)
+    with metrics.phase("undo") as counters:
+        # A page store is changed in place, so its CLRs have to reach the WAL
+        # file before its pages do (the WAL rule), or the next restart would
+        # see pageLSNs from records that aren't in the log.
+        log = None
+        if isinstance(disk_pages, PageStore):
+            log = checkpoint.WalAppender(args.wal)
+        undone_lsns = undo(wal, transaction_table, pages, wal_index, log)
+        if log is not None:
+            log.sync()
+            log.close()
+        counters["undone"] = len(undone_lsns)
     for lsn in undone_lsns:
         print(f"\t\t{str(lsn)}")
 
+    if buffer_pool is not None:
+        # Write back whatever is still dirty in the pool.
+        buffer_pool.flush()
+        stats = buffer_pool.stats()
+        metrics.extra["buffer_pool"] = stats
+        print(
+            f"Buffer Pool ({stats['frames']} frames, {args.buffer_policy}): "
+            f"{stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['evictions']} evictions, {stats['writebacks']} write-backs"
+        )
+
     # Write recovery to disk.
-    with open(DISK_PAGES_OUT_PATH, "w") as f:
-        json.dump(disk_pages, f, indent=2)
+    with metrics.phase("write") as counters:
+        if originals is not None:
+            out_path = args.out or DISK_PAGES_DELTA_PATH
+            changed = write_delta(out_path, originals.changed(disk_pages))
+            counters["pages_written"] = changed
+        if isinstance(disk_pages, PageStore):
+            # Redo and undo already wrote into the page store, just flush what they changed.
+            flushed = disk_pages.flush()
+            disk_pages.close()
+        elif originals is None:
+            if isinstance(disk_pages, PageTable):
+                disk_pages = disk_pages.to_dict()
+            write_pages(
+                args.out or DISK_PAGES_OUT_PATH,
+                disk_pages,
+                compact=args.output_format == "compact",
+            )
+    if originals is not None:
+        print(f"Wrote {changed} changed pages to {out_path}")
+    if isinstance(disk_pages, PageStore):
+        print(f"Flushed {flushed} modified pages to {args.pages}")
+
+    wal.close()
+    metrics.close()
+    if args.metrics is not None:
+        metrics.dump(args.metrics)
+    if args.profile is not None:
+        print(f"Wrote cProfile and tracemalloc dumps for each phase to {args.profile}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,520 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import aries
+import checkpoint
+import parallel
+from logmanager import DEFAULT_MAX_LATENCY, LogManager
+from pagestore import PageStore
+from segments import (
+    CODECS,
+    DEFAULT_SEGMENT_SIZE,
+    SegmentedWal,
+    convert_jsonl_to_segments,
+    is_segmented_wal,
+    segment_paths,
+)
+from workload import (
+    Workload,
+    add_workload_arguments,
+    workload_from_args,
+    write_workload,
+)
+
+# Recovery benchmark on generated workloads (see workload.py).
+#
+# For each target log size this writes a workload to disk, then runs recovery
+# the way main does (load, index, analysis from the last checkpoint, redo from
+# the smallest recLSN, undo, write back) and times each phase. Results are
+# saved as JSON; pass an earlier results file as --baseline to flag phases that
+# got slower.
+#
+# With --codecs each WAL is also converted into compressed segments (see
+# segments.py) with each codec and recovered from those, reporting the bytes
+# on disk, the bytes recovery actually read and the phase timings per codec.
+#
+# With --commit-batch-sizes it measures the forward path instead: committer
+# threads run short transactions through a LogManager (see logmanager.py) for
+# each group commit batch size, and commits/sec is reported per batch size.
+#
+# Peak RSS is per phase on Linux (the high-water mark is reset before each
+# phase through /proc/self/clear_refs). Elsewhere it is the peak of the whole
+# process so far.
+
+PHASES = ("load", "index", "analysis", "redo", "undo", "flush")
+
+# Records written per transaction, roughly: BEGIN, the updates, COMMIT and END.
+_RECORDS_PER_TX_OVERHEAD = 3
+
+
+def _reset_peak_rss() -> None:
+    with contextlib.suppress(OSError):
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+
+
+def _peak_rss_bytes() -> int:
+    with contextlib.suppress(OSError):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    # ru_maxrss is in KiB on Linux but bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _records_read(wal) -> int:
+    # Records the WAL decoded or skimmed so far.
+    return wal.decoded + wal.skimmed
+
+
+class _PhaseTimer:
+    def __init__(self):
+        self.phases: dict[str, dict] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str, wal=None):
+        # With a wal, records/sec is over the records the phase itself read
+        # from it (decoded or skimmed), not over the whole log. For a
+        # segmented WAL, what the phase read from its segments is added.
+        records_before = _records_read(wal) if wal is not None else None
+        segment_reads = wal.read_snapshot() if isinstance(wal, SegmentedWal) else None
+        _reset_peak_rss()
+        start = time.perf_counter()
+        yield
+        wall = time.perf_counter() - start
+        records = None
+        if wal is not None:
+            records = _records_read(wal) - records_before
+        self.phases[name] = {
+            "wall_seconds": wall,
+            "records": records,
+            "records_per_second": (
+                records / wall if records is not None and wall > 0 else None
+            ),
+            "peak_rss_bytes": _peak_rss_bytes(),
+        }
+        if segment_reads is not None:
+            self.phases[name].update(wal.reads_since(segment_reads))
+
+
+def run_benchmark(
+    workload: Workload,
+    work_dir: str,
+    binary: bool = False,
+    page_store: bool = False,
+    redo_workers: int = 1,
+    codec: str | None = None,
+    segment_size: int = DEFAULT_SEGMENT_SIZE,
+) -> dict:
+    # Generate workload into work_dir, recover it and return the timings. With
+    # a codec the WAL is converted into compressed segments and recovered
+    # from those.
+    wal_path = os.path.join(work_dir, "wal.bin" if binary else "wal.jsonl")
+    pages_path = os.path.join(work_dir, "pages.bin" if page_store else "pages.json")
+
+    start = time.perf_counter()
+    record_count = write_workload(
+        workload, wal_path, pages_path, binary=binary, page_store=page_store
+    )
+    generate_seconds = time.perf_counter() - start
+
+    segments = {}
+    if codec is not None:
+        jsonl_path, wal_path = wal_path, os.path.join(work_dir, f"wal.{codec}")
+        shutil.rmtree(wal_path, ignore_errors=True)
+        start = time.perf_counter()
+        convert_jsonl_to_segments(jsonl_path, wal_path, codec, segment_size)
+        segments = {
+            "codec": codec,
+            "segment_size": segment_size,
+            "convert_seconds": time.perf_counter() - start,
+            "uncompressed_bytes": os.path.getsize(jsonl_path),
+        }
+
+    timer = _PhaseTimer()
+
+    with timer.phase("load"):
+        wal = aries._load_wal(wal_path)
+        disk_pages = aries._load_pages(pages_path)
+
+    with timer.phase("index", wal):
+        wal_index = aries._open_index(wal)
+
+    with timer.phase("analysis", wal):
+        transaction_table, dirty_page_table, _ = aries.analysis(
+            wal.records_from(wal_index.last_checkpoint_offset())
+        )
+
+    with timer.phase("redo", wal):
+        # From the smallest recLSN on, which redo_parallel finds in wal_index.
+        redone = parallel.redo_parallel(
+            wal, dirty_page_table, disk_pages, redo_workers, wal_index=wal_index
+        )
+
+    with timer.phase("undo", wal):
+        # As in aries.main: a page store is written in place, so undo's CLRs
+        # and ENDs are appended to the WAL file and synced before its flush.
+        log = None
+        if isinstance(disk_pages, PageStore):
+            log = checkpoint.WalAppender(wal_path)
+        undone = aries.undo(wal, transaction_table, disk_pages, wal_index, log)
+        if log is not None:
+            log.sync()
+            log.close()
+
+    correct = {
+        page: info["value"] for page, info in disk_pages.items()
+    } == workload.expected_values
+
+    with timer.phase("flush"):
+        if isinstance(disk_pages, PageStore):
+            disk_pages.flush()
+            disk_pages.close()
+        else:
+            with open(os.path.join(work_dir, "pages_after.json"), "w") as f:
+                json.dump(disk_pages, f)
+    wal.close()
+
+    total_seconds = sum(timing["wall_seconds"] for timing in timer.phases.values())
+
+    if isinstance(wal, SegmentedWal):
+        segments["segments"] = len(wal.segments)
+        segments.update(wal.reads_since())
+
+    return {
+        "workload": workload.spec(),
+        "records": record_count,
+        "wal_bytes": _wal_bytes(wal_path),
+        **segments,
+        "generate_seconds": generate_seconds,
+        # End to end, over every record in the log.
+        "records_per_second": record_count / total_seconds if total_seconds else None,
+        "redone": len(redone),
+        "undone": len(undone),
+        "correct": correct,
+        "phases": timer.phases,
+    }
+
+
+def _wal_bytes(path: str) -> int:
+    if is_segmented_wal(path):
+        return sum(os.path.getsize(segment) for segment in segment_paths(path))
+    return os.path.getsize(path)
+
+
+def run_commit_benchmark(
+    work_dir: str,
+    batch_size: int,
+    threads: int = 16,
+    transactions: int = 2000,
+    updates_per_tx: int = 4,
+    max_latency: float = DEFAULT_MAX_LATENCY,
+    binary: bool = False,
+    sync: bool = True,
+) -> dict:
+    # Commit transactions (split over threads, each on its own pages) through
+    # a LogManager with the given batch size and return the throughput.
+    wal_path = os.path.join(work_dir, "commits.bin" if binary else "commits.jsonl")
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(wal_path)
+
+    per_thread = [transactions // threads] * threads
+    for i in range(transactions % threads):
+        per_thread[i] += 1
+
+    with LogManager(wal_path, batch_size, max_latency, binary, sync) as log:
+
+        def committer(thread: int, count: int) -> None:
+            for i in range(count):
+                tx = f"T{thread}-{i}"
+                log.begin(tx)
+                for update in range(updates_per_tx):
+                    log.update(tx, f"P{thread}-{update}", i, i + 1)
+                log.commit(tx)
+
+        workers = [
+            threading.Thread(target=committer, args=(thread, count))
+            for thread, count in enumerate(per_thread)
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        seconds = time.perf_counter() - start
+        commits, batches, records = log.commits, log.batches, log.records
+
+    return {
+        "batch_size": batch_size,
+        "threads": threads,
+        "max_latency": max_latency,
+        "sync": sync,
+        "commits": commits,
+        "records": records,
+        "batches": batches,
+        "seconds": seconds,
+        "commits_per_second": commits / seconds if seconds > 0 else None,
+        "commits_per_batch": commits / batches if batches else None,
+        "wal_bytes": os.path.getsize(wal_path),
+    }
+
+
+def compare(baseline: dict, results: dict, threshold: float) -> list[str]:
+    # Phases in results more than threshold times slower than in baseline
+    # (matched by target record count and codec), as readable lines.
+    previous = {
+        (run["target_records"], run.get("codec")): run for run in baseline["runs"]
+    }
+    regressions = []
+    for run in results["runs"]:
+        old_run = previous.get((run["target_records"], run.get("codec")))
+        if old_run is None:
+            continue
+        for phase, timing in run["phases"].items():
+            old_timing = old_run["phases"].get(phase)
+            if old_timing is None or old_timing["wall_seconds"] <= 0:
+                continue
+            ratio = timing["wall_seconds"] / old_timing["wall_seconds"]
+            if ratio > threshold:
+                codec = f" ({run['codec']})" if run.get("codec") else ""
+                regressions.append(
+                    f"{run['target_records']} records{codec}, {phase}: "
+                    f"{old_timing['wall_seconds']:.3f}s -> {timing['wall_seconds']:.3f}s "
+                    f"({ratio:.2f}x)"
+                )
+    return regressions
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark recovery on synthetic WALs."
+    )
+    parser.add_argument(
+        "--records",
+        type=int,
+        nargs="+",
+        default=[10**4, 10**5, 10**6],
+        help="approximate WAL sizes to run (default: 10^4 10^5 10^6)",
+    )
+    add_workload_arguments(parser)
+    parser.add_argument("--binary", action="store_true", help="use a binary WAL")
+    parser.add_argument(
+        "--page-store", action="store_true", help="use a page store for the pages"
+    )
+    parser.add_argument("--redo-workers", type=int, default=1, metavar="N")
+    parser.add_argument(
+        "--codecs",
+        nargs="+",
+        choices=CODECS,
+        help="recover from compressed WAL segments, once per codec (see segments.py)",
+    )
+    parser.add_argument(
+        "--segment-size",
+        type=int,
+        default=DEFAULT_SEGMENT_SIZE >> 20,
+        metavar="MIB",
+        help=f"uncompressed MiB of records per segment with --codecs "
+        f"(default: {DEFAULT_SEGMENT_SIZE >> 20})",
+    )
+    parser.add_argument(
+        "--work-dir",
+        help="where to write the workloads (default: a temporary directory)",
+    )
+    parser.add_argument(
+        "--out", default="benchmark_results.json", help="where to save the results"
+    )
+    parser.add_argument(
+        "--commit-batch-sizes",
+        type=int,
+        nargs="+",
+        metavar="N",
+        help="benchmark group commit throughput at these batch sizes instead of recovery",
+    )
+    parser.add_argument(
+        "--commit-threads",
+        type=int,
+        default=16,
+        metavar="N",
+        help="committer threads for --commit-batch-sizes (default: 16)",
+    )
+    parser.add_argument(
+        "--commit-latency",
+        type=float,
+        default=DEFAULT_MAX_LATENCY * 1000,
+        metavar="MS",
+        help="group commit latency window for --commit-batch-sizes "
+        f"(default: {DEFAULT_MAX_LATENCY * 1000:g})",
+    )
+    parser.add_argument(
+        "--no-sync",
+        action="store_true",
+        help="don't fsync in --commit-batch-sizes runs",
+    )
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="with --baseline, report phases slower than this ratio (default: 1.2)",
+    )
+    args = parser.parse_args(argv)
+    if args.codecs and args.binary:
+        parser.error(
+            "WAL segments hold JSONL records, --codecs can't be combined with --binary"
+        )
+    if args.codecs and args.page_store:
+        parser.error(
+            "undo appends its CLRs to the WAL before flushing a page store, "
+            "--codecs can't be combined with --page-store"
+        )
+    return args
+
+
+def _commit_benchmarks(args: argparse.Namespace, work_dir: str) -> int:
+    # --commit-batch-sizes: one LogManager run per batch size, using the
+    # workload's transaction count and updates per transaction.
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "binary": args.binary,
+        "commit_runs": [],
+    }
+    try:
+        for batch_size in args.commit_batch_sizes:
+            run = run_commit_benchmark(
+                work_dir,
+                batch_size,
+                threads=args.commit_threads,
+                transactions=args.transactions,
+                updates_per_tx=args.updates_per_tx,
+                max_latency=args.commit_latency / 1000,
+                binary=args.binary,
+                sync=not args.no_sync,
+            )
+            results["commit_runs"].append(run)
+            print(
+                f"batch size {batch_size:>4}: {run['commits_per_second']:10.0f} commits/s, "
+                f"{run['commits_per_batch']:6.1f} commits per fsync "
+                f"({run['commits']} commits on {run['threads']} threads in {run['seconds']:.3f}s)"
+            )
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir)
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {args.out}")
+    return 0
+
+
+def _segment_reads(reads: dict, run: dict) -> str:
+    # What a phase (or the whole run) read from the segments of a codec run.
+    if "segment_opens" not in reads:
+        return ""
+    return (
+        f" {reads['compressed_bytes_read']:12} bytes from {reads['segments_read']} "
+        f"of {run['segments']} segments ({reads['segment_opens']} opens)"
+    )
+
+
+def _print_run(run: dict) -> None:
+    if "codec" in run:
+        print(
+            f"{run['records']} records, {run['codec']} segments "
+            f"({run['uncompressed_bytes']} bytes -> {run['wal_bytes']} bytes, "
+            f"converted in {run['convert_seconds']:.3f}s):"
+        )
+    else:
+        print(f"{run['records']} records ({run['wal_bytes']} bytes):")
+    for phase, timing in run["phases"].items():
+        print(
+            f"\t{phase:<9} {timing['wall_seconds']:9.3f}s "
+            f"{timing['records_per_second'] or 0:14.0f} records/s "
+            f"{timing['peak_rss_bytes'] / 2**20:9.1f} MiB peak RSS"
+            + _segment_reads(timing, run)
+        )
+    total_seconds = sum(timing["wall_seconds"] for timing in run["phases"].values())
+    print(
+        f"\t{'total':<9} {total_seconds:9.3f}s "
+        f"{run['records_per_second'] or 0:14.0f} records/s"
+        + (" " * 23 if "codec" in run else "")
+        + _segment_reads(run, run)
+    )
+    if not run["correct"]:
+        print("\tRecovered pages don't match what the committed transactions wrote!")
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parse_args(argv)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="aries-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+    if args.commit_batch_sizes:
+        return _commit_benchmarks(args, work_dir)
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "binary": args.binary,
+        "page_store": args.page_store,
+        "redo_workers": args.redo_workers,
+        "segment_size": args.segment_size << 20 if args.codecs else None,
+        "runs": [],
+    }
+
+    try:
+        for target in args.records:
+            transactions = max(
+                1, target // (args.updates_per_tx + _RECORDS_PER_TX_OVERHEAD)
+            )
+            workload = workload_from_args(args, transactions=transactions)
+            for codec in args.codecs or [None]:
+                run = run_benchmark(
+                    workload,
+                    work_dir,
+                    binary=args.binary,
+                    page_store=args.page_store,
+                    redo_workers=args.redo_workers,
+                    codec=codec,
+                    segment_size=args.segment_size << 20,
+                )
+                run["target_records"] = target
+                results["runs"].append(run)
+                _print_run(run)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir)
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        for line in regressions:
+            print(f"Slower than {args.baseline}: {line}")
+        if regressions:
+            return 1
+
+    return 0 if all(run["correct"] for run in results["runs"]) else 1
+
+
+if __name__ == "__main__":
+    # python3 benchmark.py --records 10000 100000 --skew zipf --checkpoint-interval 5000
+    # python3 benchmark.py --records 100000 --checkpoint-interval 20000 --codecs none gzip bz2 lzma
+    # python3 benchmark.py --commit-batch-sizes 1 8 32 128 --commit-threads 32
+    sys.exit(main())
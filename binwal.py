@@ -0,0 +1,353 @@
+import json
+import mmap
+import struct
+import sys
+from typing import Iterator
+
+from walfile import iter_wal_lines
+
+# Compact binary WAL encoding.
+#
+# json.loads on every line is most of the cost of reading a JSONL WAL. Here each
+# record is a fixed-size header followed by a (usually tiny) payload:
+#
+#   LSN (int64) | type (uint8) | flags (uint8) | pad | tx id (uint32) | page id (uint32) | payload length (uint32)
+#   payload bytes
+#   payload length again (uint32), so the log can be walked backward.
+#
+# Transaction and page ids are interned: the first time a string is used an
+# INTERN record assigning it an id is written right before the record that uses
+# it. Id 0 means "no tx" / "no page". The file is read through mmap and each
+# record is decoded in place with struct.unpack_from, only when it is asked for.
+
+MAGIC = b"ARIESWB1"
+
+HEADER = struct.Struct("<qBBxxIII")
+TRAILER = struct.Struct("<I")
+PACKED_IMAGES = struct.Struct("<qq")  # before, after
+PACKED_PREV = struct.Struct("<q")  # prevLSN
+PACKED_PREV_IMAGES = struct.Struct("<qqq")  # prevLSN, before, after
+PACKED_CLR = struct.Struct("<qqq")  # prevLSN, undoNextLSN, after
+
+TYPE_INTERN = 0
+TYPE_OTHER = 255  # Any record we don't have a compact layout for, stored as JSON.
+TYPE_CODES = {
+    "BEGIN": 1,
+    "UPDATE": 2,
+    "COMMIT": 3,
+    "ABORT": 4,
+    "END": 5,
+    "CHECKPOINT": 6,
+    "CLR": 7,
+}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+
+# Payload layouts.
+FLAG_EMPTY = 0
+FLAG_PACKED = 1  # before/after as two int64s.
+FLAG_JSON = 2  # Remaining fields as a JSON object.
+FLAG_PREV = 3  # prevLSN as an int64.
+FLAG_PREV_PACKED = 4  # prevLSN, before and after as three int64s.
+FLAG_CLR_PACKED = 5  # prevLSN, undoNextLSN and after as three int64s.
+
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+
+def is_binary_wal(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _is_int64(value) -> bool:
+    return type(value) is int and _INT64_MIN <= value <= _INT64_MAX
+
+
+class BinaryWalWriter:
+    """Appends records to a binary WAL, interning tx and page ids as it goes."""
+
+    def __init__(self, f, ids: dict[str, int] | None = None):
+        # f is a file opened for binary writing. Without ids it is a new file;
+        # to append to an existing WAL pass in its interned ids (BinaryWal.interned_ids).
+        self.f = f
+        if ids is None:
+            f.write(MAGIC)
+            ids = {}
+        self.ids = dict(ids)
+
+    def _write(
+        self,
+        lsn: int,
+        type_code: int,
+        flags: int,
+        tx_id: int,
+        page_id: int,
+        payload: bytes,
+    ) -> None:
+        self.f.write(HEADER.pack(lsn, type_code, flags, tx_id, page_id, len(payload)))
+        self.f.write(payload)
+        self.f.write(TRAILER.pack(len(payload)))
+
+    def _intern(self, lsn: int, name: str) -> int:
+        string_id = self.ids.get(name)
+        if string_id is None:
+            string_id = len(self.ids) + 1
+            self.ids[name] = string_id
+            self._write(lsn, TYPE_INTERN, FLAG_EMPTY, string_id, 0, name.encode())
+        return string_id
+
+    def append(self, record: dict) -> None:
+        lsn = record["LSN"]
+        if not _is_int64(lsn):
+            raise ValueError(f"LSN must be a 64 bit integer, got {lsn!r}")
+
+        type_code = TYPE_CODES.get(record.get("type"))
+        tx = record.get("tx")
+        page = record.get("page")
+
+        if (
+            type_code is None
+            or not isinstance(tx, (str, type(None)))
+            or not isinstance(page, (str, type(None)))
+        ):
+            # Don't know how to lay this one out, keep the whole record.
+            self._write(lsn, TYPE_OTHER, FLAG_JSON, 0, 0, json.dumps(record).encode())
+            return
+
+        tx_id = self._intern(lsn, tx) if tx is not None else 0
+        page_id = self._intern(lsn, page) if page is not None else 0
+
+        rest = {
+            key: value
+            for key, value in record.items()
+            if key not in ("LSN", "type", "tx", "page")
+        }
+        keys = rest.keys()
+        if not rest:
+            flags, payload = FLAG_EMPTY, b""
+        elif not all(_is_int64(value) for value in rest.values()):
+            flags, payload = FLAG_JSON, json.dumps(rest).encode()
+        elif keys == {"before", "after"}:
+            flags = FLAG_PACKED
+            payload = PACKED_IMAGES.pack(rest["before"], rest["after"])
+        elif keys == {"prevLSN"}:
+            flags, payload = FLAG_PREV, PACKED_PREV.pack(rest["prevLSN"])
+        elif keys == {"prevLSN", "before", "after"}:
+            flags = FLAG_PREV_PACKED
+            payload = PACKED_PREV_IMAGES.pack(
+                rest["prevLSN"], rest["before"], rest["after"]
+            )
+        elif keys == {"prevLSN", "after", "undoNextLSN"}:
+            flags = FLAG_CLR_PACKED
+            payload = PACKED_CLR.pack(
+                rest["prevLSN"], rest["undoNextLSN"], rest["after"]
+            )
+        else:
+            flags, payload = FLAG_JSON, json.dumps(rest).encode()
+
+        self._write(lsn, type_code, flags, tx_id, page_id, payload)
+
+
+class BinaryWal:
+    """A binary WAL read through mmap.
+
+    Has the same interface as walfile.WalFile (forward iteration, reversed()
+    and an in-memory append() for CLRs), so recovery can use either one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tail: list[dict] = []
+        # Records decoded so far (not counting INTERN records), and records
+        # scan_lazy went past without decoding them (yet), for instrumentation.
+        self.decoded = 0
+        self.skimmed = 0
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        # Bytes mapped, so records appended after opening aren't seen.
+        self.size = len(self._mm)
+        if self._mm[: len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a binary WAL")
+
+        # Interned strings we have seen so far, and how far we have looked for them.
+        self._strings: dict[int, str] = {}
+        self._interned_up_to = len(MAGIC)
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> "BinaryWal":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _string(self, string_id: int) -> str:
+        if string_id not in self._strings:
+            # Ids are always defined before they are used, so scanning headers
+            # forward from where we last stopped will find it.
+            for offset in self._offsets(self._interned_up_to):
+                self._interned_up_to = offset
+                if self._learn_intern(offset) == string_id:
+                    break
+        return self._strings[string_id]
+
+    def interned_ids(self) -> dict[str, int]:
+        # Every string interned in the file, for writing more records to it.
+        for offset in self._offsets(self._interned_up_to):
+            self._interned_up_to = offset
+            self._learn_intern(offset)
+        return {name: string_id for string_id, name in self._strings.items()}
+
+    def _learn_intern(self, offset: int) -> int | None:
+        _, type_code, _, string_id, _, length = HEADER.unpack_from(self._mm, offset)
+        if type_code != TYPE_INTERN:
+            return None
+        start = offset + HEADER.size
+        self._strings[string_id] = self._mm[start : start + length].decode()
+        return string_id
+
+    def _offsets(
+        self, start: int = len(MAGIC), end: int | None = None
+    ) -> Iterator[int]:
+        # Offsets of every record header (including INTERN records) from start
+        # to end (default: EOF).
+        mm = self._mm
+        if end is None or end > len(mm):
+            end = len(mm)
+        offset = start
+        while offset < end:
+            yield offset
+            length = HEADER.unpack_from(mm, offset)[5]
+            offset += HEADER.size + length + TRAILER.size
+
+    def _offsets_reversed(self) -> Iterator[int]:
+        mm = self._mm
+        end = len(mm)
+        while end > len(MAGIC):
+            (length,) = TRAILER.unpack_from(mm, end - TRAILER.size)
+            end -= HEADER.size + length + TRAILER.size
+            yield end
+
+    def decode(self, offset: int) -> dict | None:
+        # Decode the record at offset, or None for the INTERN bookkeeping records.
+        mm = self._mm
+        lsn, type_code, flags, tx_id, page_id, length = HEADER.unpack_from(mm, offset)
+        start = offset + HEADER.size
+
+        if type_code == TYPE_INTERN:
+            self._strings[tx_id] = mm[start : start + length].decode()
+            return None
+        self.decoded += 1
+        if type_code == TYPE_OTHER:
+            return json.loads(mm[start : start + length])
+
+        record = {"LSN": lsn, "type": TYPE_NAMES[type_code]}
+        if tx_id:
+            record["tx"] = self._string(tx_id)
+        if page_id:
+            record["page"] = self._string(page_id)
+
+        if flags == FLAG_PACKED:
+            record["before"], record["after"] = PACKED_IMAGES.unpack_from(mm, start)
+        elif flags == FLAG_PREV:
+            (record["prevLSN"],) = PACKED_PREV.unpack_from(mm, start)
+        elif flags == FLAG_PREV_PACKED:
+            record["prevLSN"], record["before"], record["after"] = (
+                PACKED_PREV_IMAGES.unpack_from(mm, start)
+            )
+        elif flags == FLAG_CLR_PACKED:
+            record["prevLSN"], record["undoNextLSN"], record["after"] = (
+                PACKED_CLR.unpack_from(mm, start)
+            )
+        elif flags == FLAG_JSON:
+            record.update(json.loads(mm[start : start + length]))
+
+        return record
+
+    def scan(self, start_offset: int | None = None) -> Iterator[tuple[int, int, dict]]:
+        # (offset, end offset, record) for every record from start_offset on.
+        mm = self._mm
+        for offset in self._offsets(start_offset or len(MAGIC)):
+            record = self.decode(offset)
+            if record is not None:
+                length = HEADER.unpack_from(mm, offset)[5]
+                yield offset, offset + HEADER.size + length + TRAILER.size, record
+
+    def scan_lazy(
+        self, start_offset: int | None = None, end_offset: int | None = None
+    ) -> Iterator[tuple[int, int, int, str, int | dict]]:
+        # (offset, end offset, LSN, type, raw) for every record from start_offset
+        # on (up to end_offset), straight from the headers. decode_raw(raw)
+        # gives the whole record.
+        mm = self._mm
+        for offset in self._offsets(start_offset or len(MAGIC), end_offset):
+            lsn, type_code, _, _, _, length = HEADER.unpack_from(mm, offset)
+            end_offset = offset + HEADER.size + length + TRAILER.size
+            if type_code == TYPE_INTERN:
+                self._learn_intern(offset)
+            elif type_code == TYPE_OTHER:
+                # The type is in the JSON.
+                record = self.decode(offset)
+                yield offset, end_offset, lsn, record.get("type"), record
+            else:
+                self.skimmed += 1
+                yield offset, end_offset, lsn, TYPE_NAMES[type_code], offset
+
+    def decode_raw(self, raw: int | dict) -> dict:
+        if isinstance(raw, dict):
+            # Already decoded by scan_lazy.
+            return raw
+        return self.decode(raw)
+
+    def records_from(self, start_offset: int | None) -> Iterator[dict]:
+        # Iterate the WAL starting at a byte offset (see walindex.py), None for the start.
+        for offset in self._offsets(start_offset or len(MAGIC)):
+            record = self.decode(offset)
+            if record is not None:
+                yield record
+        yield from self.tail
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.records_from(None)
+
+    def __reversed__(self) -> Iterator[dict]:
+        yield from reversed(self.tail)
+        for offset in self._offsets_reversed():
+            record = self.decode(offset)
+            if record is not None:
+                yield record
+
+    def append(self, record: dict) -> None:
+        self.tail.append(record)
+
+
+def append_records(path: str, records: list[dict]) -> None:
+    # Append records to an existing binary WAL file.
+    with BinaryWal(path) as wal:
+        ids = wal.interned_ids()
+    with open(path, "ab") as f:
+        writer = BinaryWalWriter(f, ids)
+        for record in records:
+            writer.append(record)
+
+
+def convert_jsonl_to_binary(src_path: str, dst_path: str) -> int:
+    # Stream a JSONL WAL into the binary format, returning the number of records written.
+    count = 0
+    with open(dst_path, "wb") as f:
+        writer = BinaryWalWriter(f)
+        for _, line in iter_wal_lines(src_path):
+            writer.append(json.loads(line))
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    # python3 binwal.py files/wal.jsonl files/wal.bin
+    if len(sys.argv) != 3:
+        print(f"usage: {sys.argv[0]} WAL_JSONL OUT_BINARY", file=sys.stderr)
+        sys.exit(2)
+    written = convert_jsonl_to_binary(sys.argv[1], sys.argv[2])
+    print(f"Wrote {written} records to {sys.argv[2]}")
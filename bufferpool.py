@@ -0,0 +1,176 @@
+from collections import OrderedDict
+from collections.abc import Iterator, Mapping, MutableMapping
+
+# A bounded buffer pool in front of the disk pages.
+#
+# redo and undo index straight into disk_pages, which means the whole database
+# has to be in memory. A BufferPool holds at most `frames` pages, reading them
+# from the backing store (a PageStore or the disk_pages dict) on a miss and
+# evicting an unpinned page when it runs out of frames (LRU or CLOCK). Evicted
+# pages that were modified are written back first.
+#
+# It behaves like the disk_pages dict, so redo and undo go through it unchanged.
+# Each disk_pages[page] lookup brings the page in for as long as the caller uses
+# it; callers that need to hold on to a page across other lookups pin() it.
+
+POLICIES = ("lru", "clock")
+
+
+class Frame(MutableMapping):
+    """A page held in the buffer pool. Writing to it marks it dirty."""
+
+    __slots__ = ("page", "data", "dirty", "pin_count", "referenced")
+
+    def __init__(self, page: str, data: dict):
+        self.page = page
+        self.data = data
+        self.dirty = False
+        self.pin_count = 0
+        self.referenced = True  # CLOCK's second-chance bit.
+
+    def __getitem__(self, key: str):
+        return self.data[key]
+
+    def __setitem__(self, key: str, value) -> None:
+        self.data[key] = value
+        self.dirty = True
+
+    def __delitem__(self, key: str) -> None:
+        del self.data[key]
+        self.dirty = True
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __repr__(self) -> str:
+        return repr(self.data)
+
+
+class BufferPool(Mapping):
+    """At most `frames` pages of `store` in memory, with LRU or CLOCK eviction."""
+
+    def __init__(self, store: Mapping, frames: int, policy: str = "lru"):
+        if frames < 1:
+            raise ValueError("a buffer pool needs at least one frame")
+        if policy not in POLICIES:
+            raise ValueError(
+                f"unknown eviction policy {policy!r}, use one of {POLICIES}"
+            )
+
+        self.store = store
+        self.frames = frames
+        self.policy = policy
+
+        # page -> Frame. For LRU the order is least to most recently used.
+        self._frames: OrderedDict[str, Frame] = OrderedDict()
+        # CLOCK: pages in frame order and the position of the hand.
+        self._clock: list[str] = []
+        self._hand = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writebacks = 0
+
+    def _fetch(self, page: str) -> Frame:
+        frame = self._frames.get(page)
+        if frame is not None:
+            self.hits += 1
+            if self.policy == "lru":
+                self._frames.move_to_end(page)
+            else:
+                frame.referenced = True
+            return frame
+
+        self.misses += 1
+        # Raises KeyError for pages that don't exist, like disk_pages would.
+        data = dict(self.store[page])
+        if len(self._frames) >= self.frames:
+            self._evict()
+
+        frame = Frame(page, data)
+        self._frames[page] = frame
+        if self.policy == "clock":
+            self._clock.append(page)
+        return frame
+
+    def _victim(self) -> str:
+        if self.policy == "lru":
+            for page, frame in self._frames.items():
+                if frame.pin_count == 0:
+                    return page
+            raise RuntimeError("every frame in the buffer pool is pinned")
+
+        # CLOCK: sweep, clearing reference bits, until an unreferenced unpinned page.
+        # Two full turns without finding one means everything is pinned.
+        for _ in range(2 * len(self._clock)):
+            page = self._clock[self._hand]
+            frame = self._frames[page]
+            if frame.pin_count == 0 and not frame.referenced:
+                return page
+            frame.referenced = False
+            self._hand = (self._hand + 1) % len(self._clock)
+        raise RuntimeError("every frame in the buffer pool is pinned")
+
+    def _evict(self) -> None:
+        page = self._victim()
+        frame = self._frames.pop(page)
+        if self.policy == "clock":
+            # The hand now points at the page after the victim.
+            del self._clock[self._hand]
+            if self._hand == len(self._clock):
+                self._hand = 0
+        self._write_back(frame)
+        self.evictions += 1
+
+    def _write_back(self, frame: Frame) -> None:
+        if frame.dirty:
+            self.store[frame.page].update(frame.data)
+            frame.dirty = False
+            self.writebacks += 1
+
+    def pin(self, page: str) -> Frame:
+        # Bring page in and keep it from being evicted until unpin().
+        frame = self._fetch(page)
+        frame.pin_count += 1
+        return frame
+
+    def unpin(self, page: str, dirty: bool = False) -> None:
+        frame = self._frames[page]
+        if frame.pin_count == 0:
+            raise ValueError(f"page {page} is not pinned")
+        frame.pin_count -= 1
+        if dirty:
+            frame.dirty = True
+
+    def __getitem__(self, page: str) -> Frame:
+        return self._fetch(page)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.store)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __contains__(self, page: object) -> bool:
+        return page in self.store
+
+    def flush(self) -> int:
+        # Write every dirty frame back to the store. Returns how many there were.
+        # Getting the store itself to disk (PageStore.flush) is up to the caller.
+        writebacks = self.writebacks
+        for frame in self._frames.values():
+            self._write_back(frame)
+        return self.writebacks - writebacks
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "frames": self.frames,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "writebacks": self.writebacks,
+        }
@@ -0,0 +1,209 @@
+import io
+import json
+import os
+import shutil
+
+import binwal
+import walfile
+from binwal import BinaryWal, BinaryWalWriter, is_binary_wal
+from walfile import WalFile
+
+# Checkpoints and log truncation.
+#
+# Restart only has to look at the log from the last checkpoint (analysis) and
+# from the smallest recLSN (redo) or the oldest loser update (undo) onward. A
+# checkpoint snapshots the transaction table and dirty page table into the log
+# so analysis can start there, and once it is written everything below
+#
+#     min(smallest recLSN in the DPT, first LSN of every transaction in the TT)
+#
+# is never read by recovery again and can be dropped or moved to an archive.
+# Running this periodically keeps restart time proportional to the activity
+# since the last checkpoint rather than to the age of the database.
+
+
+def _open_wal(path: str) -> WalFile | BinaryWal:
+    if is_binary_wal(path):
+        return BinaryWal(path)
+    return WalFile(path)
+
+
+def append_to_wal(path: str, records: list[dict]) -> None:
+    # Append records to a WAL file in whichever encoding it already uses.
+    if is_binary_wal(path):
+        binwal.append_records(path, records)
+    else:
+        walfile.append_records(path, records)
+
+
+class WalAppender:
+    """Appends records to a WAL file as they come, for recovery's own CLRs and ENDs.
+
+    Each record is written to the file (in its encoding) before append()
+    returns, so it is there before the page it describes changes; sync()
+    makes them durable. Recovery that writes pages in place (a PageStore)
+    must sync() before flushing them, like any other writer of pages.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pending = io.BytesIO()
+        self._writer = None
+        if is_binary_wal(path):
+            with BinaryWal(path) as wal:
+                self._writer = BinaryWalWriter(self._pending, wal.interned_ids())
+        self._file = open(path, "ab", buffering=0)
+        if self._writer is None and self._file.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # Don't glue the first record onto an unterminated last line.
+                    self._file.write(b"\n")
+
+    def __enter__(self) -> "WalAppender":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def append(self, record: dict) -> None:
+        # One write per record, so a crash can't leave half of one behind.
+        if self._writer is not None:
+            self._writer.append(record)
+        else:
+            self._pending.write(json.dumps(record).encode() + b"\n")
+        self._file.write(self._pending.getvalue())
+        self._pending.seek(0)
+        self._pending.truncate()
+
+    def sync(self) -> None:
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def write_checkpoint(
+    wal_path: str,
+    transaction_table: dict[str, dict],
+    dirty_page_table: dict[str, int],
+) -> dict:
+    # Append a CHECKPOINT record with a snapshot of the tables (from analysis or
+    # a live log manager) and return it. Its LSN follows the last record in the log.
+    with _open_wal(wal_path) as wal:
+        last_entry = next(reversed(wal), None)
+
+    checkpoint = {
+        "LSN": 1 if last_entry is None else last_entry["LSN"] + 1,
+        "type": "CHECKPOINT",
+        "DPT": dict(dirty_page_table),
+        "TT": {tx: dict(info) for tx, info in transaction_table.items()},
+    }
+    append_to_wal(wal_path, [checkpoint])
+    return checkpoint
+
+
+def truncation_lsn(wal, checkpoint: dict) -> int:
+    # The smallest LSN recovery could still need after this checkpoint: the
+    # earliest recLSN, or the first record of a transaction that hasn't ended.
+    keep_from = min(checkpoint["DPT"].values(), default=checkpoint["LSN"])
+
+    # The TT only knows where each transaction ended up, so find where they started.
+    open_transactions = set(checkpoint["TT"])
+    for wal_entry in wal:
+        if wal_entry["LSN"] >= keep_from or not open_transactions:
+            break
+        if wal_entry.get("tx") in open_transactions:
+            keep_from = wal_entry["LSN"]
+            break
+
+    return min(keep_from, checkpoint["LSN"])
+
+
+def truncate_wal(
+    wal_path: str, keep_from_lsn: int, archive_dir: str | None = None
+) -> tuple[int, str | None]:
+    # Drop every record before the first one with LSN >= keep_from_lsn. With an
+    # archive_dir the dropped prefix is kept there as a WAL of its own instead.
+    # Returns how many records were dropped and the archive path (if any).
+    binary = is_binary_wal(wal_path)
+
+    with _open_wal(wal_path) as wal:
+        dropped = 0
+        first_lsn = last_lsn = None
+        cut_offset = None
+        for offset, _, wal_entry in wal.scan():
+            if wal_entry["LSN"] >= keep_from_lsn:
+                cut_offset = offset
+                break
+            if first_lsn is None:
+                first_lsn = wal_entry["LSN"]
+            last_lsn = wal_entry["LSN"]
+            dropped += 1
+
+        if dropped == 0:
+            return 0, None
+
+        archive_path = None
+        if archive_dir is not None:
+            os.makedirs(archive_dir, exist_ok=True)
+            archive_path = os.path.join(
+                archive_dir,
+                f"{os.path.basename(wal_path)}.{first_lsn}-{last_lsn}",
+            )
+            # The prefix is a valid WAL on its own: in the binary format it
+            # starts with the magic bytes and defines every id it uses.
+            with open(wal_path, "rb") as src, open(archive_path, "wb") as dst:
+                _copy_bytes(src, dst, cut_offset)
+
+        # Write what's left to the side and swap it in, so a crash part way
+        # through never loses the part of the log we are keeping.
+        tmp_path = wal_path + ".truncating"
+        if binary:
+            # Interned ids from the dropped prefix have to be defined again.
+            with open(tmp_path, "wb") as f:
+                writer = BinaryWalWriter(f)
+                if cut_offset is not None:
+                    for wal_entry in wal.records_from(cut_offset):
+                        writer.append(wal_entry)
+        else:
+            with open(wal_path, "rb") as src, open(tmp_path, "wb") as dst:
+                if cut_offset is not None:
+                    src.seek(cut_offset)
+                    shutil.copyfileobj(src, dst)
+
+    os.replace(tmp_path, wal_path)
+    return dropped, archive_path
+
+
+def _copy_bytes(src, dst, length: int | None) -> None:
+    # Copy length bytes (or everything, for None) from src to dst.
+    if length is None:
+        shutil.copyfileobj(src, dst)
+        return
+    while length > 0:
+        chunk = src.read(min(length, 1 << 20))
+        if not chunk:
+            break
+        dst.write(chunk)
+        length -= len(chunk)
+
+
+def checkpoint_and_truncate(
+    wal_path: str,
+    transaction_table: dict[str, dict],
+    dirty_page_table: dict[str, int],
+    truncate: bool = False,
+    archive_dir: str | None = None,
+) -> tuple[dict, int, str | None]:
+    # Write a checkpoint, then (if asked to) drop or archive the prefix recovery
+    # no longer needs. Returns the checkpoint, records dropped and archive path.
+    checkpoint = write_checkpoint(wal_path, transaction_table, dirty_page_table)
+    if not truncate and archive_dir is None:
+        return checkpoint, 0, None
+
+    with _open_wal(wal_path) as wal:
+        keep_from_lsn = truncation_lsn(wal, checkpoint)
+
+    dropped, archive_path = truncate_wal(wal_path, keep_from_lsn, archive_dir)
+    return checkpoint, dropped, archive_path
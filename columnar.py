@@ -0,0 +1,451 @@
+from array import array
+from bisect import bisect_left
+from typing import Iterator
+
+from binwal import TYPE_CODES, TYPE_NAMES, TYPE_OTHER
+
+# Struct-of-arrays WAL held in memory.
+#
+# A dict per record costs hundreds of bytes, and redo/undo pay for a string-keyed
+# lookup every time they read a field. ColumnarWal keeps one typed array per
+# field instead (array('q') for LSNs and images, small ints for the record type
+# and for interned tx/page ids), about 70 bytes a record.
+#
+# Records are only turned back into dicts when someone iterates the log, so
+# ColumnarWal can stand in for a WalFile or BinaryWal anywhere. analysis and
+# redo notice when they are given one (or a range of one, from records_from)
+# and run over the arrays directly. Records that don't fit the columns
+# (checkpoints, unknown types, images that aren't 64 bit integers, extra
+# fields) are kept whole on the side; their LSN, type, tx and page still go in
+# the columns so the fast paths see every record.
+
+# Which optional fields a record has.
+HAS_PREV = 1
+HAS_BEFORE = 2
+HAS_AFTER = 4
+HAS_UNDO_NEXT = 8
+UNDO_NEXT_NONE = 16  # undoNextLSN is present but None.
+
+_BEGIN = TYPE_CODES["BEGIN"]
+_UPDATE = TYPE_CODES["UPDATE"]
+_COMMIT = TYPE_CODES["COMMIT"]
+_ABORT = TYPE_CODES["ABORT"]
+_END = TYPE_CODES["END"]
+_CHECKPOINT = TYPE_CODES["CHECKPOINT"]
+_CLR = TYPE_CODES["CLR"]
+
+_COMPACT_FIELDS = {
+    "LSN",
+    "type",
+    "tx",
+    "prevLSN",
+    "page",
+    "before",
+    "after",
+    "undoNextLSN",
+}
+
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+
+def _is_int64(value) -> bool:
+    return type(value) is int and _INT64_MIN <= value <= _INT64_MAX
+
+
+class ColumnarWal:
+    """An in-memory WAL stored as typed arrays, one per field.
+
+    Has the same interface as walfile.WalFile and binwal.BinaryWal. Offsets
+    (for records_from and scan) are byte offsets into the file it was loaded
+    from, so a WalIndex for that file works with it too.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+
+        self.lsns = array("q")
+        self.types = array("B")
+        self.txs = array("I")  # 0 means no tx.
+        self.pages = array("I")  # 0 means no page.
+        self.flags = array("B")
+        self.prev_lsns = array("q")
+        self.befores = array("q")
+        self.afters = array("q")
+        self.undo_next_lsns = array("q")
+
+        # Interned tx and page ids.
+        self.strings: list[str | None] = [None]
+        self.string_ids: dict[str, int] = {}
+
+        # Records that don't fit the columns, by position.
+        self.others: dict[int, dict] = {}
+
+        # Where each record loaded from disk starts and ends in the file.
+        # Records appended afterwards (CLRs) have no offsets.
+        self.offsets = array("q")
+        self.end_offsets = array("q")
+
+        # Only while LSNs never go down can we binary search them.
+        self._lsns_sorted = True
+        self._positions: dict[int, int] | None = None
+
+        # Records turned into dicts (or parsed while loading), and records
+        # scan_lazy went past without doing so (yet), for instrumentation.
+        self.decoded = 0
+        self.skimmed = 0
+
+    @classmethod
+    def from_records(cls, records) -> "ColumnarWal":
+        # Offsets are record positions when there is no file behind the records.
+        wal = cls()
+        for position, record in enumerate(records):
+            wal._add(record)
+            wal.offsets.append(position)
+            wal.end_offsets.append(position + 1)
+        return wal
+
+    @classmethod
+    def load(cls, source) -> "ColumnarWal":
+        # Read a WalFile or BinaryWal into columns.
+        wal = cls(source.path)
+        for offset, end_offset, record in source.scan():
+            wal._add(record)
+            wal.offsets.append(offset)
+            wal.end_offsets.append(end_offset)
+        wal.decoded = len(wal.offsets)
+        return wal
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "ColumnarWal":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _intern(self, name) -> int:
+        if name is None:
+            return 0
+        string_id = self.string_ids.get(name)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(name)
+            self.string_ids[name] = string_id
+        return string_id
+
+    def _add(self, record: dict) -> None:
+        lsn = record["LSN"]
+        if not _is_int64(lsn):
+            raise ValueError(f"LSN must be a 64 bit integer, got {lsn!r}")
+        if "tx" in record and type(record["tx"]) is not str:
+            raise ValueError(f"tx ids must be strings, got {record['tx']!r}")
+        if "page" in record and type(record["page"]) is not str:
+            raise ValueError(f"page ids must be strings, got {record['page']!r}")
+
+        position = len(self.lsns)
+        if position and lsn < self.lsns[-1]:
+            self._lsns_sorted = False
+        if self._positions is not None:
+            self._positions.setdefault(lsn, position)
+
+        type_code = TYPE_CODES.get(record.get("type"), TYPE_OTHER)
+        self.lsns.append(lsn)
+        self.types.append(type_code)
+        self.txs.append(self._intern(record.get("tx")))
+        self.pages.append(self._intern(record.get("page")))
+
+        flags = 0
+        prev_lsn = before = after = undo_next_lsn = 0
+        compact = (
+            type_code not in (TYPE_OTHER, _CHECKPOINT)
+            and record.keys() <= _COMPACT_FIELDS
+        )
+        if compact and "prevLSN" in record:
+            prev_lsn = record["prevLSN"]
+            flags |= HAS_PREV
+            compact = _is_int64(prev_lsn)
+        if compact and "before" in record:
+            before = record["before"]
+            flags |= HAS_BEFORE
+            compact = _is_int64(before)
+        if compact and "after" in record:
+            after = record["after"]
+            flags |= HAS_AFTER
+            compact = _is_int64(after)
+        if compact and "undoNextLSN" in record:
+            undo_next_lsn = record["undoNextLSN"]
+            flags |= HAS_UNDO_NEXT
+            if undo_next_lsn is None:
+                flags |= UNDO_NEXT_NONE
+                undo_next_lsn = 0
+            else:
+                compact = _is_int64(undo_next_lsn)
+
+        if not compact:
+            self.others[position] = record
+            flags = prev_lsn = before = after = undo_next_lsn = 0
+
+        self.flags.append(flags)
+        self.prev_lsns.append(prev_lsn)
+        self.befores.append(before)
+        self.afters.append(after)
+        self.undo_next_lsns.append(undo_next_lsn)
+
+    def record(self, position: int) -> dict:
+        # The record at position as a dict (in the usual field order).
+        self.decoded += 1
+        other = self.others.get(position)
+        if other is not None:
+            return other
+
+        record = {"LSN": self.lsns[position], "type": TYPE_NAMES[self.types[position]]}
+        flags = self.flags[position]
+        if self.txs[position]:
+            record["tx"] = self.strings[self.txs[position]]
+        if flags & HAS_PREV:
+            record["prevLSN"] = self.prev_lsns[position]
+        if self.pages[position]:
+            record["page"] = self.strings[self.pages[position]]
+        if flags & HAS_BEFORE:
+            record["before"] = self.befores[position]
+        if flags & HAS_AFTER:
+            record["after"] = self.afters[position]
+        if flags & HAS_UNDO_NEXT:
+            record["undoNextLSN"] = (
+                None if flags & UNDO_NEXT_NONE else self.undo_next_lsns[position]
+            )
+        return record
+
+    def after_image(self, position: int):
+        if self.flags[position] & HAS_AFTER:
+            return self.afters[position]
+        # Raises KeyError for a record without one, like record["after"] would.
+        return self.others[position]["after"]
+
+    def record_for_lsn(self, lsn: int) -> dict:
+        # The first record with this LSN, for LsnLookup. Raises KeyError if there is none.
+        if self._lsns_sorted:
+            position = bisect_left(self.lsns, lsn)
+            if position < len(self.lsns) and self.lsns[position] == lsn:
+                return self.record(position)
+            raise KeyError(lsn)
+
+        if self._positions is None:
+            self._positions = {}
+            for position, record_lsn in enumerate(self.lsns):
+                self._positions.setdefault(record_lsn, position)
+        return self.record(self._positions[lsn])
+
+    def _position_of(self, offset: int | None) -> int:
+        # First record at or after a byte offset.
+        if offset is None:
+            return 0
+        return bisect_left(self.offsets, offset)
+
+    def scan(self, start_offset: int | None = None) -> Iterator[tuple[int, int, dict]]:
+        # (offset, end offset, record) for every loaded record from start_offset on.
+        for position in range(self._position_of(start_offset), len(self.offsets)):
+            record = self.record(position)
+            yield self.offsets[position], self.end_offsets[position], record
+
+    def scan_lazy(
+        self, start_offset: int | None = None
+    ) -> Iterator[tuple[int, int, int, str, int]]:
+        # (offset, end offset, LSN, type, position) for every loaded record from
+        # start_offset on. decode_raw(position) gives the whole record.
+        lsns, types, offsets, end_offsets = (
+            self.lsns,
+            self.types,
+            self.offsets,
+            self.end_offsets,
+        )
+        for position in range(self._position_of(start_offset), len(offsets)):
+            type_code = types[position]
+            if type_code == TYPE_OTHER:
+                record_type = self.others[position].get("type")
+            else:
+                record_type = TYPE_NAMES[type_code]
+            self.skimmed += 1
+            offset, end_offset = offsets[position], end_offsets[position]
+            yield offset, end_offset, lsns[position], record_type, position
+
+    def decode_raw(self, position: int) -> dict:
+        return self.record(position)
+
+    def records_from(self, start_offset: int | None) -> "ColumnarRange":
+        # Iterate the WAL starting at a byte offset (see walindex.py), None for the start.
+        return ColumnarRange(self, self._position_of(start_offset))
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self.records_from(None))
+
+    def __reversed__(self) -> Iterator[dict]:
+        for position in range(len(self.lsns) - 1, -1, -1):
+            yield self.record(position)
+
+    def __len__(self) -> int:
+        return len(self.lsns)
+
+    def append(self, record: dict) -> None:
+        self._add(record)
+
+
+class ColumnarRange:
+    """The records of a ColumnarWal from one position to the end (including appends)."""
+
+    def __init__(self, wal: ColumnarWal, start: int):
+        self.wal = wal
+        self.start = start
+
+    def __iter__(self) -> Iterator[dict]:
+        position = self.start
+        # Not a range(), so records appended while iterating are seen too.
+        while position < len(self.wal.lsns):
+            yield self.wal.record(position)
+            position += 1
+
+    def analysis(self, page_index=None) -> tuple[dict, dict, list]:
+        # aries.analysis over the columns. Every UPDATE and CLR with a page is
+        # added to page_index (a pageindex.PageUpdateIndex) if there is one.
+        wal = self.wal
+        lsns, types, txs, pages, strings = (
+            wal.lsns,
+            wal.types,
+            wal.txs,
+            wal.pages,
+            wal.strings,
+        )
+
+        dirty_page_table = {}
+        transaction_table = {}
+        ended_transactions = []
+
+        index_positions = None
+        if page_index is not None:
+            page_index.start = self.start
+            index_positions = page_index.positions
+
+        for position in range(self.start, len(lsns)):
+            type_code = types[position]
+            if type_code == _CHECKPOINT:
+                checkpoint = wal.others[position]
+                if "DPT" in checkpoint and "TT" in checkpoint:
+                    dirty_page_table = dict(checkpoint["DPT"])
+                    transaction_table = {
+                        tx: dict(info) for tx, info in checkpoint["TT"].items()
+                    }
+                    ended_transactions = []
+                continue
+
+            if index_positions is not None and (
+                type_code == _UPDATE or type_code == _CLR
+            ):
+                page_id = pages[position]
+                if page_id:
+                    positions = index_positions.get(page_id)
+                    if positions is None:
+                        index_positions[page_id] = [position]
+                    else:
+                        positions.append(position)
+
+            tx_id = txs[position]
+            if not tx_id:
+                continue
+            tx = strings[tx_id]
+            lsn = lsns[position]
+
+            if type_code == _UPDATE or type_code == _CLR:
+                page_id = pages[position]
+                if not page_id:
+                    continue
+                entry = transaction_table.get(tx)
+                if entry is None:
+                    transaction_table[tx] = {"status": "RUNNING", "lastLSN": lsn}
+                else:
+                    entry["lastLSN"] = lsn
+                page = strings[page_id]
+                if page not in dirty_page_table:
+                    dirty_page_table[page] = lsn
+            elif type_code == _BEGIN:
+                transaction_table[tx] = {"status": "RUNNING", "lastLSN": lsn}
+            elif type_code == _COMMIT or type_code == _ABORT:
+                entry = transaction_table.get(tx)
+                if entry is None:
+                    entry = transaction_table[tx] = {"status": "RUNNING"}
+                entry["lastLSN"] = lsn
+                entry["status"] = "COMMITTED" if type_code == _COMMIT else "ABORTED"
+            elif type_code == _END:
+                transaction_table.pop(tx, None)
+                ended_transactions.append(tx)
+
+        return transaction_table, dirty_page_table, ended_transactions
+
+    def redo(
+        self,
+        dirty_page_table: dict[str, int],
+        disk_pages: dict[str, dict],
+        stats: dict | None = None,
+    ) -> list[int]:
+        # aries.redo over the columns.
+        if not dirty_page_table.values():
+            return []
+
+        wal = self.wal
+        lsns, types, pages, flags, afters, strings = (
+            wal.lsns,
+            wal.types,
+            wal.pages,
+            wal.flags,
+            wal.afters,
+            wal.strings,
+        )
+        min_recovery_lsn = min(dirty_page_table.values())
+        redone_lsns = []
+        skipped_below_rec_lsn = skipped_page_lsn = 0
+
+        position = self.start
+        if wal._lsns_sorted:
+            # Everything before the first LSN >= min recLSN can be skipped at once.
+            first = max(position, bisect_left(lsns, min_recovery_lsn))
+            skipped_below_rec_lsn = first - position
+            position = first
+
+        for position in range(position, len(lsns)):
+            lsn = lsns[position]
+            if lsn < min_recovery_lsn:
+                skipped_below_rec_lsn += 1
+                continue
+            type_code = types[position]
+            if type_code != _UPDATE and type_code != _CLR:
+                continue
+            page_id = pages[position]
+            if not page_id:
+                continue
+
+            page = disk_pages[strings[page_id]]
+            if lsn <= page["pageLSN"]:
+                skipped_page_lsn += 1
+                continue
+
+            page["value"] = (
+                afters[position]
+                if flags[position] & HAS_AFTER
+                else wal.after_image(position)
+            )
+            page["pageLSN"] = lsn
+            redone_lsns.append(lsn)
+
+        if stats is not None:
+            stats["skipped_below_rec_lsn"] = skipped_below_rec_lsn
+            stats["skipped_page_lsn"] = skipped_page_lsn
+        return redone_lsns
+
+
+def as_range(wal) -> ColumnarRange | None:
+    # The columnar form of wal, if it has one.
+    if isinstance(wal, ColumnarWal):
+        return wal.records_from(None)
+    if isinstance(wal, ColumnarRange):
+        return wal
+    return None
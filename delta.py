@@ -0,0 +1,132 @@
+import argparse
+import json
+from collections.abc import Iterator, Mapping
+
+from pagestore import PageStore, is_page_store
+
+# Writing out only what recovery changed.
+#
+# main used to write every page to disk_pages_after.json, pretty-printed, even
+# though redo and undo usually touch a small part of the database. A delta
+# holds just the pages whose pageLSN or value changed, one compact JSON array
+# per line:
+#
+#     ["P1",42,7]        page, new pageLSN, new value
+#
+# and apply_delta brings a copy of the original pages (JSON or a page store)
+# up to date with it. To know what changed, recovery sees the pages through
+# PageOriginals, which copies each page the first time it is looked up.
+
+
+class PageOriginals(Mapping):
+    """Wraps the pages recovery writes to and copies each one the first time it is looked up."""
+
+    def __init__(self, pages: Mapping):
+        self.pages = pages
+        self.originals: dict[str, dict] = {}
+
+    def __getitem__(self, page: str):
+        found = self.pages[page]
+        if page not in self.originals:
+            self.originals[page] = dict(found)
+        return found
+
+    def __iter__(self):
+        return iter(self.pages)
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def __contains__(self, page: object) -> bool:
+        return page in self.pages
+
+    def restore(self) -> None:
+        # Put back every page looked up so far the way it was.
+        for page, original in self.originals.items():
+            self.pages[page].update(original)
+
+    def changed(
+        self, pages: Mapping | None = None
+    ) -> Iterator[tuple[str, int, object]]:
+        # (page, pageLSN, value) of every page that differs from its original,
+        # in the order they were first looked up. Pass the backing pages to
+        # compare against those instead, e.g. after flushing a buffer pool.
+        pages = self.pages if pages is None else pages
+        for page, original in self.originals.items():
+            current = pages[page]
+            page_lsn, value = current["pageLSN"], current["value"]
+            if page_lsn != original["pageLSN"] or value != original["value"]:
+                yield page, page_lsn, value
+
+
+def write_pages(path: str, pages: dict[str, dict], compact: bool = False) -> None:
+    # The full disk_pages.json layout, indented unless compact.
+    with open(path, "w") as f:
+        if compact:
+            json.dump(pages, f, separators=(",", ":"))
+        else:
+            json.dump(pages, f, indent=2)
+
+
+def write_delta(path: str, changes: Iterator[tuple[str, int, object]]) -> int:
+    # Write (page, pageLSN, value) changes as a delta file. Returns how many.
+    written = 0
+    with open(path, "w") as f:
+        for change in changes:
+            f.write(json.dumps(change, separators=(",", ":")) + "\n")
+            written += 1
+    return written
+
+
+def read_delta(path: str) -> Iterator[tuple[str, int, object]]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                page, page_lsn, value = json.loads(line)
+                yield page, page_lsn, value
+
+
+def apply_delta(pages: Mapping, delta_path: str) -> int:
+    # Overwrite the pageLSN and value of every page in the delta. Every page
+    # has to exist already, as it did when recovery ran. Returns how many.
+    applied = 0
+    for page, page_lsn, value in read_delta(delta_path):
+        entry = pages[page]
+        entry["pageLSN"] = page_lsn
+        entry["value"] = value
+        applied += 1
+    return applied
+
+
+if __name__ == "__main__":
+    # python3 delta.py files/disk_pages.json disk_pages_delta.jsonl --out disk_pages_after.json
+    # python3 delta.py disk_pages.bin disk_pages_delta.jsonl (a page store is updated in place)
+    parser = argparse.ArgumentParser(
+        description="Apply a delta written by aries.py --output-format delta to base pages."
+    )
+    parser.add_argument(
+        "base", help="the pages recovery started from, JSON or a page store"
+    )
+    parser.add_argument("delta")
+    parser.add_argument(
+        "--out", help="where to write JSON pages (default: overwrite the base)"
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="write the JSON pages without indentation",
+    )
+    args = parser.parse_args()
+
+    if is_page_store(args.base):
+        with PageStore(args.base) as store:
+            applied = apply_delta(store, args.delta)
+            store.flush()
+        print(f"Applied {applied} pages to {args.base}")
+    else:
+        with open(args.base) as f:
+            base_pages = json.load(f)
+        applied = apply_delta(base_pages, args.delta)
+        out_path = args.out or args.base
+        write_pages(out_path, base_pages, args.compact)
+        print(f"Applied {applied} pages to {args.base}, wrote {out_path}")
@@ -0,0 +1,275 @@
+import argparse
+import itertools
+import json
+import os
+import struct
+import time
+from collections.abc import Iterator
+
+import aries
+import parallel
+from binwal import BinaryWal
+from walfile import iter_wal_lines
+from walindex import _head_digest
+
+# Incremental analysis that picks up where it left off.
+#
+# aries.analysis rebuilds the transaction table and dirty page table from the
+# last checkpoint every time, so restart pays for every record since then.
+# IncrementalAnalysis keeps the tables together with the byte offset and LSN
+# of the last record it has seen, and catch_up() only reads the records after
+# that. The state is saved next to the WAL as <wal path>.analysis, so it
+# serves both
+#   a live tailer   follow() polls a growing WAL and keeps the tables current
+#   restart         main --incremental-analysis loads the saved state and only
+#                   analyzes what was appended since it was saved
+#
+# Resuming uses the chunk summaries of the parallel analysis (parallel.py):
+# the saved tables are the summary of everything seen so far, the new records
+# are summarized as one more chunk and the two are merged, which gives what
+# aries.analysis would have returned for the whole log.
+#
+# Like the sidecar index, the state remembers a fingerprint of the start of the
+# WAL and starts over if the part it has seen was rewritten (e.g. truncated by
+# a checkpoint). A record that is still being written at the end of the log
+# (no newline yet, or a binary record cut short) is left for the next catch-up.
+
+STATE_SUFFIX = ".analysis"
+STATE_VERSION = 1
+# Records summarized (and, with a state path, saved) at a time during catch-up.
+SAVE_INTERVAL = 65536
+_HEAD_BYTES = 4096
+
+
+def state_path_for(wal_path: str) -> str:
+    return wal_path + STATE_SUFFIX
+
+
+def _complete_until(path: str) -> int:
+    # End of the last complete JSONL record: just past the last newline.
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - 65536)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline != -1:
+                return start + newline + 1
+            end = start
+    return 0
+
+
+class IncrementalAnalysis:
+    """Analysis tables for a WAL, plus how far into the WAL they go."""
+
+    def __init__(self):
+        self.transaction_table: dict[str, dict] = {}
+        self.dirty_page_table: dict[str, int] = {}
+        self.ended: list[str] = []
+
+        # End of the last record analyzed, None if none yet, and its LSN.
+        self.offset: int | None = None
+        self.last_lsn: int | None = None
+        self.records = 0
+        self.head_length = 0
+        self.head_digest = ""
+
+    @classmethod
+    def open(
+        cls, wal, wal_index=None, save_interval: int = SAVE_INTERVAL
+    ) -> "IncrementalAnalysis":
+        # Load the saved state for wal (a WalFile or BinaryWal), catch it up
+        # with the WAL on disk (saving as it goes) and return it. Without a
+        # usable saved state, analysis starts at the last checkpoint the
+        # wal_index knows about, if one is given.
+        path = state_path_for(wal.path)
+        state = cls.load(path)
+        if state is None or not state.matches(wal.path):
+            state = cls()
+            if wal_index is not None:
+                state.offset = wal_index.last_checkpoint_offset()
+        state.catch_up(wal, path, save_interval)
+        return state
+
+    def tables(self) -> tuple[dict, dict, list]:
+        # Copies of the tables, the same as aries.analysis(wal) returns.
+        return (
+            {tx: dict(info) for tx, info in self.transaction_table.items()},
+            dict(self.dirty_page_table),
+            list(self.ended),
+        )
+
+    def matches(self, wal_path: str) -> bool:
+        # Is the part of the WAL we have analyzed still the same bytes?
+        if self.offset is None:
+            return True
+        if os.path.getsize(wal_path) < self.offset:
+            return False
+        if self.head_length == 0:
+            # Started past the beginning (at a checkpoint) without reading any.
+            return True
+        return _head_digest(wal_path, self.head_length) == self.head_digest
+
+    def _new_records(self, wal) -> Iterator[tuple[int, dict]]:
+        # (end offset, record) of every complete record after the ones we have.
+        if not isinstance(wal, BinaryWal):
+            # Stop before a line that is still being written, without parsing it.
+            limit = _complete_until(wal.path)
+            for offset, line in iter_wal_lines(
+                wal.path, self.offset or 0, chunk_size=wal.chunk_size
+            ):
+                if offset + len(line) > limit:
+                    return
+                yield offset + len(line), wal.decode_raw(line)
+            return
+
+        records = wal.scan(self.offset)
+        while True:
+            try:
+                _, end_offset, record = next(records)
+            except StopIteration:
+                return
+            except struct.error:
+                # A binary record header cut short by a writer.
+                return
+            if end_offset > wal.size:
+                return
+            yield end_offset, record
+
+    def catch_up(
+        self, wal, state_path: str | None = None, save_interval: int = SAVE_INTERVAL
+    ) -> int:
+        # Analyze the records appended since last time and return how many.
+        # With a state_path the state is saved after every save_interval
+        # records and at the end.
+        if not self.matches(wal.path):
+            # Start over.
+            self.__init__()
+        new_records = self._new_records(wal)
+        added = 0
+        while True:
+            batch = list(itertools.islice(new_records, save_interval))
+            if not batch:
+                break
+            earlier = {
+                "reset": True,
+                "tt": self.transaction_table,
+                "fresh": set(),
+                "removed": set(),
+                "dpt": self.dirty_page_table,
+                "ended": self.ended,
+            }
+            merged = parallel._merge_analysis(
+                earlier, parallel._analysis_chunk([record for _, record in batch])
+            )
+            self.transaction_table = merged["tt"]
+            self.dirty_page_table = merged["dpt"]
+            self.ended = merged["ended"]
+
+            self.offset = batch[-1][0]
+            self.last_lsn = batch[-1][1]["LSN"]
+            self.records += len(batch)
+            added += len(batch)
+            if self.head_length < _HEAD_BYTES:
+                self.head_length = min(_HEAD_BYTES, self.offset)
+                self.head_digest = _head_digest(wal.path, self.head_length)
+            if state_path is not None:
+                self.save(state_path)
+        return added
+
+    def save(self, path: str) -> None:
+        state = {
+            "version": STATE_VERSION,
+            "offset": self.offset,
+            "last_lsn": self.last_lsn,
+            "records": self.records,
+            "head_length": self.head_length,
+            "head_digest": self.head_digest,
+            "transaction_table": self.transaction_table,
+            "dirty_page_table": self.dirty_page_table,
+            "ended": self.ended,
+        }
+        # Write to the side and rename so a crash never leaves half a state behind.
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IncrementalAnalysis | None":
+        # None if the file isn't a state we understand; the caller starts over.
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+            return None
+
+        analysis = cls()
+        analysis.offset = state["offset"]
+        analysis.last_lsn = state["last_lsn"]
+        analysis.records = state["records"]
+        analysis.head_length = state["head_length"]
+        analysis.head_digest = state["head_digest"]
+        analysis.transaction_table = state["transaction_table"]
+        analysis.dirty_page_table = state["dirty_page_table"]
+        analysis.ended = state["ended"]
+        return analysis
+
+
+def follow(
+    wal_path: str, poll_interval: float = 1.0, save_interval: int = SAVE_INTERVAL
+) -> Iterator[tuple[IncrementalAnalysis, int]]:
+    # Tail a growing WAL: yields (analysis, records added) every time new
+    # records have been analyzed, saving the state as it goes. Runs until the
+    # caller stops iterating.
+    state_path = state_path_for(wal_path)
+    analysis = IncrementalAnalysis.load(state_path) or IncrementalAnalysis()
+    while True:
+        if os.path.exists(wal_path) and os.path.getsize(wal_path) > 0:
+            # Reopened every time, a binary WAL only sees what was there at open.
+            with aries._load_wal(wal_path) as wal:
+                added = analysis.catch_up(wal, state_path, save_interval)
+            if added:
+                yield analysis, added
+        time.sleep(poll_interval)
+
+
+def _print_update(analysis: IncrementalAnalysis, added: int) -> None:
+    print(
+        f"Analyzed {added} new records up to LSN {analysis.last_lsn}: "
+        f"{len(analysis.transaction_table)} transactions in the TT, "
+        f"{len(analysis.dirty_page_table)} pages in the DPT, "
+        f"{len(analysis.ended)} ended"
+    )
+
+
+if __name__ == "__main__":
+    # python3 incremental.py files/wal.jsonl             catch up once and print the tables
+    # python3 incremental.py files/wal.jsonl --follow    keep following the WAL as it grows
+    parser = argparse.ArgumentParser(
+        description="Incrementally analyze a WAL, saving the state next to it."
+    )
+    parser.add_argument("wal_path")
+    parser.add_argument(
+        "--follow", action="store_true", help="keep polling for new records"
+    )
+    parser.add_argument(
+        "--interval", type=float, default=1.0, help="seconds between polls (default: 1)"
+    )
+    args = parser.parse_args()
+
+    if args.follow:
+        try:
+            for analysis, added in follow(args.wal_path, args.interval):
+                _print_update(analysis, added)
+        except KeyboardInterrupt:
+            pass
+    else:
+        with aries._load_wal(args.wal_path) as wal:
+            analysis = IncrementalAnalysis.load(state_path_for(wal.path))
+            analysis = analysis or IncrementalAnalysis()
+            added = analysis.catch_up(wal, state_path_for(wal.path))
+        _print_update(analysis, added)
@@ -0,0 +1,304 @@
+import io
+import json
+import os
+import threading
+import time
+
+from binwal import BinaryWal, BinaryWalWriter, is_binary_wal
+from walfile import WalFile
+
+# The forward path: writing the WAL that recovery reads.
+#
+# LogManager hands out LSNs and appends BEGIN, UPDATE, COMMIT, ABORT (with the
+# CLRs that roll it back), END and CHECKPOINT records, in the same layout the
+# workload generator writes, and keeps the transaction table and dirty page
+# table the way analysis would rebuild them from the log at any point.
+#
+# Appending only encodes the record into an in-memory buffer. A COMMIT has to
+# be on disk before commit() returns, and one fsync per commit would cap
+# throughput at the disk's sync rate, so commits are grouped: a flusher thread
+# writes the whole buffer and fsyncs it once when batch_size committers are
+# waiting or the oldest of them has waited max_latency seconds, whichever
+# comes first, and then wakes everyone the batch covered. Committers on many
+# threads share each fsync that way; a single-threaded committer just pays up
+# to max_latency per commit (set it to 0 for that).
+#
+# The WAL protocol is the caller's job: before writing a page to disk, flush()
+# the log up to that page's pageLSN, then tell the log manager with
+# page_written() so the page leaves the dirty page table.
+
+DEFAULT_BATCH_SIZE = 32  # Waiting committers that send a batch out right away.
+DEFAULT_MAX_LATENCY = 0.002  # Seconds a commit may wait for others to join it.
+
+
+class LogManager:
+    """Appends records to a WAL (JSONL or binary) with group commit."""
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_latency: float = DEFAULT_MAX_LATENCY,
+        binary: bool = False,
+        sync: bool = True,
+    ):
+        # An existing WAL is appended to in its own format, continuing its
+        # LSNs; binary only picks the format of a new one. sync=False skips
+        # the fsync (the batches are still written together).
+        if batch_size < 1 or max_latency < 0:
+            raise ValueError("batch_size must be at least 1 and max_latency >= 0")
+        self.path = path
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.sync = sync
+
+        last_lsn = 0
+        ids = None
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            binary = is_binary_wal(path)
+            with BinaryWal(path) if binary else WalFile(path) as wal:
+                last_record = next(reversed(wal), None)
+                if last_record is not None:
+                    last_lsn = last_record["LSN"]
+                if binary:
+                    ids = wal.interned_ids()
+        self.binary = binary
+
+        self.transaction_table: dict[str, dict] = {}
+        self.dirty_page_table: dict[str, int] = {}
+        # (LSN, prevLSN, page, before) of every update, per running transaction,
+        # for rolling back an abort.
+        self._writes: dict[str, list[tuple[int, int, str, object]]] = {}
+
+        # Counters, for benchmarks. A batch is one write (and fsync).
+        self.records = self.commits = self.batches = 0
+
+        self._pending = io.BytesIO()
+        self._file = open(path, "ab", buffering=0)
+        if not binary and self._file.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # Don't glue the first record onto an unterminated last line.
+                    self._pending.write(b"\n")
+        self._writer = BinaryWalWriter(self._pending, ids) if binary else None
+
+        self._cond = threading.Condition()
+        self._last_lsn = last_lsn
+        self._durable_lsn = last_lsn
+        self._waiting = 0  # Committers whose COMMIT isn't in a batch yet.
+        self._oldest_wait: float | None = None
+        self._forced_lsn = last_lsn  # flush() wants everything up to here.
+        self._closed = False
+        self._error: BaseException | None = None
+        self._flusher = threading.Thread(target=self._run, daemon=True)
+        self._flusher.start()
+
+    def __enter__(self) -> "LogManager":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # Appending. All of these hold the lock, so LSNs go out in log order.
+
+    def _append(self, record_type: str, tx: str | None, **fields) -> int:
+        self._check()
+        self._last_lsn += 1
+        record = {"LSN": self._last_lsn, "type": record_type}
+        if tx is not None:
+            record["tx"] = tx
+        record.update(fields)
+        if self._writer is not None:
+            self._writer.append(record)
+        else:
+            self._pending.write(json.dumps(record).encode() + b"\n")
+        self.records += 1
+        return self._last_lsn
+
+    def _running(self, tx: str) -> dict:
+        entry = self.transaction_table.get(tx)
+        if entry is None or entry["status"] != "RUNNING":
+            raise ValueError(f"transaction {tx} is not running")
+        return entry
+
+    def begin(self, tx: str) -> int:
+        with self._cond:
+            if tx in self.transaction_table:
+                raise ValueError(f"transaction {tx} has already begun")
+            lsn = self._append("BEGIN", tx)
+            self.transaction_table[tx] = {"status": "RUNNING", "lastLSN": lsn}
+            self._writes[tx] = []
+            return lsn
+
+    def update(self, tx: str, page: str, before, after) -> int:
+        # Log a change of page from before to after. The caller applies it to
+        # the page and sets its pageLSN to the returned LSN.
+        with self._cond:
+            entry = self._running(tx)
+            prev_lsn = entry["lastLSN"]
+            lsn = self._append(
+                "UPDATE",
+                tx,
+                prevLSN=prev_lsn,
+                page=page,
+                before=before,
+                after=after,
+            )
+            entry["lastLSN"] = lsn
+            self._writes[tx].append((lsn, prev_lsn, page, before))
+            self.dirty_page_table.setdefault(page, lsn)
+            return lsn
+
+    def _end(self, tx: str) -> None:
+        # Called with the lock held.
+        self._append("END", tx, prevLSN=self.transaction_table[tx]["lastLSN"])
+        del self.transaction_table[tx]
+        del self._writes[tx]
+
+    def commit(self, tx: str) -> int:
+        # Log a COMMIT and return its LSN once it is on disk. The END after it
+        # doesn't have to wait for the disk.
+        with self._cond:
+            entry = self._running(tx)
+            lsn = self._append("COMMIT", tx, prevLSN=entry["lastLSN"])
+            entry["lastLSN"] = lsn
+            entry["status"] = "COMMITTED"
+            if self._waiting == 0:
+                self._oldest_wait = time.monotonic()
+            self._waiting += 1
+            self._cond.notify_all()
+            self._wait_durable(lsn)
+            self.commits += 1
+            self._end(tx)
+            return lsn
+
+    def abort(self, tx: str) -> list[tuple[str, object, int]]:
+        # Log an ABORT, roll the transaction back with one CLR per update
+        # (newest first) and END it. Returns (page, before, CLR LSN) for each
+        # update undone, for the caller to apply to its pages.
+        with self._cond:
+            entry = self._running(tx)
+            lsn = self._append("ABORT", tx, prevLSN=entry["lastLSN"])
+            entry["lastLSN"] = lsn
+            entry["status"] = "ABORTED"
+            undone = []
+            for _, prev_lsn, page, before in reversed(self._writes[tx]):
+                lsn = self._append(
+                    "CLR",
+                    tx,
+                    prevLSN=entry["lastLSN"],
+                    page=page,
+                    after=before,
+                    undoNextLSN=prev_lsn,
+                )
+                entry["lastLSN"] = lsn
+                self.dirty_page_table.setdefault(page, lsn)
+                undone.append((page, before, lsn))
+            self._end(tx)
+            return undone
+
+    def checkpoint(self) -> int:
+        # Log a CHECKPOINT with the current tables, so analysis can start there.
+        with self._cond:
+            return self._append(
+                "CHECKPOINT",
+                None,
+                DPT=dict(self.dirty_page_table),
+                TT={tx: dict(info) for tx, info in self.transaction_table.items()},
+            )
+
+    def page_written(self, page: str) -> None:
+        # The page is on disk with everything logged for it so far.
+        with self._cond:
+            self.dirty_page_table.pop(page, None)
+
+    # Flushing.
+
+    def _check(self) -> None:
+        if self._error is not None:
+            raise OSError(f"writing {self.path} failed") from self._error
+        if self._closed:
+            raise ValueError("the log manager is closed")
+
+    def _wait_durable(self, lsn: int) -> None:
+        # Called with the lock held.
+        while self._durable_lsn < lsn:
+            if self._error is not None:
+                self._check()
+            self._cond.wait()
+
+    @property
+    def durable_lsn(self) -> int:
+        # Everything up to this LSN is on disk.
+        with self._cond:
+            return self._durable_lsn
+
+    def flush(self, lsn: int | None = None) -> None:
+        # Wait until everything up to lsn (default: everything so far) is on disk.
+        with self._cond:
+            lsn = self._last_lsn if lsn is None else min(lsn, self._last_lsn)
+            if lsn > self._durable_lsn:
+                self._forced_lsn = max(self._forced_lsn, lsn)
+                self._cond.notify_all()
+                self._wait_durable(lsn)
+
+    def _batch_due(self) -> float | None:
+        # Called with the lock held. 0 if a batch should go out now, otherwise
+        # how long until it should (None: until something happens).
+        if self._closed or self._forced_lsn > self._durable_lsn:
+            return 0
+        if self._waiting >= self.batch_size:
+            return 0
+        if self._waiting:
+            return max(0, self._oldest_wait + self.max_latency - time.monotonic())
+        return None
+
+    def _run(self) -> None:
+        # Flusher thread: write and fsync one batch at a time.
+        with self._cond:
+            while True:
+                due = self._batch_due()
+                while due != 0:
+                    self._cond.wait(due)
+                    due = self._batch_due()
+                data = self._pending.getvalue()
+                if not data:
+                    # Only happens once we are closed and everything is out.
+                    return
+                self._pending = io.BytesIO()
+                if self._writer is not None:
+                    self._writer.f = self._pending
+                batch_lsn = self._last_lsn
+                self._waiting = 0
+                self._oldest_wait = None
+
+                # Let others keep appending while this batch goes to disk.
+                self._cond.release()
+                try:
+                    self._file.write(data)
+                    if self.sync:
+                        os.fsync(self._file.fileno())
+                except BaseException as error:
+                    self._error = error
+                finally:
+                    self._cond.acquire()
+
+                if self._error is not None:
+                    self._cond.notify_all()
+                    return
+                self.batches += 1
+                self._durable_lsn = batch_lsn
+                self._cond.notify_all()
+
+    def close(self) -> None:
+        # Flush whatever is left and stop the flusher.
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._flusher.join()
+        self._file.close()
+        if self._error is not None:
+            raise OSError(f"writing {self.path} failed") from self._error
@@ -0,0 +1,177 @@
+import contextlib
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from collections.abc import Iterator, Mapping
+
+from pagetable import PageTable
+
+# Per-phase instrumentation for a recovery run.
+#
+# Each phase (loading the WAL and pages, analysis, redo, undo, ...) runs inside
+# RecoveryMetrics.phase(), which records wall and CPU time, how many WAL
+# records were decoded (WalFile.decoded / BinaryWal.decoded) or only had
+# their LSN and type read (.skimmed, see scan_lazy) and which pages were
+# looked up, plus whatever counters the phase itself adds (redo's skip
+# counts). With trace_memory the peak memory allocated during the phase is
+# recorded through tracemalloc, which slows everything down noticeably.
+#
+# For a segmented WAL (see segments.py) watch_segments also counts, per phase,
+# the distinct segments read, how often segments were opened and run through
+# their decompressor, and the compressed bytes read.
+#
+# With a profile_dir every phase additionally runs under cProfile, and the
+# profile (<phase>.prof, for pstats or snakeviz) and a tracemalloc snapshot
+# (<phase>.tracemalloc, for tracemalloc.Snapshot.load) are dumped there.
+#
+# CPU time only counts this process, not the workers of a parallel redo.
+
+
+class TouchedPages(Mapping):
+    """Wraps disk_pages and remembers which pages were looked up."""
+
+    def __init__(self, pages: Mapping):
+        self.pages = pages
+        self.touched: set[str] = set()
+
+    def __getitem__(self, page: str):
+        self.touched.add(page)
+        return self.pages[page]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.pages)
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def __contains__(self, page: object) -> bool:
+        return page in self.pages
+
+
+class RecoveryMetrics:
+    def __init__(self, trace_memory: bool = False, profile_dir: str | None = None):
+        self.trace_memory = trace_memory or profile_dir is not None
+        self.profile_dir = profile_dir
+        self.wal = None
+        self.pages: TouchedPages | PageTable | None = None
+        self.segmented = None
+        self.segment_reads: dict[str, dict] = {}
+        self.phases: dict[str, dict] = {}
+        # Anything else worth reporting, like the buffer pool counters.
+        self.extra: dict[str, object] = {}
+
+        if self.profile_dir is not None:
+            os.makedirs(self.profile_dir, exist_ok=True)
+        # Leave tracemalloc alone at the end if someone else started it.
+        self._started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+
+    def watch_wal(self, wal) -> None:
+        # Count the records this WAL decodes in each phase from now on.
+        self.wal = wal
+
+    def watch_segments(self, wal) -> None:
+        # Count what this SegmentedWal reads from its segments, in the current
+        # phase (since the WAL was opened) and every phase from now on.
+        self.segmented = wal
+
+    def track_pages(self, pages: Mapping) -> Mapping:
+        # Use the returned mapping in place of pages to count the pages each phase touches.
+        if isinstance(pages, PageTable):
+            # Wrapped, redo and undo wouldn't see the table and would skip its
+            # fast paths, so it counts the pages itself.
+            pages.touched = set()
+            self.pages = pages
+            return pages
+        self.pages = TouchedPages(pages)
+        return self.pages
+
+    def _decoded(self) -> int:
+        return self.wal.decoded if self.wal is not None else 0
+
+    def _skimmed(self) -> int:
+        return getattr(self.wal, "skimmed", 0)
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        # Yields a dict the phase can add its own counters to.
+        counters: dict = {}
+        decoded, skimmed = self._decoded(), self._skimmed()
+        segment_reads = (
+            self.segmented.read_snapshot() if self.segmented is not None else None
+        )
+        if self.pages is not None:
+            self.pages.touched.clear()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        profiler = cProfile.Profile() if self.profile_dir is not None else None
+
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield counters
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            entry = {
+                "wall_seconds": time.perf_counter() - wall_start,
+                "cpu_seconds": time.process_time() - cpu_start,
+                "records_decoded": self._decoded() - decoded,
+                "records_skimmed": self._skimmed() - skimmed,
+                "pages_touched": (
+                    len(self.pages.touched) if self.pages is not None else None
+                ),
+                "peak_traced_bytes": (
+                    tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+                ),
+            }
+            entry.update(counters)
+            self.phases[name] = entry
+            if self.segmented is not None:
+                self.segment_reads[name] = self.segmented.reads_since(segment_reads)
+
+            if profiler is not None:
+                profiler.dump_stats(os.path.join(self.profile_dir, f"{name}.prof"))
+                tracemalloc.take_snapshot().dump(
+                    os.path.join(self.profile_dir, f"{name}.tracemalloc")
+                )
+
+    def to_dict(self) -> dict:
+        segments = {}
+        if self.segmented is not None:
+            segments["segments"] = {
+                "segments": len(self.segmented.segments),
+                **self.segmented.reads_since(),
+                "phases": self.segment_reads,
+            }
+        return {
+            **self.extra,
+            **segments,
+            "phases": self.phases,
+            "total": {
+                key: sum(phase[key] for phase in self.phases.values())
+                for key in (
+                    "wall_seconds",
+                    "cpu_seconds",
+                    "records_decoded",
+                    "records_skimmed",
+                )
+            },
+        }
+
+    def dump(self, path: str) -> None:
+        # Write the metrics as JSON to path, or to stdout for "-".
+        blob = json.dumps(self.to_dict(), indent=2)
+        if path == "-":
+            print(blob)
+            return
+        with open(path, "w") as f:
+            f.write(blob + "\n")
+
+    def close(self) -> None:
+        if self._started_tracing:
+            tracemalloc.stop()
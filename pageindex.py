@@ -0,0 +1,142 @@
+from bisect import bisect_left
+
+from binwal import TYPE_CODES
+from columnar import HAS_AFTER, ColumnarWal
+
+# Per-page update index for redo over a ColumnarWal.
+#
+# The serial redo starts at the smallest recLSN of the whole dirty page table
+# and looks up the page of every UPDATE and CLR from there on, even for pages
+# whose own recLSN is much later or that aren't dirty at all. Updates to a page
+# below its recLSN are on disk already (that is what recLSN means), so they
+# would only be skipped by the pageLSN test anyway. With a skewed workload
+# that is most of the log.
+#
+# PageUpdateIndex remembers the positions of the UPDATEs and CLRs of every
+# page. aries.analysis fills it in as it goes (pass it as page_index), and redo
+# then replays each page in the dirty page table from its own recLSN on, so it
+# only visits the updates that may actually need replaying. Analysis only sees
+# the log from the last checkpoint; whatever part of the log before that redo
+# needs is found when redo runs.
+#
+# That is the textbook redo test (page in the dirty page table, LSN >= its
+# recLSN, LSN > pageLSN). It only replays less than aries.redo when the dirty
+# page table contradicts the pages on disk, e.g. a checkpoint that left out a
+# page whose latest update never made it to disk.
+
+_UPDATE = TYPE_CODES["UPDATE"]
+_CLR = TYPE_CODES["CLR"]
+
+
+class PageUpdateIndex:
+    """Positions of the UPDATEs and CLRs in a ColumnarWal, by page."""
+
+    def __init__(self, wal: ColumnarWal):
+        self.wal = wal
+        # Page id -> positions of its updates, in log order, for every update
+        # from position start to the end of the log. Filled in by analysis.
+        self.positions: dict[int, list[int]] = {}
+        self.start: int | None = None
+
+    def _scan(self, start: int, end: int, page_ids: set[int]) -> dict[int, list[int]]:
+        # Positions of the updates to page_ids from start up to end, by page id.
+        wal = self.wal
+        types = wal.types
+        found: dict[int, list[int]] = {}
+        for position, page_id in enumerate(wal.pages[start:end], start):
+            if page_id in page_ids and (
+                types[position] == _UPDATE or types[position] == _CLR
+            ):
+                positions = found.get(page_id)
+                if positions is None:
+                    positions = found[page_id] = []
+                positions.append(position)
+        return found
+
+    def redo(
+        self,
+        dirty_page_table: dict[str, int],
+        disk_pages: dict[str, dict],
+        stats: dict | None = None,
+    ) -> list[int]:
+        # Redo each page in the dirty page table from its recLSN. Returns the
+        # redone LSNs in log order, like aries.redo. In the stats, records that
+        # were never looked at count as skipped below their recLSN.
+        if not dirty_page_table.values():
+            return []
+
+        wal = self.wal
+        lsns, flags, afters = wal.lsns, wal.flags, wal.afters
+        sorted_lsns = wal._lsns_sorted
+        min_recovery_lsn = min(dirty_page_table.values())
+        page_ids = {
+            page: wal.string_ids[page]
+            for page in dirty_page_table
+            if page in wal.string_ids
+        }
+
+        # Analysis indexed from the last checkpoint on. Pages dirty since
+        # before that need the updates in between too.
+        start = bisect_left(lsns, min_recovery_lsn) if sorted_lsns else 0
+        indexed_from = len(lsns) if self.start is None else self.start
+        earlier: dict[int, list[int]] = {}
+        if start < indexed_from:
+            first_indexed_lsn = lsns[indexed_from] if indexed_from < len(lsns) else None
+            earlier = self._scan(
+                start,
+                indexed_from,
+                {
+                    page_ids[page]
+                    for page, rec_lsn in dirty_page_table.items()
+                    if page in page_ids
+                    and (
+                        not sorted_lsns
+                        or first_indexed_lsn is None
+                        or rec_lsn < first_indexed_lsn
+                    )
+                },
+            )
+
+        redone: list[int] = []
+        visited = skipped_page_lsn = 0
+
+        for page, rec_lsn in dirty_page_table.items():
+            page_id = page_ids.get(page)
+            positions = self.positions.get(page_id, [])
+            if page_id in earlier:
+                positions = earlier[page_id] + positions
+            if not positions:
+                continue
+
+            if sorted_lsns:
+                # Nothing before the page's recLSN needs replaying.
+                positions = positions[
+                    bisect_left(positions, rec_lsn, key=lsns.__getitem__) :
+                ]
+            else:
+                positions = [p for p in positions if lsns[p] >= rec_lsn]
+            visited += len(positions)
+
+            page_entry = disk_pages[page]
+            page_lsn = page_entry["pageLSN"]
+            for position in positions:
+                lsn = lsns[position]
+                if lsn <= page_lsn:
+                    skipped_page_lsn += 1
+                    continue
+                page_lsn = lsn
+                page_entry["value"] = (
+                    afters[position]
+                    if flags[position] & HAS_AFTER
+                    else wal.after_image(position)
+                )
+                page_entry["pageLSN"] = lsn
+                redone.append(position)
+
+        if stats is not None:
+            stats["skipped_below_rec_lsn"] = len(lsns) - start - visited
+            stats["skipped_page_lsn"] = skipped_page_lsn
+
+        # Back in log order.
+        redone.sort()
+        return [lsns[position] for position in redone]
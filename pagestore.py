@@ -0,0 +1,182 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Iterator, Mapping, MutableMapping
+
+# Binary page file of fixed-size slots, read and written in place through mmap.
+#
+# disk_pages.json has to be parsed in full before recovery starts and rewritten
+# in full afterwards, even if redo and undo only touched a handful of pages.
+# Here every page is a 16 byte slot (pageLSN and value, both int64), so a page
+# is read or written with a single struct call, and flush() only writes back
+# the OS pages that hold slots recovery actually changed.
+#
+# Layout:
+#   header:  magic (8 bytes) | slot count (uint64) | offset of the name table (uint64)
+#   slots:   slot count * (pageLSN int64, value int64)
+#   names:   the page id of each slot, utf-8, one per line
+#
+# PageStore behaves like the disk_pages dict (disk_pages[page]["pageLSN"] and
+# so on), so redo and undo work on it unchanged.
+
+MAGIC = b"ARIESPG1"
+
+HEADER = struct.Struct("<8sQQ")
+SLOT = struct.Struct("<qq")  # pageLSN, value
+
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+
+def is_page_store(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class PageSlot(MutableMapping):
+    """One page of a PageStore, with the same keys as a disk_pages entry."""
+
+    __slots__ = ("_store", "_offset")
+
+    _FIELDS = ("pageLSN", "value")
+
+    def __init__(self, store: "PageStore", offset: int):
+        self._store = store
+        self._offset = offset
+
+    def _field(self, key: str) -> int:
+        if key not in self._FIELDS:
+            raise KeyError(key)
+        return self._FIELDS.index(key)
+
+    def __getitem__(self, key: str) -> int:
+        return SLOT.unpack_from(self._store._mm, self._offset)[self._field(key)]
+
+    def __setitem__(self, key: str, value: int) -> None:
+        field = self._field(key)
+        if type(value) is not int or not _INT64_MIN <= value <= _INT64_MAX:
+            raise ValueError(f"page slots only hold 64 bit integers, got {value!r}")
+
+        struct.pack_into("<q", self._store._mm, self._offset + 8 * field, value)
+        self._store._dirty.add(self._offset)
+
+    def __delitem__(self, key: str) -> None:
+        raise TypeError("page slots have a fixed set of fields")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._FIELDS)
+
+    def __len__(self) -> int:
+        return len(self._FIELDS)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class PageStore(Mapping):
+    """A fixed-slot page file opened through mmap, usable in place of disk_pages."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "r+b")
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+
+        magic, slot_count, names_offset = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a page store")
+
+        names = self._mm[names_offset:].decode().split("\n")[:slot_count]
+        self._slots = {
+            name: HEADER.size + i * SLOT.size for i, name in enumerate(names)
+        }
+        self._names = {offset: name for name, offset in self._slots.items()}
+
+        # Offsets of slots changed since the last flush.
+        self._dirty: set[int] = set()
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> "PageStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __getitem__(self, page: str) -> PageSlot:
+        return PageSlot(self, self._slots[page])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._slots)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def dirty_pages(self) -> list[str]:
+        # Pages changed since the last flush, in slot order.
+        return [self._names[offset] for offset in sorted(self._dirty)]
+
+    def flush(self) -> int:
+        # Write back only the OS pages holding dirty slots. Returns how many slots that was.
+        flushed = len(self._dirty)
+        os_pages = {offset - offset % mmap.PAGESIZE for offset in self._dirty}
+        # A slot can straddle two OS pages.
+        os_pages |= {
+            (offset + SLOT.size - 1) - (offset + SLOT.size - 1) % mmap.PAGESIZE
+            for offset in self._dirty
+        }
+        for start in sorted(os_pages):
+            self._mm.flush(start, min(mmap.PAGESIZE, len(self._mm) - start))
+        self._dirty.clear()
+        return flushed
+
+
+def create_page_store(path: str, pages: Mapping[str, Mapping]) -> None:
+    # Write pages ({page: {"pageLSN", "value"}}) to a new page store file.
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        names_offset = HEADER.size + len(pages) * SLOT.size
+        f.write(HEADER.pack(MAGIC, len(pages), names_offset))
+        for page, info in pages.items():
+            if "\n" in page:
+                raise ValueError(f"page ids can't contain newlines: {page!r}")
+            for field in ("pageLSN", "value"):
+                value = info[field]
+                if type(value) is not int or not _INT64_MIN <= value <= _INT64_MAX:
+                    raise ValueError(
+                        f"page {page} {field} must be a 64 bit integer, got {value!r}"
+                    )
+            f.write(SLOT.pack(info["pageLSN"], info["value"]))
+        f.write("\n".join(pages).encode())
+    os.replace(tmp_path, path)
+
+
+def import_json(json_path: str, store_path: str) -> int:
+    # disk_pages.json -> page store. Returns the number of pages.
+    with open(json_path) as f:
+        pages = json.load(f)
+    create_page_store(store_path, pages)
+    return len(pages)
+
+
+def export_json(store_path: str, json_path: str) -> int:
+    # Page store -> the disk_pages.json layout. Returns the number of pages.
+    with PageStore(store_path) as store:
+        pages = {page: dict(slot) for page, slot in store.items()}
+    with open(json_path, "w") as f:
+        json.dump(pages, f, indent=2)
+    return len(pages)
+
+
+if __name__ == "__main__":
+    # python3 pagestore.py import files/disk_pages.json files/disk_pages.bin
+    # python3 pagestore.py export files/disk_pages.bin disk_pages.json
+    if len(sys.argv) != 4 or sys.argv[1] not in ("import", "export"):
+        print(f"usage: {sys.argv[0]} import|export SRC DST", file=sys.stderr)
+        sys.exit(2)
+    convert = import_json if sys.argv[1] == "import" else export_json
+    count = convert(sys.argv[2], sys.argv[3])
+    print(f"Wrote {count} pages to {sys.argv[3]}")
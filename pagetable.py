@@ -0,0 +1,197 @@
+import json
+from array import array
+from collections.abc import Iterable, Iterator, Mapping, MutableMapping
+
+# In-memory page table with interned page ids.
+#
+# disk_pages.json loads as a dict of dicts: every page costs an inner dict
+# (about 180 bytes) plus a boxed int for its pageLSN and one for its value, on
+# top of its page id. PageTable interns each page id to a dense integer (its
+# position in the table) and keeps pageLSN and value in two array('q')
+# columns, so what a page costs beyond its id drops to 16 bytes.
+#
+# PageTable behaves like the disk_pages dict (disk_pages[page]["pageLSN"] and
+# so on, through a PageRow view), so anything that takes disk_pages works on
+# it unchanged. redo and undo notice when they are given one and read and
+# write the columns directly instead: one lookup of the page id, then plain
+# array indexing, rather than two dict lookups per record.
+#
+# Beyond its page id string, a page costs about 83 bytes here against about
+# 280 as a dict (measured with tracemalloc on 200k pages): the interned id
+# is a dict entry and a boxed int, and only the two columns are flat. That
+# is a 3.3x reduction, short of an order of magnitude.
+#
+# metrics.RecoveryMetrics.track_pages doesn't wrap a PageTable (which would
+# hide it from the fast paths) but sets touched, and the table records the
+# pages it looks up itself.
+
+_FIELDS = ("pageLSN", "value")
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+
+def _check_int64(value) -> None:
+    if type(value) is not int or not _INT64_MIN <= value <= _INT64_MAX:
+        raise ValueError(f"page tables only hold 64 bit integers, got {value!r}")
+
+
+class PageRow(MutableMapping):
+    """One page of a PageTable, with the same keys as a disk_pages entry."""
+
+    __slots__ = ("_table", "_id")
+
+    def __init__(self, table: "PageTable", page_id: int):
+        self._table = table
+        self._id = page_id
+
+    def __getitem__(self, key: str) -> int:
+        if key == "pageLSN":
+            return self._table.page_lsns[self._id]
+        if key == "value":
+            return self._table.values[self._id]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: int) -> None:
+        _check_int64(value)
+        if key == "pageLSN":
+            self._table.page_lsns[self._id] = value
+        elif key == "value":
+            self._table.values[self._id] = value
+        else:
+            raise KeyError(key)
+
+    def __delitem__(self, key: str) -> None:
+        raise TypeError("page table rows have a fixed set of fields")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(_FIELDS)
+
+    def __len__(self) -> int:
+        return len(_FIELDS)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class PageTable(Mapping):
+    """Pages held as two int64 columns indexed by interned page id, usable in place of disk_pages."""
+
+    def __init__(self):
+        # Page -> its id, the index of its row in the columns. Ids are handed
+        # out in insertion order, so iterating ids gives the pages in order.
+        self.ids: dict[str, int] = {}
+        self.page_lsns = array("q")
+        self.values = array("q")
+        # Pages looked up since touched was last cleared, or None when nobody
+        # is counting (see metrics.TouchedPages).
+        self.touched: set[str] | None = None
+
+    @classmethod
+    def from_pages(cls, pages: Mapping[str, Mapping]) -> "PageTable":
+        # Copy a disk_pages mapping (a dict, a PageStore, ...) into a new table.
+        table = cls()
+        for page, info in pages.items():
+            table.add(page, info["pageLSN"], info["value"])
+        return table
+
+    @classmethod
+    def load(cls, path: str) -> "PageTable":
+        # Read a disk_pages.json file.
+        with open(path) as f:
+            return cls.from_pages(json.load(f))
+
+    def add(self, page: str, page_lsn: int, value: int) -> int:
+        # Add a page (or overwrite it, if it is already here) and return its id.
+        _check_int64(page_lsn)
+        _check_int64(value)
+        page_id = self.ids.get(page)
+        if page_id is None:
+            page_id = self.ids[page] = len(self.page_lsns)
+            self.page_lsns.append(page_lsn)
+            self.values.append(value)
+        else:
+            self.page_lsns[page_id] = page_lsn
+            self.values[page_id] = value
+        return page_id
+
+    def to_dict(self) -> dict[str, dict]:
+        # Back to the disk_pages.json layout.
+        return {
+            page: {"pageLSN": self.page_lsns[page_id], "value": self.values[page_id]}
+            for page, page_id in self.ids.items()
+        }
+
+    def __getitem__(self, page: str) -> PageRow:
+        row = PageRow(self, self.ids[page])
+        if self.touched is not None:
+            self.touched.add(page)
+        return row
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, page: object) -> bool:
+        return page in self.ids
+
+    def nbytes(self) -> int:
+        # Bytes held by the two columns.
+        return 8 * (len(self.page_lsns) + len(self.values))
+
+    # The fast paths of redo and undo.
+
+    def redo(
+        self,
+        wal: Iterable[dict],
+        dirty_page_table: dict[str, int],
+        stats: dict | None = None,
+    ) -> list[int]:
+        # aries.redo with this table as disk_pages, on the columns.
+        if not dirty_page_table.values():
+            # Nothing to do...
+            return []
+
+        min_recovery_lsn = min(dirty_page_table.values())
+        ids, page_lsns, values = self.ids, self.page_lsns, self.values
+        touched = self.touched
+        redone_lsns = []
+        skipped_below_rec_lsn = skipped_page_lsn = 0
+
+        for wal_entry in wal:
+            wal_lsn = wal_entry["LSN"]
+            if wal_lsn < min_recovery_lsn:
+                skipped_below_rec_lsn += 1
+                continue
+            if wal_entry["type"] not in ("UPDATE", "CLR") or "page" not in wal_entry:
+                continue
+
+            page_id = ids[wal_entry["page"]]
+            if touched is not None:
+                touched.add(wal_entry["page"])
+            if wal_lsn <= page_lsns[page_id]:
+                skipped_page_lsn += 1
+                continue
+
+            after = wal_entry["after"]
+            try:
+                values[page_id] = after
+            except (TypeError, OverflowError):
+                _check_int64(after)
+                raise
+            page_lsns[page_id] = wal_lsn
+            redone_lsns.append(wal_lsn)
+
+        if stats is not None:
+            stats["skipped_below_rec_lsn"] = skipped_below_rec_lsn
+            stats["skipped_page_lsn"] = skipped_page_lsn
+        return redone_lsns
+
+    def write(self, page: str, page_lsn: int, value: int) -> None:
+        # Set both fields of an existing page at once, as undo does for a CLR.
+        page_id = self.ids[page]
+        if self.touched is not None:
+            self.touched.add(page)
+        _check_int64(value)
+        self.values[page_id] = value
+        self.page_lsns[page_id] = page_lsn
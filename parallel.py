@@ -0,0 +1,332 @@
+import bisect
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
+
+import aries
+from binwal import BinaryWal
+from segments import SegmentedWal
+from walfile import WalFile
+
+# Parallel versions of the recovery phases.
+#
+# A WAL file is split into byte ranges at the record offsets its index knows
+# (the LSN samples, or the segment starts of a segmented WAL), one range per
+# worker, and each worker opens the file and reads, decodes and filters its own
+# range. Only small per-range results cross process boundaries. Anything that
+# can't be split that way (an in-memory log, a WAL without an index, a WAL with
+# records appended in memory) is recovered serially.
+#
+# Redo: an UPDATE is redone iff its LSN is above its page's pageLSN so far,
+# i.e. above the page's pageLSN on disk and the LSN of every earlier update to
+# the page. So a worker only keeps, per page, the updates in its range whose
+# LSN is above every earlier one there (in a well-formed log, all of them), as
+# (offset, LSN), plus the after-image of the last. The parent drops the ones
+# that the disk or an earlier range already got past and merges the pages by
+# largest pageLSN, which leaves every page where the serial redo leaves it.
+#
+# Analysis: each byte range of the log from the last checkpoint on is a chunk,
+# summarized by its worker on its own, without knowing the tables it starts
+# from; only the summaries come back. A summary says what the chunk does to any
+# starting tables:
+#   reset    the chunk has a checkpoint, so the tables before it don't matter
+#   tt       per transaction, either a whole entry (BEGIN, or the transaction
+#            is known to be gone) or a patch of the fields the chunk sets
+#   fresh    the transactions whose tt entry is whole
+#   removed  transactions that ENDed in the chunk, popped from earlier tables
+#   dpt      pages first dirtied in the chunk, with their first LSN
+#   ended    ENDed transactions in log order
+# Two adjacent summaries merge into the summary of both chunks (_merge_analysis),
+# so the chunks can be summarized in any order and folded left to right. Merging
+# keeps the earliest recLSN, the latest status and lastLSN, drops what was
+# ENDed, and even keeps the dict order the serial analysis would produce.
+
+
+def _byte_ranges(
+    wal, wal_index, start_offset: int | None, workers: int
+) -> list[tuple[int | None, int | None]] | None:
+    # Up to workers (start offset, end offset) ranges that cover the WAL file
+    # from start_offset on, each starting on a record; the last one runs to the
+    # end of the file (end None). None if the WAL can't be split (see above).
+    if (
+        workers <= 1
+        or wal_index is None
+        or not isinstance(wal, (WalFile, BinaryWal, SegmentedWal))
+        or wal.tail
+    ):
+        return None
+    offsets = wal_index.split_offsets(start_offset)
+    if not offsets:
+        # Too short to cut anywhere.
+        return None
+    cuts = sorted({offsets[i * len(offsets) // workers] for i in range(1, workers)})
+    starts = [start_offset] + cuts
+    # Stop where the parent stopped, in case the file has grown since it was opened.
+    ends = cuts + [getattr(wal, "size", None)]
+    return list(zip(starts, ends))
+
+
+def _read_counts(wal) -> dict[str, int | dict[str, int]]:
+    # What a worker's WAL read, to add to the parent's counters (see metrics.py).
+    return {
+        name: getattr(wal, name)
+        for name in ("decoded", "skimmed", "segment_opens", "bytes_read")
+        if hasattr(wal, name)
+    }
+
+
+def _add_read_counts(wal, counts: dict[str, int | dict[str, int]]) -> None:
+    for name, count in counts.items():
+        if isinstance(count, dict):
+            # Per segment counts (SegmentedWal.segment_opens).
+            totals = getattr(wal, name)
+            for key, value in count.items():
+                totals[key] = totals.get(key, 0) + value
+        else:
+            setattr(wal, name, getattr(wal, name) + count)
+
+
+def _redo_range(
+    path: str,
+    start_offset: int | None,
+    end_offset: int | None,
+    min_recovery_lsn: int,
+) -> tuple[dict[str, list[tuple[int, int]]], dict[str, object], int, int, dict]:
+    # Runs in a worker. Returns, per page, the (offset, LSN) of the updates in
+    # the range that are above every earlier one on their page and the
+    # after-image of the last of them, then how many redoable records and how
+    # many records below min_recovery_lsn the range has, and the read counts.
+    updates: dict[str, list[tuple[int, int]]] = {}
+    afters: dict[str, object] = {}
+    redoable = skipped_below_rec_lsn = 0
+
+    with aries._load_wal(path) as wal:
+        for offset, _, lsn, record_type, raw in wal.scan_lazy(start_offset, end_offset):
+            if lsn < min_recovery_lsn:
+                skipped_below_rec_lsn += 1
+                continue
+            if record_type not in ("UPDATE", "CLR"):
+                continue
+            wal_entry = wal.decode_raw(raw)
+            if not aries.is_redoable(wal_entry):
+                continue
+            redoable += 1
+
+            wal_page = wal_entry["page"]
+            page_updates = updates.get(wal_page)
+            if page_updates is None:
+                updates[wal_page] = [(offset, lsn)]
+            elif lsn > page_updates[-1][1]:
+                page_updates.append((offset, lsn))
+            else:
+                # Never redone: an earlier update already took the page past it.
+                continue
+            afters[wal_page] = wal_entry["after"]
+
+        return updates, afters, redoable, skipped_below_rec_lsn, _read_counts(wal)
+
+
+def redo_parallel(
+    wal,
+    dirty_page_table: dict[str, int],
+    disk_pages: dict[str, dict],
+    workers: int,
+    stats: dict | None = None,
+    wal_index=None,
+) -> list[int]:
+    # Same result (and stats) as redo() over the log from the smallest recLSN
+    # (where wal_index says it starts), but the byte ranges of a WAL file are
+    # read and replayed on a process pool.
+    if not dirty_page_table.values():
+        # Nothing to do...
+        return []
+
+    min_recovery_lsn = min(dirty_page_table.values())
+    start_offset = None
+    if wal_index is not None:
+        start_offset = wal_index.offset_for_lsn(min_recovery_lsn)
+
+    ranges = _byte_ranges(wal, wal_index, start_offset, workers)
+    if ranges is None:
+        records = wal
+        if hasattr(wal, "records_from"):
+            records = aries.redo_records_from(wal, start_offset, min_recovery_lsn)
+        return aries.redo(records, dirty_page_table, disk_pages, stats)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_redo_range, wal.path, start, end, min_recovery_lsn)
+            for start, end in ranges
+        ]
+        results = [future.result() for future in futures]
+
+    # Fold the ranges in log order: page -> (pageLSN, value) so far.
+    redone: list[tuple[int, int]] = []
+    final: dict[str, tuple[int, object]] = {}
+    redoable = skipped_below_rec_lsn = 0
+    for updates, afters, range_redoable, range_skipped, counts in results:
+        redoable += range_redoable
+        skipped_below_rec_lsn += range_skipped
+        _add_read_counts(wal, counts)
+
+        for wal_page, page_updates in updates.items():
+            page_lsn = final[wal_page][0] if wal_page in final else None
+            if page_lsn is None:
+                page_lsn = disk_pages[wal_page]["pageLSN"]
+            first = bisect.bisect_right(page_updates, page_lsn, key=lambda u: u[1])
+            if first < len(page_updates):
+                redone.extend(page_updates[first:])
+                final[wal_page] = page_updates[-1][1], afters[wal_page]
+
+    for wal_page, (page_lsn, value) in final.items():
+        page = disk_pages[wal_page]
+        page["value"] = value
+        page["pageLSN"] = page_lsn
+
+    if stats is not None:
+        stats["skipped_below_rec_lsn"] = skipped_below_rec_lsn
+        stats["skipped_page_lsn"] = redoable - len(redone)
+
+    # Put the redone LSNs back in the order the serial redo would have found them.
+    redone.sort()
+    return [wal_lsn for _, wal_lsn in redone]
+
+
+def _empty_summary(reset: bool) -> dict:
+    return {
+        "reset": reset,
+        "tt": {},
+        "fresh": set(),
+        "removed": set(),
+        "dpt": {},
+        "ended": [],
+    }
+
+
+def _chunk_entry(summary: dict, tx: str, lsn: int) -> dict:
+    # The chunk's version of aries._transaction_entry. If we know the
+    # transaction isn't in the table (after a checkpoint or an END) it starts
+    # out running, like there; otherwise we only record what the chunk changes.
+    transaction_table = summary["tt"]
+    if tx not in transaction_table:
+        if summary["reset"] or tx in summary["removed"]:
+            transaction_table[tx] = {"status": "RUNNING", "lastLSN": lsn}
+            summary["fresh"].add(tx)
+        else:
+            transaction_table[tx] = {"lastLSN": lsn}
+    return transaction_table[tx]
+
+
+def _analysis_chunk(records: Iterable[dict]) -> dict:
+    # Same cases as aries.analysis, but into a summary.
+    summary = _empty_summary(reset=False)
+
+    for wal_entry in records:
+        match wal_entry:
+            case {"type": "CHECKPOINT", "DPT": dpt_snapshot, "TT": tt_snapshot}:
+                summary = _empty_summary(reset=True)
+                summary["dpt"] = dict(dpt_snapshot)
+                summary["tt"] = {tx: dict(info) for tx, info in tt_snapshot.items()}
+                summary["fresh"] = set(summary["tt"])
+            case {"LSN": lsn, "type": "BEGIN", "tx": tx}:
+                summary["tt"][tx] = {"status": "RUNNING", "lastLSN": lsn}
+                summary["fresh"].add(tx)
+            case {"LSN": lsn, "type": "UPDATE" | "CLR", "tx": tx, "page": page}:
+                _chunk_entry(summary, tx, lsn)["lastLSN"] = lsn
+                if page not in summary["dpt"]:
+                    summary["dpt"][page] = lsn
+            case {"LSN": lsn, "type": "COMMIT", "tx": tx}:
+                entry = _chunk_entry(summary, tx, lsn)
+                entry["lastLSN"] = lsn
+                entry["status"] = "COMMITTED"
+            case {"LSN": lsn, "type": "ABORT", "tx": tx}:
+                entry = _chunk_entry(summary, tx, lsn)
+                entry["lastLSN"] = lsn
+                entry["status"] = "ABORTED"
+            case {"LSN": _, "type": "END", "tx": tx}:
+                summary["tt"].pop(tx, None)
+                summary["fresh"].discard(tx)
+                summary["removed"].add(tx)
+                summary["ended"].append(tx)
+
+    return summary
+
+
+def _merge_analysis(earlier: dict, later: dict) -> dict:
+    # The summary of two adjacent chunks, earlier then later.
+    if later["reset"]:
+        return later
+
+    transaction_table = {tx: dict(entry) for tx, entry in earlier["tt"].items()}
+    fresh = earlier["fresh"] - later["removed"]
+    for tx in later["removed"]:
+        transaction_table.pop(tx, None)
+
+    for tx, entry in later["tt"].items():
+        if tx in later["fresh"]:
+            # A BEGIN replaces the entry (but keeps its place), like the serial one.
+            transaction_table[tx] = dict(entry)
+            fresh.add(tx)
+        elif tx in transaction_table:
+            transaction_table[tx].update(entry)
+        elif earlier["reset"] or tx in earlier["removed"]:
+            # Known not to be in the table, so it starts out running.
+            transaction_table[tx] = {"status": "RUNNING", "lastLSN": None}
+            transaction_table[tx].update(entry)
+            fresh.add(tx)
+        else:
+            transaction_table[tx] = dict(entry)
+
+    dirty_page_table = dict(earlier["dpt"])
+    for page, rec_lsn in later["dpt"].items():
+        # The earliest recLSN wins.
+        dirty_page_table.setdefault(page, rec_lsn)
+
+    return {
+        "reset": earlier["reset"],
+        "tt": transaction_table,
+        "fresh": fresh,
+        "removed": earlier["removed"] | later["removed"],
+        "dpt": dirty_page_table,
+        "ended": earlier["ended"] + later["ended"],
+    }
+
+
+def _analysis_range(
+    path: str, start_offset: int | None, end_offset: int | None
+) -> tuple[dict, dict]:
+    # Runs in a worker. The summary of one byte range, and the read counts.
+    with aries._load_wal(path) as wal:
+        summary = _analysis_chunk(
+            wal.decode_raw(raw) for *_, raw in wal.scan_lazy(start_offset, end_offset)
+        )
+        return summary, _read_counts(wal)
+
+
+def analysis_parallel(wal, workers: int, wal_index=None) -> tuple[dict, dict, list]:
+    # Same result as aries.analysis() over the log from its last checkpoint
+    # (where wal_index says it is), but the byte ranges of a WAL file are read
+    # and summarized on a process pool.
+    start_offset = None
+    if wal_index is not None:
+        start_offset = wal_index.last_checkpoint_offset()
+
+    ranges = _byte_ranges(wal, wal_index, start_offset, workers)
+    if ranges is None:
+        records = wal
+        if hasattr(wal, "records_from"):
+            records = wal.records_from(start_offset)
+        return aries.analysis(records)
+
+    # The tables before the first record are empty, which is a summary too.
+    summary = _empty_summary(reset=True)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_analysis_range, wal.path, start, end)
+            for start, end in ranges
+        ]
+        for future in futures:
+            range_summary, counts = future.result()
+            _add_read_counts(wal, counts)
+            summary = _merge_analysis(summary, range_summary)
+
+    return summary["tt"], summary["dpt"], summary["ended"]
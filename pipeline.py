@@ -0,0 +1,199 @@
+import queue
+import threading
+from collections.abc import Iterator
+
+import aries
+from delta import PageOriginals
+
+# Pipelined analysis and redo.
+#
+# The serial recovery decodes the log from the last checkpoint for analysis,
+# and then decodes it all over again from the smallest recLSN for redo. Here a
+# reader thread decodes the log once, in batches, into a bounded queue. The
+# main thread runs analysis over the batches and hands the same batches on to
+# a redo thread, so file reads, analysis and redo overlap and nothing is
+# decoded twice. (All three share the GIL, so what overlaps is mostly the I/O.)
+#
+# Redo only needs the smallest recLSN from analysis. Dirty page table entries
+# are only ever added, with the LSN of the record that added them, so once the
+# table has an entry (from the checkpoint, or the first update after it) the
+# smallest recLSN can't change unless LSNs go backward in the log. Redo starts
+# at that point. Analysis checks its final dirty page table afterward, and if
+# the smallest recLSN did change after all, the pages redo touched are put back
+# the way they were and the serial redo runs instead.
+#
+# Only the records in the file are read; at the start of recovery nothing has
+# been appended to the WAL in memory yet.
+
+PIPELINE_BATCH_SIZE = 1024  # Records per batch.
+PIPELINE_DEPTH = 8  # Batches that can wait in a queue before its producer blocks.
+
+_DONE = object()
+
+
+class _Failure:
+    # Carries an exception from a producer thread to its consumer.
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def _start(target, *args) -> threading.Thread:
+    # Daemon threads, so one blocked on a full queue can't keep us from exiting.
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+def _read_batches(
+    wal, start_offset: int | None, batch_size: int, out: queue.Queue
+) -> None:
+    # Reader thread: put lists of (offset, record) on out, then _DONE.
+    try:
+        batch = []
+        for offset, _, record in wal.scan(start_offset):
+            batch.append((offset, record))
+            if len(batch) == batch_size:
+                out.put(batch)
+                batch = []
+        if batch:
+            out.put(batch)
+        out.put(_DONE)
+    except BaseException as error:
+        out.put(_Failure(error))
+
+
+def _drain(batches: queue.Queue) -> Iterator[list[tuple[int, dict]]]:
+    while True:
+        batch = batches.get()
+        if batch is _DONE:
+            return
+        if isinstance(batch, _Failure):
+            raise batch.error
+        yield batch
+
+
+class _RedoThread:
+    """aries.redo on its own thread, fed batches of (offset, record) through a queue."""
+
+    def __init__(self, wal, wal_index, dirty_page_table, pages, depth, read_until):
+        self.min_recovery_lsn = min(dirty_page_table.values())
+        # Every record before this offset has a smaller LSN, like in the serial redo.
+        self.start_offset = wal_index.offset_for_lsn(self.min_recovery_lsn)
+        self.wal = wal
+        self.read_until = read_until
+        self.batches: queue.Queue = queue.Queue(maxsize=depth)
+        self.pages = PageOriginals(pages)
+        self.stats: dict = {}
+        self.redone_lsns: list[int] = []
+        self.error: BaseException | None = None
+        self.thread = _start(self._run, dict(dirty_page_table))
+
+    def _records(self) -> Iterator[dict]:
+        if self.read_until is not None and (self.start_offset or 0) < self.read_until:
+            # Redo starts before the checkpoint analysis started at. Nobody has
+            # decoded these records yet, so read them here.
+            for offset, _, record in self.wal.scan(self.start_offset):
+                if offset >= self.read_until:
+                    break
+                yield record
+        start_offset = self.start_offset or 0
+        for batch in _drain(self.batches):
+            for offset, record in batch:
+                if offset >= start_offset:
+                    yield record
+
+    def _run(self, dirty_page_table: dict[str, int]) -> None:
+        try:
+            self.redone_lsns = aries.redo(
+                self._records(), dirty_page_table, self.pages, self.stats
+            )
+        except BaseException as error:
+            self.error = error
+            # Keep taking batches so the main thread never blocks on us.
+            while self.batches.get() is not _DONE:
+                pass
+
+    def finish(self) -> list[int]:
+        self.batches.put(_DONE)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.redone_lsns
+
+
+def recover_pipelined(
+    wal,
+    wal_index,
+    disk_pages,
+    stats: dict | None = None,
+    batch_size: int = PIPELINE_BATCH_SIZE,
+    depth: int = PIPELINE_DEPTH,
+) -> tuple[dict, dict, list, list[int]]:
+    # Same as aries.analysis from the last checkpoint followed by aries.redo
+    # from the smallest recLSN: returns the transaction table, dirty page
+    # table, ended transactions and redone LSNs, and fills in the redo stats.
+    checkpoint_offset = wal_index.last_checkpoint_offset()
+    batches: queue.Queue = queue.Queue(maxsize=depth)
+    reader = _start(_read_batches, wal, checkpoint_offset, batch_size, batches)
+
+    redo_thread: _RedoThread | None = None
+    # Batches read before redo could start.
+    waiting: list[list[tuple[int, dict]]] = []
+
+    def analyzed_records() -> Iterator[dict]:
+        nonlocal redo_thread
+        for batch in _drain(batches):
+            if redo_thread is not None:
+                redo_thread.batches.put(batch)
+                yield from (record for _, record in batch)
+                continue
+
+            waiting.append(batch)
+            for _, record in batch:
+                yield record
+                if redo_thread is not None:
+                    continue
+                # Did this record give the dirty page table its first entry?
+                match record:
+                    case {
+                        "type": "CHECKPOINT",
+                        "DPT": dpt_snapshot,
+                        "TT": _,
+                    } if dpt_snapshot:
+                        first_entries = dpt_snapshot
+                    case {"LSN": lsn, "type": "UPDATE" | "CLR", "tx": _, "page": page}:
+                        first_entries = {page: lsn}
+                    case _:
+                        continue
+                redo_thread = _RedoThread(
+                    wal, wal_index, first_entries, disk_pages, depth, checkpoint_offset
+                )
+
+            if redo_thread is not None:
+                for waiting_batch in waiting:
+                    redo_thread.batches.put(waiting_batch)
+                waiting.clear()
+
+    transaction_table, dirty_page_table, ended = aries.analysis(analyzed_records())
+    redone_lsns = redo_thread.finish() if redo_thread is not None else []
+    reader.join()
+
+    min_recovery_lsn = min(dirty_page_table.values()) if dirty_page_table else None
+    started_at = redo_thread.min_recovery_lsn if redo_thread is not None else None
+    if min_recovery_lsn == started_at:
+        if redo_thread is not None and stats is not None:
+            stats.update(redo_thread.stats)
+        return transaction_table, dirty_page_table, ended, redone_lsns
+
+    # LSNs went backward somewhere, so redo started from the wrong place.
+    if redo_thread is not None:
+        redo_thread.pages.restore()
+    if min_recovery_lsn is None:
+        return transaction_table, dirty_page_table, ended, []
+    redone_lsns = aries.redo(
+        wal.records_from(wal_index.offset_for_lsn(min_recovery_lsn)),
+        dirty_page_table,
+        disk_pages,
+        stats,
+    )
+    return transaction_table, dirty_page_table, ended, redone_lsns
@@ -0,0 +1,494 @@
+import argparse
+import bz2
+import gzip
+import json
+import lzma
+import os
+import struct
+from bisect import bisect_right
+from typing import Iterator
+
+from walfile import iter_wal_lines, peek_header
+
+# Compressed WAL segments.
+#
+# Archived WALs are mostly the same few JSON keys over and over, so they
+# compress very well, and reading less from disk is most of what recovery
+# spends on I/O. A segmented WAL is a directory of numbered segment files,
+# each holding the next stretch of JSONL records (segment_size bytes of them,
+# uncompressed) compressed with a stdlib codec:
+#
+#   header:   magic (8 bytes) | codec (uint8) | flags (uint8) | 6 bytes padding
+#             | min LSN (int64) | max LSN (int64) | records (uint64)
+#             | uncompressed payload bytes (uint64)
+#   payload:  the JSONL lines, compressed as one gzip/bz2/lzma stream (or not)
+#
+# The header is never compressed, so opening a segmented WAL reads only the
+# headers. Offsets (for records_from, scan and a WAL index) are positions in
+# the concatenated uncompressed payloads, so from the headers alone
+# SegmentIndex tells analysis where the last segment with a checkpoint starts
+# and redo/undo where the first segment that can hold an LSN starts; the
+# segments before are never opened. A segment that is read is streamed
+# through its decompressor a buffer at a time, never decompressed whole,
+# except by reversed() (one segment at a time).
+#
+# Segments are written whole (see SegmentWriter), which makes them a format
+# for archived logs; the live log is still a WalFile or BinaryWal.
+
+MAGIC = b"ARIESSEG"
+HEADER = struct.Struct("<8sBB6xqqQQ")
+
+HAS_CHECKPOINT = 1  # Header flag: the segment has a CHECKPOINT record.
+
+SEGMENT_SUFFIX = ".seg"
+DEFAULT_SEGMENT_SIZE = 4 << 20  # Uncompressed bytes of records per segment.
+DEFAULT_CODEC = "gzip"
+_READ_SIZE = 1 << 16  # Decompressed bytes read at a time.
+_CACHED_SEGMENTS = 2  # Segments record_for_lsn keeps decompressed.
+
+# Codec name -> (id in the header, compress, open a reader that decompresses
+# a file from its current position on).
+CODECS = {
+    "none": (0, bytes, lambda f: f),
+    "gzip": (1, gzip.compress, lambda f: gzip.GzipFile(fileobj=f, mode="rb")),
+    "bz2": (2, bz2.compress, bz2.BZ2File),
+    "lzma": (3, lzma.compress, lzma.LZMAFile),
+}
+_CODEC_NAMES = {codec_id: name for name, (codec_id, _, _) in CODECS.items()}
+
+
+def is_segmented_wal(path: str) -> bool:
+    return os.path.isdir(path)
+
+
+def segment_paths(directory: str) -> list[str]:
+    # Segment files in log order (their names are zero-padded sequence numbers).
+    return [
+        os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if name.endswith(SEGMENT_SUFFIX)
+    ]
+
+
+def _segment_number(path: str) -> int:
+    return int(os.path.basename(path)[: -len(SEGMENT_SUFFIX)])
+
+
+class Segment:
+    """What a segment's header says about it, and where its records start."""
+
+    __slots__ = (
+        "path",
+        "codec",
+        "has_checkpoint",
+        "min_lsn",
+        "max_lsn",
+        "records",
+        "payload_bytes",
+        "start_offset",
+    )
+
+    def __init__(self, path: str, start_offset: int):
+        self.path = path
+        self.start_offset = start_offset
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+        if len(header) != HEADER.size or header[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a WAL segment")
+        (
+            _,
+            codec_id,
+            flags,
+            self.min_lsn,
+            self.max_lsn,
+            self.records,
+            self.payload_bytes,
+        ) = HEADER.unpack(header)
+        if codec_id not in _CODEC_NAMES:
+            raise ValueError(f"{path} is compressed with unknown codec {codec_id}")
+        self.codec = _CODEC_NAMES[codec_id]
+        self.has_checkpoint = bool(flags & HAS_CHECKPOINT)
+
+    @property
+    def end_offset(self) -> int:
+        return self.start_offset + self.payload_bytes
+
+
+def read_segments(directory: str) -> list[Segment]:
+    # The headers of every segment, with their offsets filled in.
+    segments = []
+    offset = 0
+    for path in segment_paths(directory):
+        segment = Segment(path, offset)
+        segments.append(segment)
+        offset = segment.end_offset
+    return segments
+
+
+class SegmentWriter:
+    """Appends records to a segmented WAL, rolling over to a new segment every segment_size bytes."""
+
+    def __init__(
+        self,
+        directory: str,
+        codec: str = DEFAULT_CODEC,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+    ):
+        if codec not in CODECS:
+            raise ValueError(f"unknown codec {codec!r}, expected one of {list(CODECS)}")
+        self.directory = directory
+        self.codec = codec
+        self.segment_size = segment_size
+        os.makedirs(directory, exist_ok=True)
+        self.segments_written = 0
+        # After the highest existing number, not the count: numbering can have
+        # gaps (e.g. once old segments are archived).
+        numbers = [_segment_number(path) for path in segment_paths(directory)]
+        self._next_number = max(numbers, default=0) + 1
+        self._reset()
+
+    def _reset(self) -> None:
+        self._lines: list[bytes] = []
+        self._size = 0
+        self._min_lsn: int | None = None
+        self._max_lsn: int | None = None
+        self._flags = 0
+
+    def __enter__(self) -> "SegmentWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def append(self, record: dict) -> None:
+        self.append_line(json.dumps(record).encode())
+
+    def append_line(
+        self, line: bytes, lsn: int | None = None, record_type: str | None = None
+    ) -> None:
+        # Append one JSONL record as it is, without its newline.
+        record = None
+        if lsn is None:
+            header = peek_header(line)
+            if header is None:
+                record = json.loads(line)
+                header = record["LSN"], record.get("type")
+            lsn, record_type = header
+
+        self._lines.append(line)
+        self._size += len(line) + 1
+        if self._min_lsn is None or lsn < self._min_lsn:
+            self._min_lsn = lsn
+        if self._max_lsn is None or lsn > self._max_lsn:
+            self._max_lsn = lsn
+        if record_type == "CHECKPOINT":
+            # Only a checkpoint with its tables lets analysis start there.
+            match record or json.loads(line):
+                case {"DPT": _, "TT": _}:
+                    self._flags |= HAS_CHECKPOINT
+        if self._size >= self.segment_size:
+            self.roll()
+
+    def roll(self) -> None:
+        # Write out the records so far as a segment of their own.
+        if not self._lines:
+            return
+        codec_id, compress, _ = CODECS[self.codec]
+        payload = b"\n".join(self._lines) + b"\n"
+        header = HEADER.pack(
+            MAGIC,
+            codec_id,
+            self._flags,
+            self._min_lsn,
+            self._max_lsn,
+            len(self._lines),
+            len(payload),
+        )
+        path = os.path.join(self.directory, f"{self._next_number:08d}{SEGMENT_SUFFIX}")
+        # Write to the side and link it into place so a crash never leaves half
+        # a segment behind. Unlike a rename, linking fails if the segment
+        # already exists, rather than silently replacing it.
+        with open(path + ".tmp", "wb") as f:
+            f.write(header)
+            f.write(compress(payload))
+        try:
+            os.link(path + ".tmp", path)
+        finally:
+            os.remove(path + ".tmp")
+
+        self._next_number += 1
+        self.segments_written += 1
+        self._reset()
+
+    def close(self) -> None:
+        self.roll()
+
+
+def convert_jsonl_to_segments(
+    jsonl_path: str,
+    directory: str,
+    codec: str = DEFAULT_CODEC,
+    segment_size: int = DEFAULT_SEGMENT_SIZE,
+) -> int:
+    # Append a JSONL WAL to a segmented WAL. Returns how many segments were written.
+    with SegmentWriter(directory, codec, segment_size) as writer:
+        for _, line in iter_wal_lines(jsonl_path):
+            writer.append_line(line.rstrip(b"\r"))
+    return writer.segments_written
+
+
+class SegmentIndex:
+    """Where analysis and redo start in a segmented WAL, from the segment headers alone.
+
+    Answers the same questions as a walindex.WalIndex, a segment at a time.
+    """
+
+    def __init__(self, segments: list[Segment]):
+        self.segments = segments
+
+    def last_checkpoint_offset(self) -> int | None:
+        # Where analysis can start: the last segment with a checkpoint. The
+        # records before the checkpoint in it are overridden by the checkpoint.
+        for segment in reversed(self.segments):
+            if segment.has_checkpoint:
+                return segment.start_offset
+        return None
+
+    def offset_for_lsn(self, lsn: int) -> int | None:
+        # The start of the first segment that can hold lsn: every record before
+        # it has a smaller LSN. None means the start of the log.
+        max_lsn = None
+        for segment in self.segments:
+            if segment.records and (max_lsn is None or segment.max_lsn > max_lsn):
+                max_lsn = segment.max_lsn
+            if max_lsn is not None and max_lsn >= lsn:
+                return segment.start_offset or None
+        return self.segments[-1].end_offset if self.segments else None
+
+    def split_offsets(self, start_offset: int | None) -> list[int]:
+        # Where the log past start_offset can be cut into ranges: the start of
+        # every later segment.
+        return [
+            segment.start_offset
+            for segment in self.segments
+            if segment.start_offset > (start_offset or 0)
+        ]
+
+
+class SegmentedWal:
+    """A directory of compressed WAL segments, read through streaming decompression.
+
+    Has the same interface as walfile.WalFile. Records appended in memory
+    (CLRs from undo) come after the last segment.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.segments = read_segments(path)
+        self._starts = [segment.start_offset for segment in self.segments]
+        self.tail: list[dict] = []
+        # Records parsed so far, and records scan_lazy went past without
+        # parsing them (yet), for instrumentation. For the same, segment path
+        # -> how many times it was opened and run through its decompressor,
+        # and the (compressed) bytes read over all of those opens.
+        self.decoded = 0
+        self.skimmed = 0
+        self.segment_opens: dict[str, int] = {}
+        self.bytes_read = 0
+        # Segment path -> {LSN: raw record} for record_for_lsn, oldest first.
+        self._cache: dict[str, dict[int, bytes | dict]] = {}
+
+    def close(self) -> None:
+        # Nothing is held open between reads; here to match BinaryWal.
+        pass
+
+    def __enter__(self) -> "SegmentedWal":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def index(self) -> SegmentIndex:
+        return SegmentIndex(self.segments)
+
+    def read_snapshot(self) -> tuple[dict[str, int], int]:
+        # Where the read counters are now, for reads_since.
+        return dict(self.segment_opens), self.bytes_read
+
+    def reads_since(
+        self, snapshot: tuple[dict[str, int], int] | None = None
+    ) -> dict[str, int]:
+        # What was read since read_snapshot() returned snapshot (or since the
+        # WAL was opened): how many distinct segments, how many times segments
+        # were opened, and the compressed bytes. A segment that is read again
+        # (by a later phase, or undo's backward pass) is opened and its bytes
+        # are counted again, but it is still one segment.
+        opens, bytes_read = snapshot or ({}, 0)
+        return {
+            "segments_read": sum(
+                count > opens.get(path, 0) for path, count in self.segment_opens.items()
+            ),
+            "segment_opens": sum(self.segment_opens.values()) - sum(opens.values()),
+            "compressed_bytes_read": self.bytes_read - bytes_read,
+        }
+
+    def _segment_lines(
+        self, segment: Segment, start_offset: int
+    ) -> Iterator[tuple[int, bytes]]:
+        # (offset, raw line) for the lines of one segment from start_offset on.
+        # Lines before start_offset still have to go through the decompressor.
+        _, _, open_reader = CODECS[segment.codec]
+        with open(segment.path, "rb") as f:
+            self.segment_opens[segment.path] = (
+                self.segment_opens.get(segment.path, 0) + 1
+            )
+            try:
+                f.seek(HEADER.size)
+                reader = open_reader(f)
+                offset = segment.start_offset
+                pending = b""
+                while True:
+                    chunk = reader.read(_READ_SIZE)
+                    if not chunk:
+                        break
+                    buffer = pending + chunk
+                    line_start = 0
+                    while True:
+                        newline = buffer.find(b"\n", line_start)
+                        if newline == -1:
+                            break
+                        line = buffer[line_start:newline]
+                        if offset + line_start >= start_offset and line.strip():
+                            yield offset + line_start, line
+                        line_start = newline + 1
+                    offset += line_start
+                    pending = buffer[line_start:]
+                if pending.strip() and offset >= start_offset:
+                    yield offset, pending
+            finally:
+                self.bytes_read += f.tell()
+
+    def _lines(
+        self, start_offset: int | None, end_offset: int | None = None
+    ) -> Iterator[tuple[int, bytes]]:
+        start_offset = start_offset or 0
+        # Segments that end at or before start_offset, or start at or after
+        # end_offset, are never opened.
+        first = max(0, bisect_right(self._starts, start_offset) - 1)
+        for segment in self.segments[first:]:
+            if end_offset is not None and segment.start_offset >= end_offset:
+                return
+            if segment.end_offset <= start_offset:
+                continue
+            for offset, line in self._segment_lines(segment, start_offset):
+                if end_offset is not None and offset >= end_offset:
+                    return
+                yield offset, line
+
+    def scan(self, start_offset: int | None = None) -> Iterator[tuple[int, int, dict]]:
+        # (offset, end offset, record) for every on-disk record from start_offset on.
+        for offset, line in self._lines(start_offset):
+            self.decoded += 1
+            yield offset, offset + len(line) + 1, json.loads(line)
+
+    def scan_lazy(
+        self, start_offset: int | None = None, end_offset: int | None = None
+    ) -> Iterator[tuple[int, int, int, str, bytes | dict]]:
+        # (offset, end offset, LSN, type, raw) for every on-disk record from
+        # start_offset on (up to end_offset). decode_raw(raw) gives the whole record.
+        return self._peek(self._lines(start_offset, end_offset))
+
+    def _peek(
+        self, lines: Iterator[tuple[int, bytes]]
+    ) -> Iterator[tuple[int, int, int, str, bytes | dict]]:
+        for offset, line in lines:
+            end_offset = offset + len(line) + 1
+            header = peek_header(line)
+            if header is None:
+                record = self.decode_raw(line)
+                yield offset, end_offset, record["LSN"], record.get("type"), record
+                continue
+            self.skimmed += 1
+            lsn, record_type = header
+            yield offset, end_offset, lsn, record_type, line
+
+    def _segment_records(self, segment: Segment) -> dict[int, bytes | dict]:
+        # LSN -> raw record for one segment, decompressed once while it stays cached.
+        records = self._cache.pop(segment.path, None)
+        if records is None:
+            records = {}
+            for _, _, lsn, _, raw in self._peek(self._segment_lines(segment, 0)):
+                records.setdefault(lsn, raw)
+            if len(self._cache) >= _CACHED_SEGMENTS:
+                del self._cache[next(iter(self._cache))]
+        self._cache[segment.path] = records
+        return records
+
+    def record_for_lsn(self, lsn: int) -> dict:
+        # For walindex.LsnLookup: the segment headers say which segments can
+        # hold lsn, and undo's lookups mostly stay within the last one or two.
+        # Raises KeyError if no record has this LSN.
+        for segment in self.segments:
+            if segment.records and segment.min_lsn <= lsn <= segment.max_lsn:
+                records = self._segment_records(segment)
+                if lsn in records:
+                    record = records[lsn] = self.decode_raw(records[lsn])
+                    return record
+        for record in self.tail:
+            if record["LSN"] == lsn:
+                return record
+        raise KeyError(lsn)
+
+    def decode_raw(self, raw: bytes | dict) -> dict:
+        if isinstance(raw, dict):
+            # Already parsed by scan_lazy.
+            return raw
+        self.decoded += 1
+        return json.loads(raw)
+
+    def records_from(self, start_offset: int | None) -> Iterator[dict]:
+        # Iterate the WAL starting at an offset (see SegmentIndex), None for the start.
+        for _, _, record in self.scan(start_offset):
+            yield record
+        yield from self.tail
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.records_from(None)
+
+    def __reversed__(self) -> Iterator[dict]:
+        yield from reversed(self.tail)
+        for segment in reversed(self.segments):
+            lines = [line for _, line in self._segment_lines(segment, 0)]
+            for line in reversed(lines):
+                self.decoded += 1
+                yield json.loads(line)
+
+    def append(self, record: dict) -> None:
+        self.tail.append(record)
+
+
+if __name__ == "__main__":
+    # python3 segments.py files/wal.jsonl wal.segments --codec lzma
+    parser = argparse.ArgumentParser(
+        description="Convert a JSONL WAL into compressed segments."
+    )
+    parser.add_argument("jsonl_path")
+    parser.add_argument("directory", help="segment directory, appended to if it exists")
+    parser.add_argument("--codec", choices=CODECS, default=DEFAULT_CODEC)
+    parser.add_argument(
+        "--segment-size",
+        type=int,
+        default=DEFAULT_SEGMENT_SIZE >> 20,
+        metavar="MIB",
+        help=f"uncompressed MiB of records per segment (default: {DEFAULT_SEGMENT_SIZE >> 20})",
+    )
+    args = parser.parse_args()
+
+    count = convert_jsonl_to_segments(
+        args.jsonl_path, args.directory, args.codec, args.segment_size << 20
+    )
+    size = sum(os.path.getsize(path) for path in segment_paths(args.directory))
+    print(
+        f"Wrote {count} {args.codec} segments to {args.directory} "
+        f"({os.path.getsize(args.jsonl_path)} bytes -> {size} bytes)"
+    )
@@ -0,0 +1,223 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import aries
+
+# Recovery of many independent shards at once.
+#
+# Each shard is a WAL and its disk pages, recovered exactly like main recovers
+# the default pair, in a worker process of its own. Up to --workers shards run
+# at the same time, so restarting the whole fleet takes about as long as the
+# slowest shard (given enough cores) instead of the sum of all of them.
+#
+# Shards come from either
+#   a directory  every subdirectory holding a WAL (wal.jsonl or wal.bin) and
+#                disk pages (disk_pages.json or disk_pages.bin) is a shard
+#   a manifest   a JSON list of {"name", "wal", "pages"} objects, optionally
+#                with an "out_dir"; relative paths are relative to the manifest
+#
+# Every shard gets its recovered pages (disk_pages_after.json, or
+# disk_pages_delta.jsonl with --output-format delta; a page store is recovered
+# in place), the report main prints (report.txt) and its per-phase metrics
+# (metrics.json) written to its out_dir, which defaults to the directory its
+# pages are in. A shard that fails is reported as such and doesn't stop the
+# others.
+
+WAL_NAMES = ("wal.jsonl", "wal.bin")
+PAGES_NAMES = ("disk_pages.json", "disk_pages.bin")
+
+REPORT_NAME = "report.txt"
+METRICS_NAME = "metrics.json"
+PAGES_OUT_NAME = "disk_pages_after.json"
+DELTA_OUT_NAME = "disk_pages_delta.jsonl"
+
+
+def _first_existing(directory: str, names: tuple[str, ...]) -> str | None:
+    for name in names:
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def find_shards(path: str) -> list[dict]:
+    # The shards in a shard directory or manifest (see above), sorted by name
+    # for a directory and in manifest order otherwise.
+    if os.path.isdir(path):
+        shards = []
+        for name in sorted(os.listdir(path)):
+            directory = os.path.join(path, name)
+            if not os.path.isdir(directory):
+                continue
+            wal_path = _first_existing(directory, WAL_NAMES)
+            pages_path = _first_existing(directory, PAGES_NAMES)
+            if wal_path is None or pages_path is None:
+                continue
+            shards.append(
+                {
+                    "name": name,
+                    "wal": wal_path,
+                    "pages": pages_path,
+                    "out_dir": directory,
+                }
+            )
+        return shards
+
+    with open(path) as f:
+        entries = json.load(f)
+    base = os.path.dirname(path)
+    shards = []
+    for entry in entries:
+        pages_path = os.path.join(base, entry["pages"])
+        shards.append(
+            {
+                "name": entry["name"],
+                "wal": os.path.join(base, entry["wal"]),
+                "pages": pages_path,
+                "out_dir": os.path.join(
+                    base, entry.get("out_dir", os.path.dirname(entry["pages"]))
+                ),
+            }
+        )
+    names = [shard["name"] for shard in shards]
+    if len(set(names)) != len(names):
+        raise ValueError(f"{path} names the same shard more than once")
+    return shards
+
+
+def recover_shard(shard: dict, options: list[str] = ()) -> dict:
+    # Runs in a worker: recover one shard through aries.main (with any extra
+    # command line options) and return its entry for the summary.
+    out_dir = shard["out_dir"]
+    os.makedirs(out_dir, exist_ok=True)
+    report_path = os.path.join(out_dir, REPORT_NAME)
+    metrics_path = os.path.join(out_dir, METRICS_NAME)
+    delta = aries._parse_args(list(options)).output_format == "delta"
+    argv = [
+        "--wal",
+        shard["wal"],
+        "--pages",
+        shard["pages"],
+        "--out",
+        os.path.join(out_dir, DELTA_OUT_NAME if delta else PAGES_OUT_NAME),
+        "--metrics",
+        metrics_path,
+        *options,
+    ]
+
+    result = {"name": shard["name"], "ok": True, "report": report_path}
+    start = time.perf_counter()
+    with open(report_path, "w") as report, contextlib.redirect_stdout(report):
+        try:
+            aries.main(argv)
+        except Exception as error:
+            result["ok"] = False
+            result["error"] = f"{type(error).__name__}: {error}"
+            traceback.print_exc(file=report)
+    result["wall_seconds"] = time.perf_counter() - start
+
+    if result["ok"]:
+        with open(metrics_path) as f:
+            phases = json.load(f)["phases"]
+        result["metrics"] = metrics_path
+        result["phases"] = {
+            name: phase["wall_seconds"] for name, phase in phases.items()
+        }
+        result["redone"] = phases.get("redo", phases.get("analysis_redo", {})).get(
+            "redone"
+        )
+        result["undone"] = phases["undo"]["undone"]
+    return result
+
+
+def recover_shards(shards: list[dict], workers: int, options: list[str] = ()) -> dict:
+    # Recover every shard on a pool of workers processes and return the summary:
+    # each shard's result (in the order given) plus the fleet's wall time next
+    # to the slowest shard and the sum of all of them.
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [
+            executor.submit(recover_shard, shard, list(options)) for shard in shards
+        ]
+        results = [future.result() for future in futures]
+    wall_seconds = time.perf_counter() - start
+
+    slowest = max(results, key=lambda result: result["wall_seconds"], default=None)
+    return {
+        "workers": workers,
+        "wall_seconds": wall_seconds,
+        "slowest_shard": slowest["name"] if slowest is not None else None,
+        "slowest_shard_seconds": (
+            slowest["wall_seconds"] if slowest is not None else 0.0
+        ),
+        "sum_shard_seconds": sum(result["wall_seconds"] for result in results),
+        "failed": [result["name"] for result in results if not result["ok"]],
+        "shards": results,
+    }
+
+
+def _print_summary(summary: dict) -> None:
+    print("Shard Recovery Summary:")
+    for result in summary["shards"]:
+        if result["ok"]:
+            print(
+                f"\t{result['name']}: {result['wall_seconds']:.3f}s, "
+                f"{result['redone']} redone, {result['undone']} undone"
+            )
+        else:
+            print(f"\t{result['name']}: FAILED ({result['error']})")
+    print(
+        f"\t{len(summary['shards'])} shards on {summary['workers']} workers in "
+        f"{summary['wall_seconds']:.3f}s (slowest shard "
+        f"{summary['slowest_shard_seconds']:.3f}s, all shards added up "
+        f"{summary['sum_shard_seconds']:.3f}s)"
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Recover many (WAL, disk pages) shards concurrently.",
+        epilog="Any other options are passed on to aries.py for every shard.",
+    )
+    parser.add_argument("shards", help="shard directory or JSON manifest")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        metavar="N",
+        help="recover at most N shards at a time (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--summary",
+        metavar="PATH",
+        help="also write the summary as JSON to PATH (- for stdout)",
+    )
+    args, options = parser.parse_known_args(argv)
+    # Catch bad recovery options here rather than once per shard.
+    aries._parse_args(options)
+
+    shards = find_shards(args.shards)
+    if not shards:
+        parser.error(f"no shards found in {args.shards}")
+    summary = recover_shards(shards, args.workers, options)
+
+    if args.summary == "-":
+        print(json.dumps(summary, indent=2))
+    else:
+        _print_summary(summary)
+        if args.summary is not None:
+            with open(args.summary, "w") as f:
+                json.dump(summary, f, indent=2)
+                f.write("\n")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    # python3 shards.py shards/ --workers 8 --summary summary.json
+    sys.exit(main())
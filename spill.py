@@ -0,0 +1,200 @@
+import heapq
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+from collections.abc import Iterable, Iterator, Mapping
+
+import aries
+
+# Redo for logs and page sets larger than memory.
+#
+# aries.redo applies updates in log order, so it jumps from page to page and a
+# page that doesn't fit in memory (or in the buffer pool) is read back over and
+# over. redo_spilled sorts the redo range by (page, position in the log)
+# instead, with an external merge sort: updates are buffered up to the memory
+# budget, each full buffer is sorted and spilled to a run file, and the runs
+# are merged back. Every page is then looked up once and gets its updates in
+# log order, which is all the pageLSN test needs (and is LSN order in any
+# well-formed log). The (position, LSN) of whatever was redone goes through a
+# second external sort to come back out in log order, like aries.redo returns.
+#
+# At most max_entries entries are held per sorter, also while merging: with
+# more runs than fit, runs are merged in several passes. Half of the budget
+# goes to each sorter. The budget counts buffered entries at an estimated
+# _ENTRY_BYTES each, not the pages themselves (put a buffer pool in front of
+# those) or the WAL reader's own buffer.
+
+DEFAULT_MEMORY_BUDGET = 64 << 20  # Bytes.
+
+# Rough size of one buffered (page, position, LSN, after) entry and its list slot.
+_ENTRY_BYTES = 200
+# Entries per pickled block in a run file, and the most runs merged at once
+# (each one is an open file).
+_BLOCK_ENTRIES = 1024
+_MAX_FAN_IN = 64
+
+
+def _read_run(path: str) -> Iterator[tuple]:
+    with open(path, "rb") as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            yield from block
+
+
+class ExternalSorter:
+    """Sorts any number of tuples, holding at most max_entries of them in memory."""
+
+    def __init__(self, max_entries: int, directory: str):
+        self.max_entries = max(2, max_entries)
+        self.directory = directory
+        self.block_entries = max(1, min(_BLOCK_ENTRIES, self.max_entries // 8))
+        # Merging reads one block from each run.
+        self.fan_in = max(2, min(_MAX_FAN_IN, self.max_entries // self.block_entries))
+        self.buffer: list[tuple] = []
+        self.runs: list[str] = []
+        self.count = 0
+        # Entries written to run files, merge passes included.
+        self.spilled = 0
+
+    def add(self, entry: tuple) -> None:
+        self.buffer.append(entry)
+        self.count += 1
+        if len(self.buffer) >= self.max_entries:
+            self._spill()
+
+    def _write_run(self, entries: Iterable[tuple]) -> str:
+        fd, path = tempfile.mkstemp(suffix=".run", dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            block = []
+            for entry in entries:
+                block.append(entry)
+                if len(block) == self.block_entries:
+                    pickle.dump(block, f, pickle.HIGHEST_PROTOCOL)
+                    self.spilled += len(block)
+                    block = []
+            if block:
+                pickle.dump(block, f, pickle.HIGHEST_PROTOCOL)
+                self.spilled += len(block)
+        return path
+
+    def _spill(self) -> None:
+        self.buffer.sort()
+        self.runs.append(self._write_run(self.buffer))
+        self.buffer = []
+
+    def __len__(self) -> int:
+        return self.count
+
+    def clear(self) -> None:
+        # Drop everything, run files included.
+        for run in self.runs:
+            os.remove(run)
+        self.runs = []
+        self.buffer = []
+        self.count = 0
+
+    def __iter__(self) -> Iterator[tuple]:
+        # Everything added so far, sorted. Can be iterated more than once.
+        if not self.runs:
+            # It all fit.
+            self.buffer.sort()
+            yield from self.buffer
+            return
+
+        if self.buffer:
+            self._spill()
+        while len(self.runs) > self.fan_in:
+            merging, self.runs = self.runs[: self.fan_in], self.runs[self.fan_in :]
+            self.runs.append(
+                self._write_run(heapq.merge(*(_read_run(run) for run in merging)))
+            )
+            for run in merging:
+                os.remove(run)
+        yield from heapq.merge(*(_read_run(run) for run in self.runs))
+
+
+class SpilledLsns:
+    """The LSNs redo_spilled redid, in log order, read back from its spill files.
+
+    Iterates like the list aries.redo returns. close() (or leaving the with
+    block) removes the spill files.
+    """
+
+    def __init__(self, sorter: ExternalSorter, directory: str):
+        self.sorter = sorter
+        self._cleanup = weakref.finalize(self, shutil.rmtree, directory, True)
+
+    def __len__(self) -> int:
+        return len(self.sorter)
+
+    def __iter__(self) -> Iterator[int]:
+        for _, lsn in self.sorter:
+            yield lsn
+
+    def close(self) -> None:
+        self._cleanup()
+
+    def __enter__(self) -> "SpilledLsns":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def redo_spilled(
+    wal: Iterable[dict],
+    dirty_page_table: dict[str, int],
+    disk_pages: Mapping,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET,
+    stats: dict | None = None,
+    spill_dir: str | None = None,
+) -> SpilledLsns:
+    # Same result (and stats) as aries.redo, applied page by page through an
+    # external sort that keeps about memory_budget bytes of entries in memory.
+    # Spill files go in a new directory under spill_dir (default: the system
+    # temporary directory). The stats also get how many entries were spilled.
+    directory = tempfile.mkdtemp(prefix="redo-spill-", dir=spill_dir)
+    max_entries = memory_budget // _ENTRY_BYTES // 2
+    updates = ExternalSorter(max_entries, directory)
+    redone = ExternalSorter(max_entries, directory)
+    redone_lsns = SpilledLsns(redone, directory)
+    skipped_below_rec_lsn = skipped_page_lsn = updates_spilled = 0
+
+    if dirty_page_table:
+        min_recovery_lsn = min(dirty_page_table.values())
+        for position, wal_entry in enumerate(wal):
+            if wal_entry["LSN"] < min_recovery_lsn:
+                skipped_below_rec_lsn += 1
+                continue
+            if not aries.is_redoable(wal_entry):
+                continue
+            updates.add(
+                (wal_entry["page"], position, wal_entry["LSN"], wal_entry["after"])
+            )
+
+        current_page = None
+        for wal_page, position, wal_lsn, after in updates:
+            if wal_page != current_page:
+                # Each page is looked up once, for all of its updates.
+                current_page = wal_page
+                page = disk_pages[wal_page]
+                page_lsn = page["pageLSN"]
+            if wal_lsn <= page_lsn:
+                skipped_page_lsn += 1
+                continue
+            page["value"] = after
+            page["pageLSN"] = page_lsn = wal_lsn
+            redone.add((position, wal_lsn))
+        updates_spilled = updates.spilled
+        updates.clear()
+
+    if stats is not None:
+        stats["skipped_below_rec_lsn"] = skipped_below_rec_lsn
+        stats["skipped_page_lsn"] = skipped_page_lsn
+        stats["spilled_entries"] = updates_spilled + redone.spilled
+    return redone_lsns
@@ -118,6 +118,36 @@ class TestAnalysis(unittest.TestCase):
 
         self.assertEqual(dpt["P1"], 10)
 
+    def test_starts_from_latest_checkpoint(self) -> None:
+        # T0 began before the start of the log, only the checkpoint knows about it.
+        wal = [
+            {
+                "LSN": 3,
+                "type": "UPDATE",
+                "tx": "T0",
+                "page": "P9",
+                "before": 0,
+                "after": 1,
+            },
+            {"LSN": 4, "type": "END", "tx": "T0"},
+            {"LSN": 5, "type": "BEGIN", "tx": "T1"},
+            {
+                "LSN": 10,
+                "type": "CHECKPOINT",
+                "DPT": {"P1": 7},
+                "TT": {"T1": {"status": "RUNNING", "lastLSN": 7}},
+            },
+            {"LSN": 15, "type": "COMMIT", "tx": "T1"},
+        ]
+
+        tt, dpt, ended = analysis(wal)
+
+        self.assertEqual(tt, {"T1": {"status": "COMMITTED", "lastLSN": 15}})
+        self.assertEqual(dpt, {"P1": 7})
+        self.assertEqual(ended, [])
+        # The checkpoint record itself is left untouched.
+        self.assertEqual(wal[3]["TT"]["T1"]["status"], "RUNNING")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,179 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from aries import (
+    DEFAULT_DISK_PAGES_PATH,
+    DEFAULT_WAL_FILE_PATH,
+    _load_pages,
+    _load_wal,
+    analysis,
+    redo,
+    undo,
+)
+from binwal import BinaryWal, BinaryWalWriter, convert_jsonl_to_binary, is_binary_wal
+from walfile import WalFile
+
+
+def _recover(wal, disk_pages):
+    tt, dpt, ended = analysis(wal)
+    redone = redo(wal, dpt, disk_pages)
+    undone = undo(wal, tt, disk_pages)
+    return tt, dpt, ended, redone, undone, disk_pages
+
+
+class TestBinaryWal(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.bin_path = os.path.join(self.tmp_dir, "wal.bin")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, records):
+        with open(self.bin_path, "wb") as f:
+            writer = BinaryWalWriter(f)
+            for record in records:
+                writer.append(record)
+        return BinaryWal(self.bin_path)
+
+    def test_round_trip(self) -> None:
+        records = [
+            {"LSN": 5, "type": "BEGIN", "tx": "T1"},
+            {
+                "LSN": 10,
+                "type": "UPDATE",
+                "tx": "T1",
+                "page": "P1",
+                "before": 0,
+                "after": 1,
+            },
+            {
+                "LSN": 13,
+                "type": "UPDATE",
+                "tx": "T1",
+                "prevLSN": 10,
+                "page": "P1",
+                "before": 1,
+                "after": 2,
+            },
+            {"LSN": 14, "type": "ABORT", "tx": "T1", "prevLSN": 13},
+            # Values that don't fit the packed layout fall back to JSON.
+            {
+                "LSN": 11,
+                "type": "UPDATE",
+                "tx": "T1",
+                "page": "P2",
+                "before": "a",
+                "after": [1],
+            },
+            {
+                "LSN": 12,
+                "type": "UPDATE",
+                "tx": "T1",
+                "page": "P1",
+                "before": 1,
+                "after": 1 << 70,
+            },
+            {
+                "LSN": 16,
+                "type": "CHECKPOINT",
+                "DPT": {"P1": 10},
+                "TT": {"T1": {"status": "RUNNING", "lastLSN": 12}},
+            },
+            # Unknown record types are kept as they are.
+            {"LSN": 5, "type": "COMMITTED", "tx": "T1"},
+            {"LSN": 20, "type": "CLR"},
+            {
+                "LSN": 21,
+                "type": "CLR",
+                "tx": "T1",
+                "prevLSN": 14,
+                "page": "P1",
+                "after": 1,
+                "undoNextLSN": 10,
+            },
+            {"LSN": 22, "type": "END", "tx": "T1"},
+        ]
+
+        with self._write(records) as wal:
+            self.assertEqual(list(wal), records)
+            self.assertEqual(list(reversed(wal)), records[::-1])
+
+    def test_reverse_read_resolves_interned_ids(self) -> None:
+        records = [
+            {
+                "LSN": i,
+                "type": "UPDATE",
+                "tx": f"T{i}",
+                "page": f"P{i % 3}",
+                "before": i,
+                "after": i + 1,
+            }
+            for i in range(1, 50)
+        ]
+
+        # Reading backward first means no INTERN record has been seen yet.
+        with self._write(records) as wal:
+            self.assertEqual(list(reversed(wal)), records[::-1])
+
+    def test_scan_lazy(self) -> None:
+        records = [
+            {"LSN": 1, "type": "BEGIN", "tx": "T1"},
+            {"LSN": 2, "type": "UPDATE", "tx": "T1", "page": "P1", "after": "x"},
+            {"LSN": 3, "type": "MYSTERY", "tx": "T1"},
+            {"LSN": 4, "type": "COMMIT", "tx": "T1"},
+        ]
+        with self._write(records) as wal:
+            expected = list(wal.scan())
+            wal.decoded = 0
+            scanned = list(wal.scan_lazy())
+            self.assertEqual(
+                [
+                    (offset, end, lsn, record_type)
+                    for offset, end, lsn, record_type, _ in scanned
+                ],
+                [(offset, end, r["LSN"], r["type"]) for offset, end, r in expected],
+            )
+            # Headers say everything but the type of a record stored as JSON.
+            self.assertEqual((wal.decoded, wal.skimmed), (1, 3))
+            self.assertEqual([wal.decode_raw(raw) for *_, raw in scanned], records)
+
+    def test_converter_and_detection(self) -> None:
+        count = convert_jsonl_to_binary(DEFAULT_WAL_FILE_PATH, self.bin_path)
+
+        jsonl_records = list(WalFile(DEFAULT_WAL_FILE_PATH))
+        self.assertEqual(count, len(jsonl_records))
+        self.assertTrue(is_binary_wal(self.bin_path))
+        self.assertFalse(is_binary_wal(DEFAULT_WAL_FILE_PATH))
+        self.assertIsInstance(_load_wal(DEFAULT_WAL_FILE_PATH), WalFile)
+
+        wal = _load_wal(self.bin_path)
+        self.assertIsInstance(wal, BinaryWal)
+        self.assertEqual(list(wal), jsonl_records)
+        wal.close()
+
+        # The binary encoding is smaller than the JSON one.
+        self.assertLess(
+            os.path.getsize(self.bin_path), os.path.getsize(DEFAULT_WAL_FILE_PATH)
+        )
+
+    def test_recovery_same_on_both_encodings(self) -> None:
+        convert_jsonl_to_binary(DEFAULT_WAL_FILE_PATH, self.bin_path)
+
+        from_jsonl = _recover(
+            _load_wal(DEFAULT_WAL_FILE_PATH), _load_pages(DEFAULT_DISK_PAGES_PATH)
+        )
+        with _load_wal(self.bin_path) as wal:
+            from_binary = _recover(wal, _load_pages(DEFAULT_DISK_PAGES_PATH))
+
+        self.assertEqual(from_jsonl, from_binary)
+
+    def test_rejects_jsonl(self) -> None:
+        with self.assertRaises(ValueError):
+            BinaryWal(DEFAULT_WAL_FILE_PATH)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from aries import (
+    DEFAULT_DISK_PAGES_PATH,
+    DEFAULT_WAL_FILE_PATH,
+    _load_pages,
+    _load_wal,
+    analysis,
+    redo,
+    undo,
+)
+from bufferpool import BufferPool
+from pagestore import PageStore, create_page_store
+
+
+def _pages(count):
+    return {f"P{i}": {"pageLSN": 0, "value": i} for i in range(count)}
+
+
+class TestBufferPool(unittest.TestCase):
+    def test_lru_evicts_least_recently_used(self) -> None:
+        store = _pages(4)
+        pool = BufferPool(store, 2)
+
+        pool["P0"], pool["P1"], pool["P0"]
+        pool["P2"]  # P1 is the least recently used.
+
+        self.assertEqual(list(pool._frames), ["P0", "P2"])
+        self.assertEqual(
+            pool.stats(),
+            {"frames": 2, "hits": 1, "misses": 3, "evictions": 1, "writebacks": 0},
+        )
+
+    def test_clock_gives_second_chance(self) -> None:
+        pool = BufferPool(_pages(4), 2, policy="clock")
+
+        pool["P0"], pool["P1"]
+        # Both referenced: the hand clears P0 and P1, then comes back round to P0.
+        pool["P2"]
+        self.assertEqual(list(pool._frames), ["P1", "P2"])
+
+        # P2 came in referenced, P1 had its bit cleared, so P1 goes next.
+        pool["P3"]
+        self.assertEqual(list(pool._frames), ["P2", "P3"])
+
+    def test_dirty_frames_written_back_on_eviction(self) -> None:
+        store = _pages(3)
+        pool = BufferPool(store, 1)
+
+        pool["P0"]["value"] = 100
+        self.assertEqual(store["P0"]["value"], 0)
+
+        pool["P1"]  # Evicts P0 and writes it back.
+        self.assertEqual(store["P0"]["value"], 100)
+        pool["P2"]  # P1 was only read.
+        self.assertEqual(pool.writebacks, 1)
+
+        pool["P2"]["pageLSN"] = 7
+        self.assertEqual(pool.flush(), 1)
+        self.assertEqual(store["P2"], {"pageLSN": 7, "value": 2})
+        self.assertEqual(pool.flush(), 0)
+
+    def test_pinned_frames_stay(self) -> None:
+        for policy in ("lru", "clock"):
+            pool = BufferPool(_pages(3), 2, policy=policy)
+
+            pool.pin("P0")
+            pool["P1"], pool["P2"]
+            self.assertIn("P0", pool._frames)
+
+            pool.pin("P2")
+            with self.assertRaises(RuntimeError):
+                pool["P1"]
+
+            pool.unpin("P0")
+            pool["P1"]
+            self.assertEqual(sorted(pool._frames), ["P1", "P2"])
+            with self.assertRaises(ValueError):
+                pool.unpin("P1")
+
+    def test_recovery_through_small_pool(self) -> None:
+        with _load_wal(DEFAULT_WAL_FILE_PATH) as wal:
+            records = list(wal)
+        tt, dpt, _ = analysis(records)
+
+        expected = _load_pages(DEFAULT_DISK_PAGES_PATH)
+        expected_redone = redo(records, dpt, expected)
+        expected_undone = undo(list(records), tt, expected)
+
+        for policy in ("lru", "clock"):
+            store = _load_pages(DEFAULT_DISK_PAGES_PATH)
+            # The fixture touches two pages, so one frame means evicting.
+            pool = BufferPool(store, 1, policy=policy)
+            self.assertEqual(redo(records, dpt, pool), expected_redone)
+            self.assertEqual(undo(list(records), tt, pool), expected_undone)
+            pool.flush()
+
+            self.assertEqual(store, expected)
+            self.assertGreater(pool.evictions, 0)
+
+    def test_page_store_behind_pool(self) -> None:
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, "pages.bin")
+        create_page_store(path, _pages(100))
+
+        with PageStore(path) as store:
+            pool = BufferPool(store, 4)
+            for i in range(100):
+                pool[f"P{i}"]["value"] = -i
+            pool.flush()
+
+            # Only modified frames reach the store.
+            self.assertEqual(len(store.dirty_pages()), 100)
+            self.assertEqual(store["P42"], {"pageLSN": 0, "value": -42})
+            self.assertEqual(pool.evictions, 96)
+
+        with PageStore(path) as store:
+            self.assertEqual(store["P99"]["value"], -99)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+import contextlib
+import copy
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from aries import _load_wal, analysis, main, redo, undo
+from binwal import convert_jsonl_to_binary
+from checkpoint import checkpoint_and_truncate, truncation_lsn, write_checkpoint
+from walfile import WalFile
+
+WAL = [
+    {"LSN": 1, "type": "BEGIN", "tx": "T1"},
+    {
+        "LSN": 2,
+        "type": "UPDATE",
+        "tx": "T1",
+        "prevLSN": 1,
+        "page": "P1",
+        "before": 0,
+        "after": 1,
+    },
+    {"LSN": 3, "type": "COMMIT", "tx": "T1", "prevLSN": 2},
+    {"LSN": 4, "type": "END", "tx": "T1", "prevLSN": 3},
+    {"LSN": 5, "type": "BEGIN", "tx": "T2"},
+    {"LSN": 6, "type": "BEGIN", "tx": "T3"},
+    {
+        "LSN": 7,
+        "type": "UPDATE",
+        "tx": "T3",
+        "prevLSN": 6,
+        "page": "P2",
+        "before": 0,
+        "after": 3,
+    },
+    {
+        "LSN": 8,
+        "type": "UPDATE",
+        "tx": "T2",
+        "prevLSN": 5,
+        "page": "P3",
+        "before": 0,
+        "after": 2,
+    },
+    {"LSN": 9, "type": "COMMIT", "tx": "T3", "prevLSN": 7},
+    {"LSN": 10, "type": "END", "tx": "T3", "prevLSN": 9},
+    {
+        "LSN": 11,
+        "type": "UPDATE",
+        "tx": "T2",
+        "prevLSN": 8,
+        "page": "P1",
+        "before": 1,
+        "after": 4,
+    },
+]
+
+# P1 was flushed after LSN 2, nothing else made it to disk.
+PAGES = {
+    "P1": {"pageLSN": 2, "value": 1},
+    "P2": {"pageLSN": 0, "value": 0},
+    "P3": {"pageLSN": 0, "value": 0},
+}
+
+
+def _recover(wal):
+    pages = copy.deepcopy(PAGES)
+    tt, dpt, _ = analysis(wal)
+    redone = redo(wal, dpt, pages)
+    undone = undo(wal, tt, pages)
+    return tt, dpt, redone, undone, pages
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "wal.jsonl")
+        with open(self.path, "w") as f:
+            for record in WAL:
+                f.write(json.dumps(record) + "\n")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def test_checkpoint_snapshots_tables(self) -> None:
+        tt, dpt, _ = analysis(WAL)
+
+        record = write_checkpoint(self.path, tt, dpt)
+
+        self.assertEqual(record["LSN"], 12)
+        self.assertEqual(list(WalFile(self.path))[-1], record)
+        self.assertEqual(analysis(WalFile(self.path))[:2], (tt, dpt))
+
+    def test_truncation_lsn(self) -> None:
+        # T2 is the only open transaction and it started at LSN 5.
+        tt = {"T2": {"status": "RUNNING", "lastLSN": 11}}
+        checkpoint = {"LSN": 12, "DPT": {"P1": 11, "P3": 8}, "TT": tt}
+        self.assertEqual(truncation_lsn(WAL, checkpoint), 5)
+
+        # A page dirty since before T2 began holds things back further.
+        checkpoint["DPT"]["P2"] = 3
+        self.assertEqual(truncation_lsn(WAL, checkpoint), 3)
+
+        # Nothing open: everything before the checkpoint can go.
+        self.assertEqual(truncation_lsn(WAL, {"LSN": 12, "DPT": {}, "TT": {}}), 12)
+
+    def test_recovery_unchanged_by_truncation(self) -> None:
+        bin_path = os.path.join(self.tmp_dir, "wal.bin")
+        convert_jsonl_to_binary(self.path, bin_path)
+
+        for path in (self.path, bin_path):
+            with _load_wal(path) as wal:
+                expected = _recover(wal)
+                tt, _, _ = analysis(wal)
+
+            # A log manager would know P1 was flushed at LSN 2.
+            dpt = {"P1": 11, "P2": 7, "P3": 8}
+            checkpoint, dropped, _ = checkpoint_and_truncate(
+                path, tt, dpt, truncate=True
+            )
+
+            with _load_wal(path) as wal:
+                records = list(wal)
+                self.assertEqual(dropped, 4)
+                self.assertEqual(records[0]["LSN"], 5)
+                self.assertEqual(records[-1], checkpoint)
+                _, _, _, undone, pages = _recover(wal)
+
+            # Same rollback and page contents (CLR LSNs now come after the checkpoint).
+            self.assertEqual(undone, expected[3])
+            self.assertEqual(
+                {page: info["value"] for page, info in pages.items()},
+                {page: info["value"] for page, info in expected[4].items()},
+            )
+
+    def test_archive_keeps_dropped_prefix(self) -> None:
+        tt, _, _ = analysis(WAL)
+        archive_dir = os.path.join(self.tmp_dir, "archive")
+
+        checkpoint, dropped, archive_path = checkpoint_and_truncate(
+            self.path, tt, {"P3": 8}, archive_dir=archive_dir
+        )
+
+        self.assertEqual(archive_path, os.path.join(archive_dir, "wal.jsonl.1-4"))
+        archived = list(WalFile(archive_path))
+        self.assertEqual(len(archived), dropped)
+        self.assertEqual(archived + list(WalFile(self.path)), WAL + [checkpoint])
+
+    def test_cli(self) -> None:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            main(["checkpoint", "--wal", self.path, "--truncate"])
+
+        self.assertIn("Wrote CHECKPOINT at LSN 12", out.getvalue())
+        self.assertEqual(list(WalFile(self.path))[-1]["type"], "CHECKPOINT")
+
+
+if __name__ == "__main__":
+    unittest.main()
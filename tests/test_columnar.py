@@ -0,0 +1,131 @@
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+from aries import DEFAULT_WAL_FILE_PATH, _load_wal, analysis, redo, undo
+from binwal import convert_jsonl_to_binary
+from columnar import ColumnarWal
+from walindex import LsnLookup, WalIndex
+from workload import Workload, write_workload
+
+ODD_RECORDS = [
+    {"LSN": 1, "type": "BEGIN", "tx": "T1"},
+    {"LSN": 2, "type": "UPDATE", "tx": "T1", "page": "P1", "before": "a", "after": "b"},
+    {
+        "LSN": 3,
+        "type": "CLR",
+        "tx": "T1",
+        "page": "P1",
+        "after": "a",
+        "undoNextLSN": None,
+    },
+    {
+        "LSN": 4,
+        "type": "UPDATE",
+        "tx": "T1",
+        "page": "P2",
+        "before": 0,
+        "after": 1,
+        "x": 1,
+    },
+    {"LSN": 5, "type": "MYSTERY", "tx": "T1"},
+    {"LSN": 6, "type": "CHECKPOINT", "DPT": {"P1": 2}, "TT": {}},
+    {"LSN": 7, "type": "UPDATE", "tx": "T2", "page": "P2", "before": 1, "after": 2},
+    {"LSN": 8, "type": "END", "tx": "T2"},
+]
+
+
+def _recover(wal, disk_pages):
+    pages = copy.deepcopy(disk_pages)
+    tt, dpt, ended = analysis(wal)
+    stats = {}
+    redone = redo(wal, dpt, pages, stats)
+    undone = undo(wal, tt, pages)
+    return (tt, dpt, ended), redone, stats, undone, pages
+
+
+class TestColumnarWal(unittest.TestCase):
+    def test_round_trip(self) -> None:
+        records = list(Workload(transactions=200, checkpoint_interval=50).records())
+        for source in (records, ODD_RECORDS):
+            wal = ColumnarWal.from_records(source)
+            self.assertEqual(list(wal), source)
+            self.assertEqual(list(reversed(wal)), source[::-1])
+            self.assertEqual(len(wal), len(source))
+
+        # Only the records that don't fit the columns are kept whole.
+        wal = ColumnarWal.from_records(ODD_RECORDS)
+        self.assertEqual(sorted(wal.others), [1, 2, 3, 4, 5])
+
+    def test_same_recovery_as_dicts(self) -> None:
+        for options in ({}, {"checkpoint_interval": 40, "abort_ratio": 0.3}):
+            workload = Workload(transactions=300, seed=4, **options)
+            records = list(workload.records())
+
+            expected = _recover(list(records), workload.disk_pages)
+            self.assertEqual(
+                _recover(ColumnarWal.from_records(records), workload.disk_pages),
+                expected,
+            )
+
+        pages = {page: {"pageLSN": 0, "value": 0} for page in ("P1", "P2")}
+        self.assertEqual(
+            _recover(ColumnarWal.from_records(ODD_RECORDS), pages),
+            _recover(list(ODD_RECORDS), pages),
+        )
+
+    def test_loaded_from_files(self) -> None:
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        bin_path = os.path.join(tmp_dir, "wal.bin")
+        convert_jsonl_to_binary(DEFAULT_WAL_FILE_PATH, bin_path)
+        jsonl_path = os.path.join(tmp_dir, "wal.jsonl")
+        write_workload(
+            Workload(transactions=2000, checkpoint_interval=500),
+            jsonl_path,
+            os.path.join(tmp_dir, "pages.json"),
+        )
+
+        for path in (DEFAULT_WAL_FILE_PATH, bin_path, jsonl_path):
+            with _load_wal(path) as source:
+                wal = ColumnarWal.load(source)
+                # Byte offsets of the file, so its sidecar index fits both.
+                self.assertEqual(list(wal.scan()), list(source.scan()))
+                index = WalIndex()
+                index.catch_up(wal)
+                expected_index = WalIndex()
+                expected_index.catch_up(source)
+                self.assertEqual(vars(index), vars(expected_index))
+
+                start = index.last_checkpoint_offset()
+                self.assertEqual(
+                    analysis(wal.records_from(start)),
+                    analysis(source.records_from(start)),
+                )
+
+    def test_lookup_by_lsn(self) -> None:
+        wal = ColumnarWal.from_records(ODD_RECORDS)
+        lookup = LsnLookup(wal)
+        self.assertEqual(lookup(4), ODD_RECORDS[3])
+        self.assertEqual(lookup(7), ODD_RECORDS[6])
+        with self.assertRaises(KeyError):
+            lookup(9)
+
+        # LSNs that go backward can't be binary searched.
+        records = [ODD_RECORDS[6], ODD_RECORDS[0]]
+        wal = ColumnarWal.from_records(records)
+        self.assertEqual(wal.record_for_lsn(1), ODD_RECORDS[0])
+        wal.append({"LSN": 0, "type": "END", "tx": "T1"})
+        self.assertEqual(wal.record_for_lsn(0)["type"], "END")
+
+    def test_rejects_non_string_ids(self) -> None:
+        with self.assertRaises(ValueError):
+            ColumnarWal.from_records([{"LSN": 1, "type": "BEGIN", "tx": 1}])
+        with self.assertRaises(ValueError):
+            ColumnarWal.from_records([{"LSN": 1.5, "type": "BEGIN", "tx": "T1"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
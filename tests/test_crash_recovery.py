@@ -0,0 +1,182 @@
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+from aries import _load_wal, analysis, redo, undo
+from binwal import convert_jsonl_to_binary
+from checkpoint import WalAppender
+from walfile import append_records
+
+# Crash injection: recovery is interrupted after every possible number of CLRs
+# and restarted from the WAL file it left behind, reopened from disk. Nothing
+# recovery changed in memory is assumed to have reached the disk, so every
+# restart begins from the same disk pages and has to rebuild the rest from the
+# log (the CLRs and ENDs undo appended to the file included).
+
+
+class Crash(Exception):
+    pass
+
+
+class CrashingLog:
+    # Appends to the WAL file, but crashes instead once its budget of records is used up.
+    def __init__(self, path, appends_before_crash):
+        self.appender = WalAppender(path)
+        self.appends_before_crash = appends_before_crash
+
+    def append(self, record):
+        if self.appends_before_crash == 0:
+            raise Crash()
+        if self.appends_before_crash is not None:
+            self.appends_before_crash -= 1
+        self.appender.append(record)
+
+
+def _write_wal(directory, records, binary=False):
+    path = os.path.join(directory, "wal.jsonl")
+    if os.path.exists(path):
+        os.remove(path)
+    append_records(path, records)
+    if binary:
+        binary_path = os.path.join(directory, "wal.bin")
+        if os.path.exists(binary_path):
+            os.remove(binary_path)
+        convert_jsonl_to_binary(path, binary_path)
+        return binary_path
+    return path
+
+
+def _recover(wal_path, disk_pages, appends_before_crash=None):
+    # One restart. Returns the pages, the number of records undone and whether
+    # it crashed; the WAL file keeps whatever undo logged before that.
+    log = CrashingLog(wal_path, appends_before_crash)
+    pages = copy.deepcopy(disk_pages)
+    undone_count = 0
+    try:
+        with _load_wal(wal_path) as wal:
+            tt, dpt, _ = analysis(wal)
+            redo(wal, dpt, pages)
+            undone_count = len(undo(wal, tt, pages, log=log))
+    except Crash:
+        return pages, undone_count, True
+    finally:
+        log.appender.close()
+    return pages, undone_count, False
+
+
+def _recover_with_crashes(wal_path, disk_pages, crash_after_each):
+    # Keep restarting, crashing each time after crash_after_each appends, until
+    # a restart finishes. Returns the final pages and the number of restarts.
+    restarts = 0
+    while True:
+        restarts += 1
+        pages, _, crashed = _recover(wal_path, disk_pages, crash_after_each)
+        if not crashed:
+            return pages, restarts
+
+
+def _logged(wal_path, record_type):
+    with _load_wal(wal_path) as wal:
+        return [record for record in wal if record["type"] == record_type]
+
+
+def _loser_wal(update_count, chained):
+    # T1 commits, T2 and T3 are losers with interleaved updates across 4 pages.
+    records = [
+        {"LSN": 1, "type": "BEGIN", "tx": "T1"},
+        {"LSN": 2, "type": "BEGIN", "tx": "T2"},
+        {"LSN": 3, "type": "BEGIN", "tx": "T3"},
+    ]
+    last_lsns = {"T1": 1, "T2": 2, "T3": 3}
+    for i in range(update_count):
+        lsn = 10 + i
+        tx = ("T1", "T2", "T3")[i % 3]
+        record = {
+            "LSN": lsn,
+            "type": "UPDATE",
+            "tx": tx,
+            "page": f"P{i % 4}",
+            "before": i,
+            "after": i + 1,
+        }
+        if chained:
+            record["prevLSN"] = last_lsns[tx]
+        last_lsns[tx] = lsn
+        records.append(record)
+
+    commit = {"LSN": 10 + update_count, "type": "COMMIT", "tx": "T1"}
+    if chained:
+        commit["prevLSN"] = last_lsns["T1"]
+    records.append(commit)
+
+    disk_pages = {f"P{i}": {"pageLSN": 0, "value": 0} for i in range(4)}
+    loser_updates = sum(1 for i in range(update_count) if i % 3 != 0)
+    return records, disk_pages, loser_updates
+
+
+class TestCrashDuringRecovery(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def _check(self, chained, binary=False):
+        records, disk_pages, loser_updates = _loser_wal(12, chained)
+        wal_path = _write_wal(self.tmp_dir, records, binary)
+        expected_pages, undone_count, _ = _recover(wal_path, disk_pages)
+        self.assertEqual(undone_count, loser_updates)
+
+        for crash_after in range(loser_updates):
+            # Crash once after crash_after CLRs, then recover cleanly from the file.
+            wal_path = _write_wal(self.tmp_dir, records, binary)
+            _, _, crashed = _recover(wal_path, disk_pages, crash_after)
+            self.assertTrue(crashed)
+            self.assertEqual(len(_logged(wal_path, "CLR")), crash_after)
+            pages, second_undone, crashed = _recover(wal_path, disk_pages)
+            self.assertFalse(crashed)
+
+            self.assertEqual(pages, expected_pages)
+            # The second restart only undoes what the first one didn't get to.
+            self.assertEqual(second_undone, undone_count - crash_after)
+            self.assertEqual(len(_logged(wal_path, "CLR")), undone_count)
+            self.assertEqual(
+                [end["tx"] for end in _logged(wal_path, "END")], ["T2", "T3"]
+            )
+
+            # Both losers are ENDed now, so there is nothing left to undo.
+            pages, third_undone, _ = _recover(wal_path, disk_pages)
+            self.assertEqual(pages, expected_pages)
+            self.assertEqual(third_undone, 0)
+
+    def test_crash_at_every_undo_step_with_prev_lsn_chains(self) -> None:
+        self._check(chained=True)
+
+    def test_crash_at_every_undo_step_with_backward_scan(self) -> None:
+        self._check(chained=False)
+
+    def test_crash_at_every_undo_step_binary(self) -> None:
+        self._check(chained=True, binary=True)
+
+    def test_repeated_crashes_only_cost_remaining_work(self) -> None:
+        for chained in (True, False):
+            records, disk_pages, loser_updates = _loser_wal(12, chained)
+            wal_path = _write_wal(self.tmp_dir, records)
+            expected_pages, _, _ = _recover(wal_path, disk_pages)
+
+            # Crash after every single CLR or END, over and over.
+            wal_path = _write_wal(self.tmp_dir, records)
+            pages, restarts = _recover_with_crashes(wal_path, disk_pages, 1)
+
+            self.assertEqual(pages, expected_pages)
+            # No CLR was written twice.
+            self.assertEqual(len(_logged(wal_path, "CLR")), loser_updates)
+            # Each restart gets one record further (a CLR, then an END for
+            # each loser), the last one finishes.
+            self.assertEqual(restarts, loser_updates + 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
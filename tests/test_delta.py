@@ -0,0 +1,148 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from aries import DEFAULT_DISK_PAGES_PATH, DEFAULT_WAL_FILE_PATH, main
+from delta import PageOriginals, apply_delta, read_delta, write_delta
+from pagestore import PageStore, export_json, import_json
+from workload import Workload, write_workload
+
+
+class TestDelta(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def _run(self, *argv: str) -> str:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            main(list(argv))
+        return out.getvalue()
+
+    def test_page_originals(self) -> None:
+        pages = {
+            "P1": {"pageLSN": 1, "value": 1},
+            "P2": {"pageLSN": 2, "value": 2},
+            "P3": {"pageLSN": 3, "value": 3},
+        }
+        originals = PageOriginals(pages)
+        originals["P3"]["value"] = 30
+        originals["P3"]["pageLSN"] = 9
+        # Looked up, but left as it was.
+        originals["P1"]["value"] = 1
+        # Changed and changed back.
+        originals["P2"]["value"] = 20
+        originals["P2"]["value"] = 2
+        self.assertEqual(list(originals.changed()), [("P3", 9, 30)])
+
+        originals.restore()
+        self.assertEqual(pages["P3"], {"pageLSN": 3, "value": 3})
+        self.assertEqual(list(originals.changed()), [])
+
+    def test_round_trip(self) -> None:
+        delta_path = os.path.join(self.tmp_dir, "delta.jsonl")
+        self.assertEqual(write_delta(delta_path, [("P1", 5, 7), ("P2", 6, -1)]), 2)
+        with open(delta_path) as f:
+            self.assertEqual(f.read(), '["P1",5,7]\n["P2",6,-1]\n')
+        self.assertEqual(list(read_delta(delta_path)), [("P1", 5, 7), ("P2", 6, -1)])
+
+        pages = {page: {"pageLSN": 0, "value": 0} for page in ("P1", "P2", "P3")}
+        self.assertEqual(apply_delta(pages, delta_path), 2)
+        self.assertEqual(pages["P1"], {"pageLSN": 5, "value": 7})
+        self.assertEqual(pages["P3"], {"pageLSN": 0, "value": 0})
+
+        write_delta(delta_path, [("P9", 1, 1)])
+        with self.assertRaises(KeyError):
+            apply_delta(pages, delta_path)
+
+    def test_cli_delta_matches_full_output(self) -> None:
+        workload = Workload(transactions=100, pages=200, seed=4)
+        wal_path = os.path.join(self.tmp_dir, "wal.jsonl")
+        pages_path = os.path.join(self.tmp_dir, "pages.json")
+        write_workload(workload, wal_path, pages_path)
+        full_path = os.path.join(self.tmp_dir, "full.json")
+        compact_path = os.path.join(self.tmp_dir, "compact.json")
+        delta_path = os.path.join(self.tmp_dir, "delta.jsonl")
+
+        full_report = self._run(
+            "--wal", wal_path, "--pages", pages_path, "--out", full_path
+        )
+        self._run(
+            "--wal",
+            wal_path,
+            "--pages",
+            pages_path,
+            "--out",
+            compact_path,
+            "--output-format",
+            "compact",
+        )
+        # Through a buffer pool too, which writes pages back behind our back.
+        delta_report = self._run(
+            "--wal",
+            wal_path,
+            "--pages",
+            pages_path,
+            "--out",
+            delta_path,
+            "--output-format",
+            "delta",
+            "--buffer-frames",
+            "4",
+        )
+
+        with open(full_path) as f:
+            full = json.load(f)
+        with open(compact_path) as f:
+            self.assertNotIn(" ", f.read())
+        with open(compact_path) as f:
+            self.assertEqual(json.load(f), full)
+
+        with open(pages_path) as f:
+            pages = json.load(f)
+        changed = apply_delta(pages, delta_path)
+        self.assertEqual(pages, full)
+        self.assertLess(changed, len(pages))
+        self.assertIn(f"Wrote {changed} changed pages to {delta_path}", delta_report)
+        self.assertEqual(delta_report.split("Buffer Pool")[0], full_report)
+
+    def test_cli_page_store(self) -> None:
+        store_path = os.path.join(self.tmp_dir, "pages.bin")
+        base_path = os.path.join(self.tmp_dir, "base.bin")
+        delta_path = os.path.join(self.tmp_dir, "delta.jsonl")
+        # Recovering a page store in place logs its CLRs, so work on a copy of the WAL.
+        wal_path = os.path.join(self.tmp_dir, "wal.jsonl")
+        shutil.copy(DEFAULT_WAL_FILE_PATH, wal_path)
+        import_json(DEFAULT_DISK_PAGES_PATH, store_path)
+        shutil.copy(store_path, base_path)
+
+        self._run(
+            "--wal",
+            wal_path,
+            "--pages",
+            store_path,
+            "--out",
+            delta_path,
+            "--output-format",
+            "delta",
+        )
+        with PageStore(base_path) as base:
+            self.assertEqual(apply_delta(base, delta_path), 2)
+            base.flush()
+
+        recovered_path = os.path.join(self.tmp_dir, "recovered.json")
+        applied_path = os.path.join(self.tmp_dir, "applied.json")
+        export_json(store_path, recovered_path)
+        export_json(base_path, applied_path)
+        with open(recovered_path) as f, open(applied_path) as g:
+            self.assertEqual(json.load(f), json.load(g))
+
+
+if __name__ == "__main__":
+    unittest.main()
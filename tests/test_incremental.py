@@ -0,0 +1,154 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import binwal
+from aries import (
+    DEFAULT_DISK_PAGES_PATH,
+    DEFAULT_WAL_FILE_PATH,
+    _load_wal,
+    analysis,
+    main,
+)
+from incremental import IncrementalAnalysis, follow, state_path_for
+from walfile import append_records
+from walindex import WalIndex
+from workload import Workload
+
+
+class TestIncrementalAnalysis(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.wal_path = os.path.join(self.tmp_dir, "wal.jsonl")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def _records(self, **options) -> list[dict]:
+        return list(Workload(transactions=120, seed=2, **options).records())
+
+    def test_catching_up_piece_by_piece(self) -> None:
+        records = self._records(checkpoint_interval=70, loser_ratio=0.2)
+        bin_path = os.path.join(self.tmp_dir, "wal.bin")
+        for path, append in (
+            (self.wal_path, append_records),
+            (bin_path, binwal.append_records),
+        ):
+            incremental = IncrementalAnalysis()
+            with open(path, "wb") as f:
+                if path == bin_path:
+                    f.write(binwal.MAGIC)
+            for start in range(0, len(records), 37):
+                append(path, records[start : start + 37])
+                with _load_wal(path) as wal:
+                    added = incremental.catch_up(wal, save_interval=10)
+                    self.assertEqual(added, len(records[start : start + 37]))
+                    self.assertEqual(incremental.tables(), analysis(wal))
+                    self.assertEqual(
+                        list(incremental.transaction_table), list(analysis(wal)[0])
+                    )
+            self.assertEqual(incremental.last_lsn, records[-1]["LSN"])
+            self.assertEqual(incremental.records, len(records))
+
+    def test_resumes_from_saved_state(self) -> None:
+        records = self._records()
+        append_records(self.wal_path, records[:200])
+        with _load_wal(self.wal_path) as wal:
+            self.assertEqual(IncrementalAnalysis.open(wal).records, 200)
+
+        append_records(self.wal_path, records[200:])
+        with _load_wal(self.wal_path) as wal:
+            # Only the new records are read.
+            resumed = IncrementalAnalysis.open(wal)
+            self.assertEqual(wal.decoded, len(records) - 200)
+            self.assertEqual(resumed.tables(), analysis(wal))
+
+    def test_leaves_a_partial_record_for_later(self) -> None:
+        append_records(self.wal_path, [{"LSN": 1, "type": "BEGIN", "tx": "T1"}])
+        with open(self.wal_path, "a") as f:
+            f.write('{"LSN": 2, "type": "COMMIT", "t')
+        incremental = IncrementalAnalysis()
+        with _load_wal(self.wal_path) as wal:
+            self.assertEqual(incremental.catch_up(wal), 1)
+        with open(self.wal_path, "a") as f:
+            f.write('x": "T1"}\n')
+        with _load_wal(self.wal_path) as wal:
+            self.assertEqual(incremental.catch_up(wal), 1)
+        self.assertEqual(
+            incremental.transaction_table,
+            {"T1": {"status": "COMMITTED", "lastLSN": 2}},
+        )
+
+        bin_path = os.path.join(self.tmp_dir, "wal.bin")
+        binwal.convert_jsonl_to_binary(self.wal_path, bin_path)
+        with open(bin_path, "rb+") as f:
+            f.truncate(os.path.getsize(bin_path) - 3)
+        with _load_wal(bin_path) as wal:
+            self.assertEqual(IncrementalAnalysis().catch_up(wal), 1)
+
+    def test_starts_over_when_the_log_is_rewritten(self) -> None:
+        append_records(self.wal_path, self._records()[:50])
+        with _load_wal(self.wal_path) as wal:
+            IncrementalAnalysis.open(wal)
+
+        os.remove(self.wal_path)
+        other = self._records(abort_ratio=0.5)[:80]
+        append_records(self.wal_path, other)
+        with _load_wal(self.wal_path) as wal:
+            reopened = IncrementalAnalysis.open(wal)
+            self.assertEqual(reopened.records, 80)
+            self.assertEqual(reopened.tables(), analysis(wal))
+
+    def test_starts_at_the_last_checkpoint(self) -> None:
+        records = self._records(checkpoint_interval=100)
+        append_records(self.wal_path, records)
+        with _load_wal(self.wal_path) as wal:
+            wal_index = WalIndex()
+            wal_index.catch_up(wal)
+            incremental = IncrementalAnalysis.open(wal, wal_index)
+            self.assertLess(incremental.records, 100)
+            self.assertEqual(incremental.tables(), analysis(wal))
+
+    def test_follow(self) -> None:
+        records = self._records()
+        append_records(self.wal_path, records[:10])
+        updates = follow(self.wal_path, poll_interval=0)
+        incremental, added = next(updates)
+        self.assertEqual(added, 10)
+        append_records(self.wal_path, records[10:])
+        incremental, added = next(updates)
+        self.assertEqual(added, len(records) - 10)
+        with _load_wal(self.wal_path) as wal:
+            self.assertEqual(incremental.tables(), analysis(wal))
+        self.assertTrue(os.path.exists(state_path_for(self.wal_path)))
+
+    def test_cli(self) -> None:
+        shutil.copy(DEFAULT_WAL_FILE_PATH, self.wal_path)
+        outputs = []
+        for options in ([], ["--incremental-analysis"], ["--incremental-analysis"]):
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                main(
+                    [
+                        "--wal",
+                        self.wal_path,
+                        "--pages",
+                        DEFAULT_DISK_PAGES_PATH,
+                        "--out",
+                        os.path.join(self.tmp_dir, "pages.json"),
+                    ]
+                    + options
+                )
+            outputs.append(out.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0], outputs[2])
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                main(["--incremental-analysis", "--columnar"])
+
+
+if __name__ == "__main__":
+    unittest.main()
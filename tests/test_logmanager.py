@@ -0,0 +1,178 @@
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from aries import analysis, redo, undo
+from binwal import BinaryWal, is_binary_wal
+from logmanager import LogManager
+from walfile import WalFile, append_records
+
+
+def _run_transactions(log, pages, lock, tx_names, seed, fates):
+    # Run each transaction to its fate ("commit", "abort" or "loser") against
+    # pages, the way a database would, returning the committed values.
+    rng = random.Random(seed)
+    committed = {}
+    for tx, fate in zip(tx_names, fates):
+        log.begin(tx)
+        writes = {}
+        for _ in range(3):
+            # Each thread has pages of its own, like holding their locks.
+            page = rng.choice(sorted(pages))
+            after = rng.randrange(1000)
+            with lock:
+                before = pages[page]["value"]
+                lsn = log.update(tx, page, before, after)
+                pages[page].update(value=after, pageLSN=lsn)
+            writes[page] = after
+        if fate == "commit":
+            log.commit(tx)
+            committed.update(writes)
+        elif fate == "abort":
+            for page, before, lsn in log.abort(tx):
+                with lock:
+                    pages[page].update(value=before, pageLSN=lsn)
+    return committed
+
+
+class TestLogManager(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.wal_path = os.path.join(self.tmp_dir, "wal.jsonl")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip_through_recovery(self) -> None:
+        for binary in (False, True):
+            path = os.path.join(self.tmp_dir, f"wal-{binary}")
+            disk = {f"P{i}": {"pageLSN": 0, "value": 0} for i in range(40)}
+            memory = {page: dict(info) for page, info in disk.items()}
+            lock = threading.Lock()
+            committed = {}
+
+            with LogManager(path, batch_size=4, binary=binary) as log:
+
+                def worker(n: int) -> None:
+                    # Thread n owns pages P<n>, P<n+4>, ...
+                    own = {p: memory[p] for p in memory if int(p[1:]) % 4 == n}
+                    fates = ["commit", "abort", "commit", "commit", "loser"]
+                    txs = [f"T{n}-{i}" for i in range(len(fates))]
+                    committed.update(_run_transactions(log, own, lock, txs, n, fates))
+
+                threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                log.flush()
+
+                with BinaryWal(path) if binary else WalFile(path) as wal:
+                    self.assertEqual(is_binary_wal(path), binary)
+                    tt, dpt, ended = analysis(wal)
+                    self.assertEqual(tt, log.transaction_table)
+                    self.assertEqual(dpt, log.dirty_page_table)
+                    self.assertEqual(len(ended), 16)
+                    self.assertEqual(set(tt), {f"T{n}-4" for n in range(4)})
+
+                    # Crash with nothing on disk: recovery brings back exactly
+                    # what the committed transactions wrote.
+                    redo(wal, dpt, disk)
+                    undo(wal, tt, disk)
+            self.assertEqual(
+                {page: info["value"] for page, info in disk.items()},
+                {page: committed.get(page, 0) for page in disk},
+            )
+
+    def test_group_commit(self) -> None:
+        # Eight committers, batches of eight and a long window: one fsync.
+        with LogManager(self.wal_path, batch_size=8, max_latency=10) as log:
+            threads = []
+            for n in range(8):
+                log.begin(f"T{n}")
+                log.update(f"T{n}", f"P{n}", 0, n)
+                threads.append(threading.Thread(target=log.commit, args=(f"T{n}",)))
+            start = time.monotonic()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertLess(time.monotonic() - start, 5)
+            self.assertEqual(log.commits, 8)
+            self.assertEqual(log.batches, 1)
+        with WalFile(self.wal_path) as wal:
+            self.assertEqual(len(list(wal)), 8 * 4)
+
+    def test_latency_window(self) -> None:
+        # A lone committer doesn't wait for a batch that will never fill up.
+        with LogManager(self.wal_path, batch_size=100, max_latency=0.01) as log:
+            for n in range(5):
+                log.begin(f"T{n}")
+                lsn = log.commit(f"T{n}")
+                self.assertGreaterEqual(log.durable_lsn, lsn)
+            self.assertEqual(log.batches, 5)
+
+    def test_flush_and_page_written(self) -> None:
+        with LogManager(self.wal_path, max_latency=10) as log:
+            log.begin("T1")
+            lsn = log.update("T1", "P1", 0, 5)
+            self.assertEqual(log.durable_lsn, 0)
+            log.flush(lsn)
+            self.assertEqual(log.durable_lsn, lsn)
+            with WalFile(self.wal_path) as wal:
+                self.assertEqual([r["LSN"] for r in wal], [1, 2])
+
+            log.page_written("P1")
+            self.assertEqual(log.dirty_page_table, {})
+            log.checkpoint()
+            log.flush()
+            with WalFile(self.wal_path) as wal:
+                self.assertEqual(analysis(wal)[:2], (log.transaction_table, {}))
+
+    def test_appends_to_an_existing_log(self) -> None:
+        append_records(self.wal_path, [{"LSN": 41, "type": "BEGIN", "tx": "T0"}])
+        # Unterminated last line.
+        with open(self.wal_path, "rb+") as f:
+            f.truncate(os.path.getsize(self.wal_path) - 1)
+        with LogManager(self.wal_path) as log:
+            self.assertEqual(log.begin("T1"), 42)
+        with LogManager(self.wal_path) as log:
+            self.assertEqual(log.begin("T2"), 43)
+        with WalFile(self.wal_path) as wal:
+            self.assertEqual([r["LSN"] for r in wal], [41, 42, 43])
+
+        bin_path = os.path.join(self.tmp_dir, "wal.bin")
+        with LogManager(bin_path, binary=True) as log:
+            log.begin("T1")
+            log.update("T1", "P1", 0, 1)
+        with LogManager(bin_path, binary=False) as log:
+            self.assertTrue(log.binary)
+            log.begin("T2")
+            log.update("T2", "P1", 1, 2)
+        with BinaryWal(bin_path) as wal:
+            self.assertEqual(
+                [(r["LSN"], r.get("page")) for r in wal],
+                [(1, None), (2, "P1"), (3, None), (4, "P1")],
+            )
+
+    def test_misuse(self) -> None:
+        log = LogManager(self.wal_path)
+        log.begin("T1")
+        with self.assertRaises(ValueError):
+            log.begin("T1")
+        with self.assertRaises(ValueError):
+            log.commit("T2")
+        log.abort("T1")
+        with self.assertRaises(ValueError):
+            log.update("T1", "P1", 0, 1)
+        log.close()
+        with self.assertRaises(ValueError):
+            log.begin("T3")
+
+
+if __name__ == "__main__":
+    unittest.main()
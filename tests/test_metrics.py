@@ -0,0 +1,141 @@
+import contextlib
+import io
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+from aries import (
+    DEFAULT_DISK_PAGES_PATH,
+    DEFAULT_WAL_FILE_PATH,
+    _load_wal,
+    main,
+    redo,
+)
+from binwal import convert_jsonl_to_binary
+from metrics import RecoveryMetrics
+from pagestore import import_json
+from parallel import redo_parallel
+
+WAL = [
+    {"LSN": 1, "type": "BEGIN", "tx": "T1"},
+    {"LSN": 2, "type": "UPDATE", "tx": "T1", "page": "P1", "before": 0, "after": 1},
+    {"LSN": 3, "type": "UPDATE", "tx": "T1", "page": "P2", "before": 0, "after": 2},
+    {"LSN": 4, "type": "UPDATE", "tx": "T1", "page": "P1", "before": 1, "after": 3},
+    {"LSN": 5, "type": "COMMIT", "tx": "T1"},
+]
+
+
+def _pages():
+    # P1 made it to disk after LSN 2, P2 never did.
+    return {"P1": {"pageLSN": 2, "value": 1}, "P2": {"pageLSN": 0, "value": 0}}
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def test_redo_stats(self) -> None:
+        dpt = {"P1": 2, "P2": 3}
+        for workers in (1, 2):
+            stats = {}
+            redone = redo_parallel(WAL, dpt, _pages(), workers, stats)
+            self.assertEqual(redone, [3, 4])
+            # LSN 1 is below the smallest recLSN, LSN 2 is already on P1.
+            self.assertEqual(stats, {"skipped_below_rec_lsn": 1, "skipped_page_lsn": 1})
+
+        # Without stats redo behaves as before.
+        self.assertEqual(redo(WAL, dpt, _pages()), [3, 4])
+
+    def test_decoded_counts(self) -> None:
+        bin_path = os.path.join(self.tmp_dir, "wal.bin")
+        convert_jsonl_to_binary(DEFAULT_WAL_FILE_PATH, bin_path)
+
+        for path in (DEFAULT_WAL_FILE_PATH, bin_path):
+            with _load_wal(path) as wal:
+                self.assertEqual(wal.decoded, 0)
+                records = list(wal)
+                next(reversed(wal))
+                # INTERN records of the binary format aren't counted.
+                self.assertEqual(wal.decoded, len(records) + 1)
+
+    def test_phase(self) -> None:
+        metrics = RecoveryMetrics(trace_memory=True)
+        pages = metrics.track_pages(_pages())
+        with metrics.phase("redo") as counters:
+            redo(WAL, {"P1": 2}, pages, counters)
+            list(range(10000))
+        metrics.close()
+
+        phase = metrics.to_dict()["phases"]["redo"]
+        self.assertEqual(phase["pages_touched"], 2)
+        self.assertEqual(phase["skipped_page_lsn"], 1)
+        self.assertGreater(phase["peak_traced_bytes"], 10000)
+        self.assertGreaterEqual(phase["wall_seconds"], 0)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_cli(self) -> None:
+        pages_path = os.path.join(self.tmp_dir, "pages.bin")
+        import_json(DEFAULT_DISK_PAGES_PATH, pages_path)
+        # A copy, so there is no sidecar index for it yet.
+        wal_path = os.path.join(self.tmp_dir, "wal.jsonl")
+        shutil.copy(DEFAULT_WAL_FILE_PATH, wal_path)
+        metrics_path = os.path.join(self.tmp_dir, "metrics.json")
+        profile_dir = os.path.join(self.tmp_dir, "profile")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            main(
+                [
+                    "--wal",
+                    wal_path,
+                    "--pages",
+                    pages_path,
+                    "--metrics",
+                    metrics_path,
+                    "--profile",
+                    profile_dir,
+                ]
+            )
+
+        with open(metrics_path) as f:
+            blob = json.load(f)
+        phases = blob["phases"]
+        self.assertEqual(
+            list(phases),
+            ["load_wal", "load_pages", "index", "analysis", "redo", "undo", "write"],
+        )
+        # Building the index only parses the checkpoint, redo only the updates
+        # from the smallest recLSN on, and analysis everything from the checkpoint.
+        self.assertEqual(phases["index"]["records_decoded"], 1)
+        self.assertEqual(phases["index"]["records_skimmed"], 7)
+        self.assertEqual(phases["analysis"]["records_decoded"], 2)
+        self.assertEqual(phases["redo"]["records_decoded"], 4)
+        self.assertEqual(phases["redo"]["redone"], 4)
+        self.assertEqual(phases["undo"]["undone"], 4)
+        self.assertEqual(phases["undo"]["pages_touched"], 2)
+        self.assertIsNotNone(phases["analysis"]["peak_traced_bytes"])
+        self.assertEqual(
+            blob["total"]["records_decoded"],
+            sum(phase["records_decoded"] for phase in phases.values()),
+        )
+        self.assertEqual(
+            blob["total"]["records_skimmed"],
+            sum(phase["records_skimmed"] for phase in phases.values()),
+        )
+
+        stats = pstats.Stats(os.path.join(profile_dir, "redo.prof"))
+        self.assertTrue(any(func[2] == "redo" for func in stats.stats))
+        snapshot = tracemalloc.Snapshot.load(
+            os.path.join(profile_dir, "undo.tracemalloc")
+        )
+        self.assertIsInstance(snapshot, tracemalloc.Snapshot)
+
+
+if __name__ == "__main__":
+    unittest.main()
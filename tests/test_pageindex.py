@@ -0,0 +1,135 @@
+import contextlib
+import copy
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from aries import DEFAULT_DISK_PAGES_PATH, DEFAULT_WAL_FILE_PATH, analysis, main, redo
+from columnar import ColumnarWal
+from pageindex import PageUpdateIndex
+from pagestore import import_json
+from tests.test_columnar import ODD_RECORDS
+from workload import Workload
+
+
+def _indexed_redo(wal, disk_pages, start=None):
+    # analysis filling in the index, then redo through it.
+    pages = copy.deepcopy(disk_pages)
+    page_index = PageUpdateIndex(wal)
+    _, dpt, _ = analysis(wal.records_from(start), page_index)
+    return page_index.redo(dpt, pages), pages
+
+
+def _serial_redo(wal, disk_pages, start=None):
+    pages = copy.deepcopy(disk_pages)
+    _, dpt, _ = analysis(wal.records_from(start))
+    return redo(wal, dpt, pages), pages
+
+
+class TestPageUpdateIndex(unittest.TestCase):
+    def test_same_as_redo(self) -> None:
+        for options in (
+            {},
+            {"checkpoint_interval": 60, "flush_probability": 0.2},
+            {"skew": "zipf", "pages": 50, "abort_ratio": 0.3},
+        ):
+            workload = Workload(transactions=300, seed=9, **options)
+            wal = ColumnarWal.from_records(workload.records())
+            # From the last checkpoint, like main does.
+            checkpoints = [
+                wal.offsets[position]
+                for position, record in enumerate(wal)
+                if record["type"] == "CHECKPOINT"
+            ]
+            start = checkpoints[-1] if checkpoints else None
+            expected = _serial_redo(wal, workload.disk_pages, start)
+            self.assertTrue(expected[0])
+            self.assertEqual(_indexed_redo(wal, workload.disk_pages, start), expected)
+
+    def test_odd_records(self) -> None:
+        pages = {page: {"pageLSN": 0, "value": 0} for page in ("P1", "P2")}
+        wal = ColumnarWal.from_records(ODD_RECORDS)
+        redone, redone_pages = _indexed_redo(wal, pages)
+        serial_redone, serial_pages = _serial_redo(wal, pages)
+        self.assertEqual(redone_pages, serial_pages)
+        # The checkpoint says P2 was clean, so its update at LSN 4 (overwritten
+        # by LSN 7 anyway) isn't replayed. The serial redo only has pageLSN to go by.
+        self.assertEqual(serial_redone, [2, 3, 4, 7])
+        self.assertEqual(redone, [2, 3, 7])
+
+    def test_lsns_going_backward(self) -> None:
+        records = [
+            {"LSN": 5, "type": "UPDATE", "tx": "T1", "page": "P1", "after": 1},
+            {"LSN": 3, "type": "UPDATE", "tx": "T1", "page": "P2", "after": 2},
+            {"LSN": 4, "type": "UPDATE", "tx": "T1", "page": "P1", "after": 3},
+        ]
+        pages = {page: {"pageLSN": 0, "value": 0} for page in ("P1", "P2")}
+        wal = ColumnarWal.from_records(records)
+        self.assertEqual(_indexed_redo(wal, pages), _serial_redo(wal, pages))
+
+    def test_only_visits_dirty_pages_from_their_rec_lsn(self) -> None:
+        # P1 has been dirty since before the checkpoint, P2 only since LSN 8,
+        # and P3 made it to disk.
+        records = [{"LSN": 1, "type": "BEGIN", "tx": "T1"}]
+        for lsn, page in enumerate(["P1", "P2", "P3", "P2", "P3"], start=2):
+            records.append(
+                {"LSN": lsn, "type": "UPDATE", "tx": "T1", "page": page, "after": lsn}
+            )
+        records.append(
+            {
+                "LSN": 7,
+                "type": "CHECKPOINT",
+                "DPT": {"P1": 2},
+                "TT": {"T1": {"status": "RUNNING", "lastLSN": 6}},
+            }
+        )
+        for lsn, page in enumerate(["P2", "P3", "P2"], start=8):
+            records.append(
+                {"LSN": lsn, "type": "UPDATE", "tx": "T1", "page": page, "after": lsn}
+            )
+        pages = {
+            "P1": {"pageLSN": 0, "value": 0},
+            "P2": {"pageLSN": 5, "value": 5},
+            "P3": {"pageLSN": 9, "value": 9},
+        }
+        wal = ColumnarWal.from_records(records)
+
+        page_index = PageUpdateIndex(wal)
+        _, dpt, _ = analysis(wal.records_from(6), page_index)
+        self.assertEqual(dpt, {"P1": 2, "P2": 8, "P3": 9})
+        self.assertEqual(page_index.start, 6)
+
+        stats = {}
+        self.assertEqual(page_index.redo(dpt, pages, stats), [2, 8, 10])
+        # Visited LSNs 2, 8, 9 and 10, of the 9 records from LSN 2 on.
+        self.assertEqual(stats, {"skipped_below_rec_lsn": 5, "skipped_page_lsn": 1})
+        self.assertEqual(pages["P2"], {"pageLSN": 10, "value": 10})
+
+    def test_needs_a_columnar_wal(self) -> None:
+        with self.assertRaises(ValueError):
+            analysis(list(ODD_RECORDS), PageUpdateIndex(ColumnarWal()))
+
+    def test_cli(self) -> None:
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        # Recovering a page store in place logs its CLRs, so each run gets a copy of the WAL.
+        wal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, wal_dir)
+        wal_path = os.path.join(wal_dir, "wal.jsonl")
+        outputs = []
+        for options in ([], ["--page-index"]):
+            pages_path = os.path.join(tmp_dir, "pages.bin")
+            import_json(DEFAULT_DISK_PAGES_PATH, pages_path)
+            shutil.copy(DEFAULT_WAL_FILE_PATH, wal_path)
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                main(["--wal", wal_path, "--pages", pages_path] + options)
+            with open(pages_path, "rb") as f:
+                outputs.append((out.getvalue(), f.read()))
+        self.assertEqual(outputs[0], outputs[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import contextlib
+import copy
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from aries import DEFAULT_DISK_PAGES_PATH, _load_pages, analysis, main, redo, undo
+from binwal import convert_jsonl_to_binary
+from logmanager import LogManager
+from pagestore import PageStore, create_page_store, export_json, import_json
+from walfile import WalFile, append_records
+
+WAL = [
+    {"LSN": 1, "type": "BEGIN", "tx": "T1"},
+    {"LSN": 2, "type": "BEGIN", "tx": "T2"},
+    {"LSN": 3, "type": "UPDATE", "tx": "T1", "page": "P1", "before": 0, "after": 5},
+    {"LSN": 4, "type": "UPDATE", "tx": "T2", "page": "P7", "before": 0, "after": 6},
+    {"LSN": 5, "type": "COMMIT", "tx": "T1"},
+]
+
+
+def _pages(count):
+    return {f"P{i}": {"pageLSN": 0, "value": i} for i in range(count)}
+
+
+class TestPageStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "pages.bin")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def test_json_round_trip(self) -> None:
+        json_path = os.path.join(self.tmp_dir, "pages.json")
+
+        self.assertEqual(import_json(DEFAULT_DISK_PAGES_PATH, self.path), 2)
+        self.assertEqual(export_json(self.path, json_path), 2)
+
+        with open(DEFAULT_DISK_PAGES_PATH) as f, open(json_path) as g:
+            self.assertEqual(json.load(f), json.load(g))
+
+        # _load_pages opens either layout.
+        with _load_pages(self.path) as store:
+            self.assertIsInstance(store, PageStore)
+            self.assertEqual(store, _load_pages(DEFAULT_DISK_PAGES_PATH))
+
+    def test_recovery_writes_in_place(self) -> None:
+        # Enough pages that the slots span several OS pages.
+        pages = _pages(1000)
+        create_page_store(self.path, pages)
+
+        expected = copy.deepcopy(pages)
+        tt, dpt, _ = analysis(WAL)
+        expected_redone = redo(WAL, dpt, expected)
+        expected_undone = undo(list(WAL), tt, expected)
+
+        with PageStore(self.path) as store:
+            self.assertEqual(redo(WAL, dpt, store), expected_redone)
+            self.assertEqual(undo(list(WAL), tt, store), expected_undone)
+
+            # Only what redo/undo touched needs to be written back.
+            self.assertEqual(store.dirty_pages(), ["P1", "P7"])
+            self.assertEqual(store.flush(), 2)
+            self.assertEqual(store.dirty_pages(), [])
+
+        with PageStore(self.path) as store:
+            self.assertEqual(store, expected)
+            self.assertEqual(store["P7"], {"pageLSN": 6, "value": 0})
+
+    def test_recover_commit_recover(self) -> None:
+        # The CLRs undo writes into the pages have to be in the WAL file too,
+        # or a log manager reopening it hands out their LSNs again and the
+        # next restart skips its updates as already on the page.
+        wal = [
+            {"LSN": 1, "type": "BEGIN", "tx": "T1"},
+            {"LSN": 2, "type": "BEGIN", "tx": "T2"},
+            {
+                "LSN": 3,
+                "type": "UPDATE",
+                "tx": "T1",
+                "page": "P1",
+                "before": 1,
+                "after": 5,
+            },
+            {"LSN": 4, "type": "COMMIT", "tx": "T1"},
+        ]
+        wal += [
+            {
+                "LSN": lsn,
+                "type": "UPDATE",
+                "tx": "T2",
+                "page": "P7",
+                "before": 7,
+                "after": lsn,
+            }
+            for lsn in range(5, 8)
+        ]
+        jsonl_path = os.path.join(self.tmp_dir, "wal.jsonl")
+        append_records(jsonl_path, wal)
+        binary_path = os.path.join(self.tmp_dir, "wal.bin")
+        convert_jsonl_to_binary(jsonl_path, binary_path)
+
+        for wal_path in (jsonl_path, binary_path):
+            with self.subTest(wal=os.path.basename(wal_path)):
+                create_page_store(self.path, _pages(8))
+                with contextlib.redirect_stdout(io.StringIO()):
+                    main(["--wal", wal_path, "--pages", self.path])
+                with PageStore(self.path) as store:
+                    self.assertEqual(store["P7"], {"pageLSN": 10, "value": 7})
+
+                with LogManager(wal_path, max_latency=0) as log:
+                    self.assertEqual(log.begin("T3"), 12)
+                    log.update("T3", "P7", 7, 777)
+                    log.commit("T3")
+
+                with contextlib.redirect_stdout(io.StringIO()):
+                    main(["--wal", wal_path, "--pages", self.path])
+                with PageStore(self.path) as store:
+                    self.assertEqual(store["P7"], {"pageLSN": 13, "value": 777})
+                    self.assertEqual(store["P1"], {"pageLSN": 3, "value": 5})
+
+        # One CLR per T2 update, then T2's END, ahead of the log manager's records.
+        with WalFile(jsonl_path) as log:
+            records = list(log)
+        self.assertEqual(
+            [(r["LSN"], r["type"], r["tx"]) for r in records[7:]],
+            [(8, "CLR", "T2"), (9, "CLR", "T2"), (10, "CLR", "T2"), (11, "END", "T2")]
+            + [(12, "BEGIN", "T3"), (13, "UPDATE", "T3"), (14, "COMMIT", "T3")]
+            + [(15, "END", "T3")],
+        )
+
+    def test_rejects_values_that_dont_fit(self) -> None:
+        create_page_store(self.path, _pages(2))
+
+        with PageStore(self.path) as store:
+            with self.assertRaises(ValueError):
+                store["P1"]["value"] = "text"
+            with self.assertRaises(ValueError):
+                store["P1"]["pageLSN"] = 1 << 64
+            with self.assertRaises(KeyError):
+                store["P1"]["other"] = 1
+
+        with self.assertRaises(ValueError):
+            create_page_store(self.path, {"P1": {"pageLSN": 0, "value": [1]}})
+
+    def test_rejects_other_files(self) -> None:
+        with self.assertRaises(ValueError):
+            PageStore(DEFAULT_DISK_PAGES_PATH)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import contextlib
+import copy
+import io
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+from aries import (
+    DEFAULT_DISK_PAGES_PATH,
+    DEFAULT_WAL_FILE_PATH,
+    analysis,
+    main,
+    redo,
+    undo,
+)
+from metrics import RecoveryMetrics
+from pagetable import PageTable
+from parallel import redo_parallel
+from workload import Workload
+
+
+class TestPageTable(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def test_mapping_view(self) -> None:
+        with open(DEFAULT_DISK_PAGES_PATH) as f:
+            pages = json.load(f)
+        table = PageTable.from_pages(pages)
+        self.assertEqual(table.to_dict(), pages)
+        self.assertEqual(list(table), list(pages))
+        self.assertEqual({page: dict(row) for page, row in table.items()}, pages)
+        self.assertIn("P1", table)
+        self.assertNotIn("P0", table)
+
+        row = table["P2"]
+        row["value"] = 42
+        row.update(pageLSN=7)
+        self.assertEqual(table["P2"], {"pageLSN": 7, "value": 42})
+        self.assertEqual(table.values[table.ids["P2"]], 42)
+        self.assertEqual(table.add("P2", 1, 2), table.ids["P2"])
+        self.assertEqual(table.add("P9", 0, 0), len(pages))
+        self.assertEqual(table.nbytes(), 16 * (len(pages) + 1))
+
+        with self.assertRaises(KeyError):
+            table["P0"]
+        with self.assertRaises(KeyError):
+            row["LSN"]
+        with self.assertRaises(ValueError):
+            row["value"] = "x"
+        with self.assertRaises(ValueError):
+            PageTable.from_pages({"P1": {"pageLSN": 0, "value": 1 << 63}})
+
+    def test_recovery_matches_dict_pages(self) -> None:
+        for seed in range(3):
+            workload = Workload(transactions=200, pages=30, loser_ratio=0.2, seed=seed)
+            records = list(workload.records())
+            transaction_table, dirty_page_table, _ = analysis(records)
+
+            pages = copy.deepcopy(workload.disk_pages)
+            wal = list(records)
+            stats = {}
+            redone = redo(wal, dirty_page_table, pages, stats)
+            undone = undo(wal, transaction_table, pages)
+
+            for workers in (1, 2):
+                table = PageTable.from_pages(workload.disk_pages)
+                table_wal = list(records)
+                table_stats = {}
+                self.assertEqual(
+                    redo_parallel(
+                        table_wal, dirty_page_table, table, workers, table_stats
+                    ),
+                    redone,
+                )
+                self.assertEqual(table_stats, stats)
+                self.assertEqual(undo(table_wal, transaction_table, table), undone)
+                self.assertEqual(table_wal, wal)
+                self.assertEqual(table.to_dict(), pages)
+                self.assertEqual(
+                    {page: row["value"] for page, row in table.items()},
+                    workload.expected_values,
+                )
+
+    def test_smaller_than_dict_pages(self) -> None:
+        names = [f"P{i}" for i in range(10000)]
+        tracemalloc.start()
+        try:
+            start = tracemalloc.get_traced_memory()[0]
+            pages = {
+                name: {"pageLSN": 1000 + i, "value": 1000 + i}
+                for i, name in enumerate(names)
+            }
+            dict_bytes = tracemalloc.get_traced_memory()[0] - start
+            start = tracemalloc.get_traced_memory()[0]
+            table = PageTable.from_pages(pages)
+            table_bytes = tracemalloc.get_traced_memory()[0] - start
+        finally:
+            tracemalloc.stop()
+        self.assertLess(table_bytes * 2, dict_bytes)
+        self.assertEqual(len(table), len(names))
+
+    def test_metrics_keep_the_fast_path(self) -> None:
+        # Tracking touched pages hands back the table itself, so redo still
+        # takes its fast path, and it touches what a dict of pages would.
+        workload = Workload(transactions=200, pages=30, loser_ratio=0.2, seed=4)
+        records = list(workload.records())
+        touched = []
+        for make in (copy.deepcopy, PageTable.from_pages):
+            metrics = RecoveryMetrics()
+            pages = metrics.track_pages(make(workload.disk_pages))
+            transaction_table, dirty_page_table, _ = analysis(records)
+            with metrics.phase("redo"):
+                redo(records, dirty_page_table, pages)
+            with metrics.phase("undo"):
+                undo(list(records), transaction_table, pages)
+            touched.append(
+                [metrics.phases[phase]["pages_touched"] for phase in ("redo", "undo")]
+            )
+        self.assertIs(pages, metrics.pages)
+        self.assertIsInstance(pages, PageTable)
+        self.assertEqual(touched[0], touched[1])
+        self.assertGreater(touched[1][0], 0)
+
+    def test_cli(self) -> None:
+        wal_path = os.path.join(self.tmp_dir, "wal.jsonl")
+        shutil.copy(DEFAULT_WAL_FILE_PATH, wal_path)
+        outputs = []
+        for options in ([], ["--page-table"], ["--page-table", "--buffer-frames", "2"]):
+            out_path = os.path.join(self.tmp_dir, "pages.json")
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                main(
+                    [
+                        "--wal",
+                        wal_path,
+                        "--pages",
+                        DEFAULT_DISK_PAGES_PATH,
+                        "--out",
+                        out_path,
+                    ]
+                    + options
+                )
+            with open(out_path) as f:
+                outputs.append((out.getvalue().split("Buffer Pool")[0], json.load(f)))
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0], outputs[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,270 @@
+import copy
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from aries import _load_wal, analysis, redo
+from binwal import convert_jsonl_to_binary
+from parallel import (
+    _analysis_chunk,
+    _byte_ranges,
+    _empty_summary,
+    _merge_analysis,
+    analysis_parallel,
+    redo_parallel,
+)
+from segments import SegmentedWal, convert_jsonl_to_segments
+from walfile import append_records
+from walindex import WalIndex
+from workload import Workload
+
+
+def _random_wal(seed, count, page_count):
+    rng = random.Random(seed)
+    wal = [{"LSN": 1, "type": "BEGIN", "tx": "T1"}]
+    for lsn in range(2, count + 2):
+        if rng.random() < 0.1:
+            wal.append({"LSN": lsn, "type": "COMMIT", "tx": "T1"})
+            continue
+        wal.append(
+            {
+                "LSN": lsn,
+                "type": "UPDATE",
+                "tx": "T1",
+                "page": f"P{rng.randrange(page_count)}",
+                "before": rng.randrange(100),
+                "after": rng.randrange(100),
+            }
+        )
+    # Some pages already have part of their history on disk.
+    pages = {
+        f"P{i}": {"pageLSN": rng.choice([0, count // 2, count]), "value": -1}
+        for i in range(page_count)
+    }
+    return wal, pages
+
+
+def _wal_files(test, directory, records, sample_interval=16):
+    # The records as a JSONL WAL, a binary WAL and gzip segments, each with
+    # its index, as (name, wal, index), closed when test is done. The index
+    # samples every sample_interval records, so there is somewhere to cut
+    # even a small log.
+    jsonl_path = os.path.join(directory, "wal.jsonl")
+    binary_path = os.path.join(directory, "wal.bin")
+    segments_path = os.path.join(directory, "segments")
+    for path in (jsonl_path, binary_path):
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(segments_path, ignore_errors=True)
+    append_records(jsonl_path, records)
+    convert_jsonl_to_binary(jsonl_path, binary_path)
+    convert_jsonl_to_segments(jsonl_path, segments_path, "gzip", 40 * sample_interval)
+
+    wals = []
+    for name, path in (("jsonl", jsonl_path), ("binary", binary_path)):
+        wal = _load_wal(path)
+        test.addCleanup(wal.close)
+        index = WalIndex(sample_interval)
+        index.catch_up(wal)
+        wal.decoded = wal.skimmed = 0
+        wals.append((name, wal, index))
+    segmented = SegmentedWal(segments_path)
+    test.addCleanup(segmented.close)
+    wals.append(("segments", segmented, segmented.index()))
+    return wals
+
+
+class TestParallelRedo(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def _check(self, records, dirty_page_table, pages, workers=(2, 3)) -> list[int]:
+        # Redo serially and in parallel from every kind of WAL file, compare everything.
+        serial_pages = copy.deepcopy(pages)
+        serial = redo(records, dirty_page_table, serial_pages)
+
+        for name, wal, index in _wal_files(self, self.tmp_dir, records):
+            # What the serial redo reads (and skips) from this file, from where the index starts it.
+            serial_stats = {}
+            redo_parallel(
+                wal, dirty_page_table, copy.deepcopy(pages), 1, serial_stats, index
+            )
+            serial_counts = wal.decoded, wal.skimmed
+
+            for worker_count in workers:
+                with self.subTest(wal=name, workers=worker_count):
+                    start = index.offset_for_lsn(min(dirty_page_table.values()))
+                    ranges = _byte_ranges(wal, index, start, worker_count)
+                    self.assertEqual(len(ranges), worker_count)
+
+                    wal.decoded = wal.skimmed = 0
+                    parallel_pages, parallel_stats = copy.deepcopy(pages), {}
+                    self.assertEqual(
+                        redo_parallel(
+                            wal,
+                            dirty_page_table,
+                            parallel_pages,
+                            worker_count,
+                            parallel_stats,
+                            index,
+                        ),
+                        serial,
+                    )
+                    self.assertEqual(parallel_pages, serial_pages)
+                    self.assertEqual(parallel_stats, serial_stats)
+                    # The workers' reads are counted as the WAL's own.
+                    self.assertEqual((wal.decoded, wal.skimmed), serial_counts)
+            wal.close()
+        return serial
+
+    def test_matches_serial_redo(self) -> None:
+        for seed in range(3):
+            wal, pages = _random_wal(seed, count=500, page_count=17)
+            self._check(wal, {"P0": 40, "P3": 120}, pages)
+
+    def test_keeps_log_order_when_lsns_are_out_of_order(self) -> None:
+        # Across pages, and within a page: an update below one an earlier
+        # range already redid is skipped, like the serial redo does.
+        wal = []
+        for i, (lsn, page) in enumerate(
+            [(30, "P1"), (20, "P2"), (10, "P3"), (25, "P1"), (50, "P2")] * 20
+        ):
+            wal.append(
+                {
+                    "LSN": lsn + i,
+                    "type": "UPDATE",
+                    "tx": "T1",
+                    "page": page,
+                    "before": 0,
+                    "after": i,
+                }
+            )
+        pages = {f"P{i}": {"pageLSN": 0, "value": 0} for i in range(1, 4)}
+
+        redone = self._check(wal, {"P3": 10}, pages, workers=(2, 3, 5))
+        self.assertEqual(redone[:3], [30, 21, 12])
+
+    def test_updates_pages_in_place(self) -> None:
+        records, pages = _random_wal(7, count=50, page_count=4)
+        page = pages["P1"]
+        _, wal, index = _wal_files(self, self.tmp_dir, records, sample_interval=4)[0]
+
+        with wal:
+            redo_parallel(wal, {"P1": 1}, pages, 2, None, index)
+
+        self.assertIs(pages["P1"], page)
+
+    def test_nothing_to_redo(self) -> None:
+        self.assertEqual(redo_parallel([], {}, {}, 4), [])
+
+    def test_in_memory_logs_are_redone_serially(self) -> None:
+        wal, pages = _random_wal(3, count=100, page_count=5)
+        self.assertIsNone(_byte_ranges(wal, None, None, 4))
+        # So is a WAL file with nowhere to cut it.
+        wal_files = _wal_files(self, self.tmp_dir, wal, sample_interval=1000)
+        _, wal_file, index = wal_files[0]
+        with wal_file:
+            self.assertIsNone(_byte_ranges(wal_file, index, None, 4))
+        expected = copy.deepcopy(pages)
+        self.assertEqual(
+            redo_parallel(wal, {"P0": 1}, pages, 4), redo(wal, {"P0": 1}, expected)
+        )
+        self.assertEqual(pages, expected)
+
+
+def _ordered(tables):
+    # analysis results with the order of every dict spelled out.
+    transaction_table, dirty_page_table, ended = tables
+    return (
+        [(tx, list(entry.items())) for tx, entry in transaction_table.items()],
+        list(dirty_page_table.items()),
+        ended,
+    )
+
+
+def _random_analysis_wal(seed, count):
+    # Few transactions, so the same one BEGINs, ENDs and comes back a lot.
+    rng = random.Random(seed)
+    wal = []
+    for lsn in range(1, count + 1):
+        tx = f"T{rng.randrange(4)}"
+        kind = rng.choice(
+            ["BEGIN", "UPDATE", "UPDATE", "CLR", "COMMIT", "ABORT", "END"]
+        )
+        if rng.random() < 0.02:
+            kind = "CHECKPOINT"
+        if kind == "CHECKPOINT":
+            wal.append(
+                {
+                    "LSN": lsn,
+                    "type": kind,
+                    "DPT": {"P0": lsn - 5},
+                    "TT": {"T1": {"lastLSN": lsn - 1, "status": "RUNNING"}},
+                }
+            )
+        elif kind in ("UPDATE", "CLR"):
+            wal.append(
+                {"LSN": lsn, "type": kind, "tx": tx, "page": f"P{rng.randrange(5)}"}
+            )
+        else:
+            wal.append({"LSN": lsn, "type": kind, "tx": tx})
+    return wal
+
+
+class TestParallelAnalysis(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def test_matches_serial_analysis(self) -> None:
+        for options in ({}, {"checkpoint_interval": 30, "abort_ratio": 0.3}):
+            records = list(Workload(transactions=200, seed=5, **options).records())
+            for sample_interval, workers in ((16, 2), (17, 3)):
+                for name, wal, index in _wal_files(
+                    self, self.tmp_dir, records, sample_interval
+                ):
+                    with self.subTest(options=options, wal=name, workers=workers):
+                        # Serially, from the last checkpoint, as main does.
+                        start = index.last_checkpoint_offset()
+                        serial = _ordered(analysis(wal.records_from(start)))
+                        serial_decoded = wal.decoded
+                        wal.decoded = wal.skimmed = 0
+
+                        # (Fewer ranges if the checkpoint leaves few samples after it.)
+                        ranges = _byte_ranges(wal, index, start, workers)
+                        self.assertGreater(len(ranges), 1)
+                        self.assertEqual(
+                            _ordered(analysis_parallel(wal, workers, index)), serial
+                        )
+                        # Every record from the checkpoint on was decoded once, by a worker.
+                        self.assertEqual(wal.decoded, serial_decoded)
+                    wal.close()
+
+    def test_merge_is_associative(self) -> None:
+        for seed in range(50):
+            wal = _random_analysis_wal(seed, 60)
+            serial = _ordered(analysis(wal))
+            a, b, c = (_analysis_chunk(wal[i : i + 20]) for i in (0, 20, 40))
+
+            for summary in (
+                _merge_analysis(_merge_analysis(a, b), c),
+                _merge_analysis(a, _merge_analysis(b, c)),
+            ):
+                # The log starts out with empty tables.
+                summary = _merge_analysis(_empty_summary(reset=True), summary)
+                tables = summary["tt"], summary["dpt"], summary["ended"]
+                self.assertEqual(_ordered(tables), serial)
+
+    def test_nothing_to_analyze(self) -> None:
+        self.assertEqual(analysis_parallel([], 4), ({}, {}, []))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import copy
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from aries import _load_wal, analysis, redo
+from binwal import convert_jsonl_to_binary
+from pipeline import recover_pipelined
+from walfile import append_records
+from walindex import WalIndex
+from workload import Workload, write_workload
+
+
+def _serial(wal, wal_index, disk_pages):
+    # What main does without --pipeline.
+    pages = copy.deepcopy(disk_pages)
+    tt, dpt, ended = analysis(wal.records_from(wal_index.last_checkpoint_offset()))
+    stats = {}
+    redone = []
+    if dpt:
+        start = wal_index.offset_for_lsn(min(dpt.values()))
+        redone = redo(wal.records_from(start), dpt, pages, stats)
+    return tt, dpt, ended, redone, stats, pages
+
+
+def _pipelined(wal, wal_index, disk_pages, **options):
+    pages = copy.deepcopy(disk_pages)
+    stats = {}
+    tt, dpt, ended, redone = recover_pipelined(wal, wal_index, pages, stats, **options)
+    return tt, dpt, ended, redone, stats, pages
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.wal_path = os.path.join(self.tmp_dir, "wal.jsonl")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def _check(self, path, disk_pages, **options) -> None:
+        with _load_wal(path) as wal:
+            wal_index = WalIndex()
+            wal_index.catch_up(wal)
+            expected = _serial(wal, wal_index, disk_pages)
+            actual = _pipelined(wal, wal_index, disk_pages, **options)
+            self.assertEqual(actual, expected)
+            # Same dict order too, since the report prints them as they are.
+            self.assertEqual(list(actual[0]), list(expected[0]))
+            self.assertEqual(list(actual[1]), list(expected[1]))
+
+    def test_same_as_serial(self) -> None:
+        bin_path = os.path.join(self.tmp_dir, "wal.bin")
+        for options in (
+            {},
+            {"checkpoint_interval": 150, "flush_probability": 0.05},
+            {"checkpoint_interval": 400, "abort_ratio": 0.3, "loser_ratio": 0.2},
+        ):
+            workload = Workload(transactions=300, seed=3, **options)
+            write_workload(
+                workload, self.wal_path, os.path.join(self.tmp_dir, "pages.json")
+            )
+            convert_jsonl_to_binary(self.wal_path, bin_path)
+            for path in (self.wal_path, bin_path):
+                self._check(path, workload.disk_pages)
+                self._check(path, workload.disk_pages, batch_size=3, depth=1)
+
+    def test_redo_before_the_checkpoint(self) -> None:
+        # The checkpoint's dirty page table goes back past the checkpoint.
+        records = [{"LSN": 1, "type": "BEGIN", "tx": "T1"}]
+        for lsn in range(2, 40):
+            records.append(
+                {
+                    "LSN": lsn,
+                    "type": "UPDATE",
+                    "tx": "T1",
+                    "page": f"P{lsn % 3}",
+                    "before": lsn - 1,
+                    "after": lsn,
+                }
+            )
+        records.append(
+            {
+                "LSN": 40,
+                "type": "CHECKPOINT",
+                "DPT": {"P1": 10},
+                "TT": {"T1": {"status": "RUNNING", "lastLSN": 39}},
+            }
+        )
+        records.append({"LSN": 41, "type": "COMMIT", "tx": "T1"})
+        append_records(self.wal_path, records)
+        pages = {f"P{i}": {"pageLSN": 0, "value": 0} for i in range(3)}
+
+        with _load_wal(self.wal_path) as wal:
+            wal_index = WalIndex(sample_interval=4)
+            wal_index.catch_up(wal)
+            result = _pipelined(wal, wal_index, pages, batch_size=2)
+            self.assertEqual(result, _serial(wal, wal_index, pages))
+            self.assertEqual(result[3][0], 10)
+
+    def test_lsns_going_backward(self) -> None:
+        # Redo starts at LSN 11, then LSN 5 turns out to be the smallest recLSN.
+        records = [
+            {"LSN": 10, "type": "BEGIN", "tx": "T1"},
+            {"LSN": 11, "type": "UPDATE", "tx": "T1", "page": "P1", "after": 1},
+            {"LSN": 5, "type": "UPDATE", "tx": "T1", "page": "P2", "after": 2},
+            {"LSN": 12, "type": "UPDATE", "tx": "T1", "page": "P1", "after": 3},
+        ]
+        append_records(self.wal_path, records)
+        pages = {
+            "P1": {"pageLSN": 0, "value": 0},
+            "P2": {"pageLSN": 0, "value": 0},
+        }
+        self._check(self.wal_path, pages)
+        self._check(self.wal_path, pages, batch_size=1)
+
+    def test_nothing_to_redo(self) -> None:
+        append_records(
+            self.wal_path,
+            [
+                {"LSN": 1, "type": "BEGIN", "tx": "T1"},
+                {"LSN": 2, "type": "COMMIT", "tx": "T1"},
+                {"LSN": 3, "type": "END", "tx": "T1"},
+            ],
+        )
+        with _load_wal(self.wal_path) as wal:
+            wal_index = WalIndex()
+            wal_index.catch_up(wal)
+            self.assertEqual(
+                _pipelined(wal, wal_index, {}), ({}, {}, ["T1"], [], {}, {})
+            )
+
+    def test_read_errors_reach_the_caller(self) -> None:
+        with open(self.wal_path, "w") as f:
+            f.write(json.dumps({"LSN": 1, "type": "BEGIN", "tx": "T1"}) + "\n")
+            f.write("{not json\n")
+        with _load_wal(self.wal_path) as wal:
+            with self.assertRaises(json.JSONDecodeError):
+                recover_pipelined(wal, WalIndex(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,253 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from aries import _load_wal, analysis, main
+from pagestore import import_json
+from segments import (
+    CODECS,
+    SegmentedWal,
+    SegmentWriter,
+    convert_jsonl_to_segments,
+    read_segments,
+)
+from walfile import WalFile
+from workload import Workload, write_workload
+
+
+class TestSegments(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.wal_path = os.path.join(self.tmp_dir, "wal.jsonl")
+        self.pages_path = os.path.join(self.tmp_dir, "pages.json")
+        workload = Workload(
+            transactions=300, pages=50, checkpoint_interval=400, loser_ratio=0.1
+        )
+        write_workload(workload, self.wal_path, self.pages_path)
+        with WalFile(self.wal_path) as wal:
+            self.records = list(wal)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def _segments(self, codec: str = "gzip", segment_size: int = 8192) -> str:
+        directory = os.path.join(self.tmp_dir, codec)
+        convert_jsonl_to_segments(self.wal_path, directory, codec, segment_size)
+        return directory
+
+    def test_round_trip(self) -> None:
+        for codec in CODECS:
+            with SegmentedWal(self._segments(codec)) as wal:
+                self.assertGreater(len(wal.segments), 3)
+                self.assertEqual(list(wal), self.records)
+                self.assertEqual(list(reversed(wal)), self.records[::-1])
+
+                # Offsets can be handed back to records_from and scan.
+                scanned = list(wal.scan())
+                offset = scanned[len(scanned) // 2][0]
+                self.assertEqual(
+                    list(wal.records_from(offset)), self.records[len(scanned) // 2 :]
+                )
+                self.assertEqual(
+                    [end for _, end, _ in scanned[:-1]],
+                    [start for start, _, _ in scanned[1:]],
+                )
+                self.assertEqual(
+                    [(lsn, kind) for _, _, lsn, kind, _ in wal.scan_lazy()],
+                    [(r["LSN"], r["type"]) for r in self.records],
+                )
+
+    def test_headers(self) -> None:
+        directory = self._segments("lzma")
+        segments = read_segments(directory)
+        with SegmentedWal(directory) as wal:
+            for segment in segments:
+                records = [
+                    record
+                    for offset, _, record in wal.scan(segment.start_offset)
+                    if offset < segment.end_offset
+                ]
+                lsns = [record["LSN"] for record in records]
+                self.assertEqual(segment.records, len(records))
+                self.assertEqual(
+                    (segment.min_lsn, segment.max_lsn), (min(lsns), max(lsns))
+                )
+                self.assertEqual(
+                    segment.has_checkpoint,
+                    any(record["type"] == "CHECKPOINT" for record in records),
+                )
+                self.assertEqual(segment.codec, "lzma")
+        self.assertTrue(any(segment.has_checkpoint for segment in segments))
+        self.assertFalse(all(segment.has_checkpoint for segment in segments))
+
+    def test_skips_segments(self) -> None:
+        with SegmentedWal(self._segments()) as wal:
+            index = wal.index()
+            tables = analysis(wal.records_from(index.last_checkpoint_offset()))
+            self.assertEqual(tables, analysis(self.records))
+            self.assertLess(wal.reads_since()["segments_read"], len(wal.segments))
+
+            for lsn in (1, self.records[len(self.records) // 2]["LSN"]):
+                records = wal.records_from(index.offset_for_lsn(lsn))
+                self.assertEqual(
+                    [r for r in records if r["LSN"] >= lsn],
+                    [r for r in self.records if r["LSN"] >= lsn],
+                )
+
+            # Past the end of the log: nothing is opened at all.
+            snapshot = wal.read_snapshot()
+            self.assertEqual(list(wal.records_from(index.offset_for_lsn(10**9))), [])
+            self.assertEqual(
+                wal.reads_since(snapshot),
+                {"segments_read": 0, "segment_opens": 0, "compressed_bytes_read": 0},
+            )
+
+    def test_reads_count_distinct_segments(self) -> None:
+        # Reading the whole log twice opens every segment twice, but it is
+        # still every segment once.
+        with SegmentedWal(self._segments()) as wal:
+            self.assertEqual(len(list(wal)), len(self.records))
+            snapshot = wal.read_snapshot()
+            self.assertEqual(len(list(reversed(wal))), len(self.records))
+            reads = wal.reads_since()
+            self.assertEqual(reads["segments_read"], len(wal.segments))
+            self.assertEqual(reads["segment_opens"], 2 * len(wal.segments))
+            self.assertEqual(
+                reads["compressed_bytes_read"],
+                2 * sum(os.path.getsize(segment.path) for segment in wal.segments),
+            )
+            self.assertEqual(
+                wal.reads_since(snapshot)["segments_read"], len(wal.segments)
+            )
+
+    def test_record_for_lsn(self) -> None:
+        with SegmentedWal(self._segments("bz2")) as wal:
+            for record in self.records[::37]:
+                self.assertEqual(wal.record_for_lsn(record["LSN"]), record)
+            wal.append({"LSN": 10**6, "type": "CLR", "tx": "T1"})
+            self.assertEqual(wal.record_for_lsn(10**6)["type"], "CLR")
+            with self.assertRaises(KeyError):
+                wal.record_for_lsn(10**7)
+
+    def test_writer_appends_segments(self) -> None:
+        directory = os.path.join(self.tmp_dir, "appended")
+        for start in (0, 100):
+            with SegmentWriter(directory, "gzip", segment_size=1 << 20) as writer:
+                for record in self.records[start : start + 100]:
+                    writer.append(record)
+            self.assertEqual(writer.segments_written, 1)
+        with _load_wal(directory) as wal:
+            self.assertIsInstance(wal, SegmentedWal)
+            self.assertEqual(list(wal), self.records[:200])
+
+    def test_writer_numbers_after_the_last_segment(self) -> None:
+        directory = self._segments("none", segment_size=1 << 20)
+        first = read_segments(directory)[0].path
+        gap = os.path.join(directory, f"{5:08d}.seg")
+        os.rename(first, gap)
+
+        with SegmentWriter(directory, "none") as writer:
+            writer.append({"LSN": 10**6, "type": "BEGIN", "tx": "T"})
+        self.assertEqual(
+            [os.path.basename(segment.path) for segment in read_segments(directory)],
+            [f"{5:08d}.seg", f"{6:08d}.seg"],
+        )
+
+        # Two writers that picked the same number: the second one fails.
+        first_writer = SegmentWriter(directory, "none")
+        second_writer = SegmentWriter(directory, "none")
+        first_writer.append({"LSN": 10**6 + 1, "type": "BEGIN", "tx": "U"})
+        first_writer.close()
+        second_writer.append({"LSN": 10**6 + 2, "type": "BEGIN", "tx": "V"})
+        with self.assertRaises(FileExistsError):
+            second_writer.close()
+        self.assertEqual(len(read_segments(directory)), 3)
+        self.assertEqual(sorted(os.listdir(directory))[-1], f"{7:08d}.seg")
+
+    def test_rejects_other_files(self) -> None:
+        directory = os.path.join(self.tmp_dir, "bad")
+        os.mkdir(directory)
+        with open(os.path.join(directory, "00000001.seg"), "wb") as f:
+            f.write(b"not a segment" * 10)
+        with self.assertRaises(ValueError):
+            SegmentedWal(directory)
+        with self.assertRaises(ValueError):
+            SegmentWriter(directory, "zstd")
+
+        shutil.rmtree(directory)
+        directory = self._segments()
+        path = read_segments(directory)[0].path
+        with open(path, "rb+") as f:
+            f.seek(8)
+            f.write(bytes([99]))
+        with self.assertRaises(ValueError):
+            SegmentedWal(directory)
+
+    def test_cli(self) -> None:
+        outputs = []
+        for wal_path in (self.wal_path, self._segments("gzip"), self._segments("none")):
+            out_path = os.path.join(self.tmp_dir, "pages_after.json")
+            metrics_path = os.path.join(self.tmp_dir, "metrics.json")
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                main(
+                    [
+                        "--wal",
+                        wal_path,
+                        "--pages",
+                        self.pages_path,
+                        "--out",
+                        out_path,
+                        "--metrics",
+                        metrics_path,
+                    ]
+                )
+            with open(out_path) as f:
+                outputs.append((out.getvalue(), json.load(f)))
+            with open(metrics_path) as f:
+                metrics = json.load(f)
+            if wal_path != self.wal_path:
+                segments = metrics["segments"]
+                self.assertLess(segments["segments_read"], segments["segments"])
+                for phase in segments["phases"].values():
+                    self.assertLessEqual(phase["segments_read"], segments["segments"])
+                self.assertEqual(
+                    sum(
+                        phase["segment_opens"] for phase in segments["phases"].values()
+                    ),
+                    segments["segment_opens"],
+                )
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0], outputs[2])
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                main(
+                    [
+                        "--wal",
+                        self._segments("bz2"),
+                        "--pages",
+                        self.pages_path,
+                        "--out",
+                        os.path.join(self.tmp_dir, "out.json"),
+                        "--incremental-analysis",
+                    ]
+                )
+
+        # A page store is recovered in place, which needs a WAL file to log to.
+        store_path = os.path.join(self.tmp_dir, "pages.bin")
+        import_json(self.pages_path, store_path)
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                main(["--wal", self._segments("none"), "--pages", store_path])
+            # Nor can a checkpoint be appended to segments.
+            with self.assertRaises(SystemExit):
+                main(["checkpoint", "--wal", self._segments("none")])
+
+
+if __name__ == "__main__":
+    unittest.main()
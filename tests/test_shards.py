@@ -0,0 +1,144 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from pagestore import PageStore
+from shards import find_shards, main, recover_shards
+from workload import Workload, write_workload
+
+
+class TestShards(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.workloads: dict[str, Workload] = {}
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_shard(self, name: str, seed: int, **options) -> str:
+        directory = os.path.join(self.tmp_dir, name)
+        os.makedirs(directory)
+        binary = options.pop("binary", False)
+        page_store = options.pop("page_store", False)
+        workload = Workload(transactions=60, pages=30, seed=seed, **options)
+        write_workload(
+            workload,
+            os.path.join(directory, "wal.bin" if binary else "wal.jsonl"),
+            os.path.join(
+                directory, "disk_pages.bin" if page_store else "disk_pages.json"
+            ),
+            binary=binary,
+            page_store=page_store,
+        )
+        self.workloads[name] = workload
+        return directory
+
+    def _recovered_values(self, name: str) -> dict[str, int]:
+        directory = os.path.join(self.tmp_dir, name)
+        store_path = os.path.join(directory, "disk_pages.bin")
+        if os.path.exists(store_path):
+            with PageStore(store_path) as pages:
+                return {page: pages[page]["value"] for page in pages}
+        with open(os.path.join(directory, "disk_pages_after.json")) as f:
+            return {page: info["value"] for page, info in json.load(f).items()}
+
+    def test_recovers_every_shard(self) -> None:
+        self._write_shard("a", seed=1)
+        self._write_shard("b", seed=2, binary=True, checkpoint_interval=50)
+        self._write_shard("c", seed=3, page_store=True, loser_ratio=0.3)
+        # Not a shard.
+        os.makedirs(os.path.join(self.tmp_dir, "empty"))
+
+        shards = find_shards(self.tmp_dir)
+        self.assertEqual([shard["name"] for shard in shards], ["a", "b", "c"])
+
+        summary = recover_shards(shards, workers=2)
+        self.assertEqual(summary["failed"], [])
+        self.assertEqual(
+            [result["name"] for result in summary["shards"]], ["a", "b", "c"]
+        )
+        for name, workload in self.workloads.items():
+            self.assertEqual(self._recovered_values(name), workload.expected_values)
+            with open(os.path.join(self.tmp_dir, name, "report.txt")) as f:
+                self.assertIn("Page Update Report:", f.read())
+
+        slowest = max(result["wall_seconds"] for result in summary["shards"])
+        self.assertEqual(summary["slowest_shard_seconds"], slowest)
+        self.assertEqual(
+            summary["sum_shard_seconds"],
+            sum(result["wall_seconds"] for result in summary["shards"]),
+        )
+        self.assertIn("undo", summary["shards"][0]["phases"])
+
+    def test_manifest(self) -> None:
+        self._write_shard("a", seed=4)
+        self._write_shard("b", seed=5)
+        manifest_path = os.path.join(self.tmp_dir, "shards.json")
+        with open(manifest_path, "w") as f:
+            json.dump(
+                [
+                    {
+                        "name": "second",
+                        "wal": "b/wal.jsonl",
+                        "pages": "b/disk_pages.json",
+                    },
+                    {
+                        "name": "first",
+                        "wal": "a/wal.jsonl",
+                        "pages": "a/disk_pages.json",
+                        "out_dir": "out/first",
+                    },
+                ],
+                f,
+            )
+
+        shards = find_shards(manifest_path)
+        self.assertEqual([shard["name"] for shard in shards], ["second", "first"])
+        self.assertEqual(shards[1]["out_dir"], os.path.join(self.tmp_dir, "out/first"))
+
+        summary = recover_shards(shards, workers=2, options=["--columnar"])
+        self.assertEqual(summary["failed"], [])
+        self.assertEqual(
+            self._recovered_values("b"), self.workloads["b"].expected_values
+        )
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(self.tmp_dir, "out", "first", "disk_pages_after.json")
+            )
+        )
+
+    def test_a_failed_shard_does_not_stop_the_rest(self) -> None:
+        self._write_shard("good", seed=6)
+        bad = self._write_shard("bad", seed=7)
+        with open(os.path.join(bad, "wal.jsonl"), "a") as f:
+            f.write("{not json\n")
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            status = main([self.tmp_dir, "--workers", "2"])
+        self.assertEqual(status, 1)
+        self.assertIn("bad: FAILED (JSONDecodeError", out.getvalue())
+        self.assertEqual(
+            self._recovered_values("good"), self.workloads["good"].expected_values
+        )
+        with open(os.path.join(bad, "report.txt")) as f:
+            self.assertIn("Traceback", f.read())
+
+    def test_cli_summary(self) -> None:
+        self._write_shard("a", seed=8)
+        summary_path = os.path.join(self.tmp_dir, "summary.json")
+        with contextlib.redirect_stdout(io.StringIO()):
+            status = main([self.tmp_dir, "--workers", "1", "--summary", summary_path])
+        self.assertEqual(status, 0)
+        with open(summary_path) as f:
+            summary = json.load(f)
+        self.assertEqual(summary["slowest_shard"], "a")
+        self.assertEqual(summary["workers"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import contextlib
+import copy
+import io
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from aries import DEFAULT_DISK_PAGES_PATH, DEFAULT_WAL_FILE_PATH, analysis, main, redo
+from bufferpool import BufferPool
+from pagestore import import_json
+from spill import _ENTRY_BYTES, ExternalSorter, redo_spilled
+from tests.test_parallel import _random_wal
+from workload import Workload
+
+
+class TestExternalSorter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def test_sorts(self) -> None:
+        rng = random.Random(1)
+        entries = [(rng.randrange(50), i) for i in range(1000)]
+        for max_entries in (4, 16, 100, 5000):
+            sorter = ExternalSorter(max_entries, self.tmp_dir)
+            for entry in entries:
+                sorter.add(entry)
+            self.assertEqual(len(sorter), 1000)
+            self.assertEqual(list(sorter), sorted(entries))
+            # Again, after the merge passes.
+            self.assertEqual(list(sorter), sorted(entries))
+            if max_entries < 1000:
+                self.assertGreaterEqual(sorter.spilled, 1000)
+                self.assertLessEqual(len(sorter.runs), sorter.fan_in)
+            else:
+                self.assertEqual(sorter.spilled, 0)
+            sorter.clear()
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+
+class TestRedoSpilled(unittest.TestCase):
+    def test_same_as_redo(self) -> None:
+        for seed in range(3):
+            wal, pages = _random_wal(seed, count=500, page_count=17)
+            dpt = {"P0": 40, "P3": 120}
+            serial_pages = copy.deepcopy(pages)
+            serial_stats = {}
+            serial = redo(wal, dpt, serial_pages, serial_stats)
+
+            for budget in (0, 20 * _ENTRY_BYTES, 1 << 20):
+                spilled_pages = copy.deepcopy(pages)
+                stats = {}
+                with redo_spilled(wal, dpt, spilled_pages, budget, stats) as redone:
+                    self.assertEqual(len(redone), len(serial))
+                    self.assertEqual(list(redone), serial)
+                self.assertEqual(spilled_pages, serial_pages)
+                self.assertEqual(stats.pop("spilled_entries") > 0, budget < 1 << 20)
+                self.assertEqual(stats, serial_stats)
+
+    def test_workloads(self) -> None:
+        for options in (
+            {"checkpoint_interval": 80, "flush_probability": 0.3},
+            {"skew": "zipf", "pages": 20, "abort_ratio": 0.3},
+        ):
+            workload = Workload(transactions=200, seed=5, **options)
+            records = list(workload.records())
+            _, dpt, _ = analysis(records)
+            serial_pages = copy.deepcopy(workload.disk_pages)
+            serial = redo(records, dpt, serial_pages)
+
+            pages = copy.deepcopy(workload.disk_pages)
+            pool = BufferPool(pages, frames=2)
+            with redo_spilled(records, dpt, pool, 50 * _ENTRY_BYTES) as redone:
+                self.assertEqual(list(redone), serial)
+            # Each page was brought into the pool once.
+            self.assertEqual(pool.stats()["hits"], 0)
+            pool.flush()
+            self.assertEqual(pages, serial_pages)
+
+    def test_lsns_going_backward(self) -> None:
+        wal = [
+            {"LSN": 30, "type": "UPDATE", "tx": "T1", "page": "P1", "after": 1},
+            {"LSN": 10, "type": "UPDATE", "tx": "T1", "page": "P2", "after": 2},
+            {"LSN": 20, "type": "UPDATE", "tx": "T1", "page": "P1", "after": 3},
+        ]
+        pages = {page: {"pageLSN": 0, "value": 0} for page in ("P1", "P2")}
+        serial_pages = copy.deepcopy(pages)
+        serial = redo(wal, {"P1": 10, "P2": 10}, serial_pages)
+        with redo_spilled(wal, {"P1": 10, "P2": 10}, pages, 0) as redone:
+            self.assertEqual(list(redone), serial)
+        self.assertEqual(serial, [30, 10])
+        self.assertEqual(pages, serial_pages)
+
+    def test_removes_its_spill_files(self) -> None:
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        wal, pages = _random_wal(0, count=100, page_count=5)
+        redone = redo_spilled(wal, {"P0": 1}, pages, 0, spill_dir=tmp_dir)
+        self.assertEqual(len(os.listdir(tmp_dir)), 1)
+        self.assertTrue(list(redone))
+        redone.close()
+        self.assertEqual(os.listdir(tmp_dir), [])
+
+    def test_cli(self) -> None:
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        # Recovering a page store in place logs its CLRs, so each run gets a copy of the WAL.
+        wal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, wal_dir)
+        wal_path = os.path.join(wal_dir, "wal.jsonl")
+        outputs = []
+        for options in ([], ["--redo-memory-budget", "0", "--spill-dir", tmp_dir]):
+            pages_path = os.path.join(tmp_dir, "pages.bin")
+            import_json(DEFAULT_DISK_PAGES_PATH, pages_path)
+            shutil.copy(DEFAULT_WAL_FILE_PATH, wal_path)
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                main(["--wal", wal_path, "--pages", pages_path] + options)
+            with open(pages_path, "rb") as f:
+                outputs.append((out.getvalue(), f.read()))
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(os.listdir(tmp_dir), ["pages.bin"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,74 @@
+import copy
+import json
+import os
+import tempfile
 import unittest
 from aries import undo
+from walfile import WalFile
+from walindex import WalIndex
+
+
+def _chained_wal():
+    # T1 and T3 are losers (T3 aborted), T2 is a winner. Updates interleave.
+    return [
+        {"LSN": 1, "type": "BEGIN", "tx": "T1"},
+        {"LSN": 2, "type": "BEGIN", "tx": "T2"},
+        {"LSN": 3, "type": "BEGIN", "tx": "T3"},
+        {
+            "LSN": 4,
+            "type": "UPDATE",
+            "tx": "T1",
+            "prevLSN": 1,
+            "page": "P1",
+            "before": 0,
+            "after": 1,
+        },
+        {
+            "LSN": 5,
+            "type": "UPDATE",
+            "tx": "T2",
+            "prevLSN": 2,
+            "page": "P2",
+            "before": 0,
+            "after": 2,
+        },
+        {
+            "LSN": 6,
+            "type": "UPDATE",
+            "tx": "T3",
+            "prevLSN": 3,
+            "page": "P3",
+            "before": 0,
+            "after": 3,
+        },
+        {
+            "LSN": 7,
+            "type": "UPDATE",
+            "tx": "T1",
+            "prevLSN": 4,
+            "page": "P3",
+            "before": 3,
+            "after": 4,
+        },
+        {"LSN": 8, "type": "COMMIT", "tx": "T2", "prevLSN": 5},
+        {"LSN": 9, "type": "ABORT", "tx": "T3", "prevLSN": 6},
+    ]
+
+
+def _chained_tt():
+    return {
+        "T1": {"status": "RUNNING", "lastLSN": 7},
+        "T2": {"status": "COMMITTED", "lastLSN": 8},
+        "T3": {"status": "ABORTED", "lastLSN": 9},
+    }
+
+
+def _chained_pages():
+    return {
+        "P1": {"pageLSN": 4, "value": 1},
+        "P2": {"pageLSN": 5, "value": 2},
+        "P3": {"pageLSN": 7, "value": 4},
+    }
 
 
 class TestUndo(unittest.TestCase):
@@ -150,3 +219,94 @@ class TestUndo(unittest.TestCase):
         self.assertEqual(disk_page["P2"]["pageLSN"], 42)
 
         self.assertEqual(len(wal), 8)
+
+    def test_undo_follows_prev_lsn_chains(self):
+        wal = _chained_wal()
+        disk_page = _chained_pages()
+
+        undone_lsns = undo(wal, _chained_tt(), disk_page)
+
+        self.assertEqual(undone_lsns, [7, 6, 4])
+        self.assertEqual(disk_page["P1"], {"pageLSN": 12, "value": 0})
+        self.assertEqual(disk_page["P2"], {"pageLSN": 5, "value": 2})
+        self.assertEqual(disk_page["P3"], {"pageLSN": 11, "value": 0})
+        self.assertEqual(
+            wal[9:],
+            [
+                {
+                    "LSN": 10,
+                    "type": "CLR",
+                    "tx": "T1",
+                    "prevLSN": 7,
+                    "page": "P3",
+                    "after": 3,
+                    "undoNextLSN": 4,
+                },
+                {
+                    "LSN": 11,
+                    "type": "CLR",
+                    "tx": "T3",
+                    "prevLSN": 9,
+                    "page": "P3",
+                    "after": 0,
+                    "undoNextLSN": 3,
+                },
+                {
+                    "LSN": 12,
+                    "type": "CLR",
+                    "tx": "T1",
+                    "prevLSN": 10,
+                    "page": "P1",
+                    "after": 0,
+                    "undoNextLSN": 1,
+                },
+            ],
+        )
+
+    def test_undo_chains_match_backward_scan(self):
+        # The same log without prevLSN falls back to scanning the whole log.
+        old_wal = copy.deepcopy(_chained_wal())
+        for wal_entry in old_wal:
+            wal_entry.pop("prevLSN", None)
+        old_pages = _chained_pages()
+
+        new_wal = _chained_wal()
+        new_pages = _chained_pages()
+
+        self.assertEqual(
+            undo(old_wal, _chained_tt(), old_pages),
+            undo(new_wal, _chained_tt(), new_pages),
+        )
+        self.assertEqual(old_pages, new_pages)
+        # Only the chained CLRs know their exact undoNextLSN and prevLSN.
+        self.assertEqual(
+            [(clr["LSN"], clr["page"], clr["after"]) for clr in old_wal[9:]],
+            [(clr["LSN"], clr["page"], clr["after"]) for clr in new_wal[9:]],
+        )
+
+    def test_undo_chain_reads_only_loser_records(self):
+        wal = _chained_wal()
+        # Lots of finished work in between that undo shouldn't have to read.
+        for lsn in range(10, 5010):
+            wal.append({"LSN": lsn, "type": "BEGIN", "tx": f"W{lsn}"})
+
+        fd, path = tempfile.mkstemp(suffix=".jsonl")
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, "w") as f:
+            for wal_entry in wal:
+                f.write(json.dumps(wal_entry) + "\n")
+
+        wal_file = WalFile(path)
+        wal_index = WalIndex(sample_interval=4)
+        wal_index.catch_up(wal_file)
+        wal_file.decoded = wal_file.skimmed = 0
+
+        disk_page = _chained_pages()
+        undone_lsns = undo(wal_file, _chained_tt(), disk_page, wal_index)
+
+        self.assertEqual(undone_lsns, [7, 6, 4])
+        self.assertEqual(disk_page["P1"]["value"], 0)
+        # Each record on the loser chains (and the last one, for the next LSN)
+        # is decoded once; a lookup skims at most a sample interval to get there.
+        self.assertLess(wal_file.decoded, 10)
+        self.assertLess(wal_file.skimmed, 4 * 5)
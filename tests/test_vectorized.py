@@ -0,0 +1,121 @@
+import contextlib
+import copy
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import vectorized
+from aries import DEFAULT_DISK_PAGES_PATH, DEFAULT_WAL_FILE_PATH, analysis, main, redo
+from columnar import ColumnarWal
+from pagestore import import_json
+from tests.test_columnar import ODD_RECORDS
+from workload import Workload
+
+
+def _redo(redo_function, wal, disk_pages):
+    pages = copy.deepcopy(disk_pages)
+    _, dpt, _ = analysis(wal)
+    stats = {}
+    redone = redo_function(wal, dpt, pages, stats)
+    return redone, stats, pages
+
+
+@unittest.skipIf(not vectorized.available(), "numpy isn't installed")
+class TestVectorizedRedo(unittest.TestCase):
+    def test_same_as_redo(self) -> None:
+        for options in (
+            {},
+            {"checkpoint_interval": 40, "abort_ratio": 0.3, "flush_probability": 0.5},
+            {"pages": 5, "skew": "zipf"},
+        ):
+            workload = Workload(transactions=300, seed=7, **options)
+            records = list(workload.records())
+            expected = _redo(redo, records, workload.disk_pages)
+            self.assertTrue(expected[0])
+
+            wal = ColumnarWal.from_records(records)
+            self.assertEqual(
+                _redo(vectorized.redo_vectorized, wal, workload.disk_pages), expected
+            )
+            # Plain lists of records are converted to columns first.
+            self.assertEqual(
+                _redo(vectorized.redo_vectorized, records, workload.disk_pages),
+                expected,
+            )
+
+    def test_odd_records(self) -> None:
+        # Images that don't fit the int64 column, records kept whole.
+        pages = {page: {"pageLSN": 0, "value": 0} for page in ("P1", "P2")}
+        wal = ColumnarWal.from_records(ODD_RECORDS)
+        self.assertEqual(
+            _redo(vectorized.redo_vectorized, wal, pages),
+            _redo(redo, list(ODD_RECORDS), pages),
+        )
+
+    def test_from_offset(self) -> None:
+        workload = Workload(transactions=200, checkpoint_interval=50, seed=2)
+        wal = ColumnarWal.from_records(workload.records())
+        offset = wal.offsets[len(wal) // 2]
+        _, dpt, _ = analysis(wal)
+
+        expected_pages = copy.deepcopy(workload.disk_pages)
+        expected = redo(wal.records_from(offset), dpt, expected_pages)
+        pages = copy.deepcopy(workload.disk_pages)
+        redone = vectorized.redo_vectorized(wal.records_from(offset), dpt, pages)
+        self.assertEqual(redone, expected)
+        self.assertEqual(pages, expected_pages)
+
+    def test_lsns_going_backward(self) -> None:
+        records = [
+            {
+                "LSN": 5,
+                "type": "UPDATE",
+                "tx": "T1",
+                "page": "P1",
+                "before": 0,
+                "after": 1,
+            },
+            {
+                "LSN": 3,
+                "type": "UPDATE",
+                "tx": "T1",
+                "page": "P1",
+                "before": 1,
+                "after": 2,
+            },
+        ]
+        pages = {"P1": {"pageLSN": 0, "value": 0}}
+        wal = ColumnarWal.from_records(records)
+        self.assertEqual(
+            _redo(vectorized.redo_vectorized, wal, pages),
+            _redo(redo, records, pages),
+        )
+
+    def test_empty_dirty_page_table(self) -> None:
+        pages = {"P1": {"pageLSN": 0, "value": 0}}
+        wal = ColumnarWal.from_records(ODD_RECORDS)
+        self.assertEqual(vectorized.redo_vectorized(wal, {}, pages), [])
+        self.assertEqual(pages, {"P1": {"pageLSN": 0, "value": 0}})
+
+    def test_cli(self) -> None:
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        # Recovering a page store in place logs its CLRs, so each run gets a copy of the WAL.
+        wal_path = os.path.join(tmp_dir, "wal.jsonl")
+        outputs = []
+        for options in ([], ["--vectorized-redo"]):
+            pages_path = os.path.join(tmp_dir, "pages.bin")
+            import_json(DEFAULT_DISK_PAGES_PATH, pages_path)
+            shutil.copy(DEFAULT_WAL_FILE_PATH, wal_path)
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                main(["--wal", wal_path, "--pages", pages_path] + options)
+            with open(pages_path, "rb") as f:
+                outputs.append((out.getvalue(), f.read()))
+        self.assertEqual(outputs[0], outputs[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
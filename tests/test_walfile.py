@@ -0,0 +1,135 @@
+import json
+import os
+import tempfile
+import unittest
+
+from aries import analysis, redo, undo
+from walfile import WalFile, iter_wal_lines, iter_wal_lines_reversed, peek_header
+
+WAL = [
+    {"LSN": 5, "type": "BEGIN", "tx": "T1"},
+    {"LSN": 6, "type": "BEGIN", "tx": "T2"},
+    {"LSN": 10, "type": "UPDATE", "tx": "T1", "page": "P1", "before": 0, "after": 1},
+    {"LSN": 12, "type": "UPDATE", "tx": "T2", "page": "P2", "before": 10, "after": 11},
+    {"LSN": 14, "type": "UPDATE", "tx": "T1", "page": "P2", "before": 11, "after": 99},
+    {
+        "LSN": 16,
+        "type": "CHECKPOINT",
+        "DPT": {"P1": 10, "P2": 12},
+        "TT": {
+            "T1": {"status": "RUNNING", "lastLSN": 14},
+            "T2": {"status": "RUNNING", "lastLSN": 12},
+        },
+    },
+    {"LSN": 18, "type": "UPDATE", "tx": "T2", "page": "P1", "before": 1, "after": 2},
+    {"LSN": 20, "type": "COMMIT", "tx": "T2"},
+]
+
+
+def _pages():
+    return {
+        "P1": {"pageLSN": 0, "value": 0},
+        "P2": {"pageLSN": 0, "value": 10},
+    }
+
+
+class TestWalFile(unittest.TestCase):
+    def setUp(self) -> None:
+        fd, self.path = tempfile.mkstemp(suffix=".jsonl")
+        with os.fdopen(fd, "w") as f:
+            for record in WAL:
+                f.write(json.dumps(record) + "\n")
+
+    def tearDown(self) -> None:
+        os.remove(self.path)
+
+    def test_forward_across_chunk_boundaries(self) -> None:
+        # Tiny chunks force lines to be split between reads.
+        for chunk_size in (1, 7, 64, 1 << 20):
+            records = list(WalFile(self.path, chunk_size=chunk_size))
+            self.assertEqual(records, WAL)
+
+    def test_reverse_across_chunk_boundaries(self) -> None:
+        for chunk_size in (1, 7, 64, 1 << 20):
+            records = list(reversed(WalFile(self.path, chunk_size=chunk_size)))
+            self.assertEqual(records, WAL[::-1])
+
+    def test_offsets_point_at_lines(self) -> None:
+        with open(self.path, "rb") as f:
+            data = f.read()
+
+        forward = list(iter_wal_lines(self.path, chunk_size=5))
+        backward = list(iter_wal_lines_reversed(self.path, chunk_size=5))
+
+        self.assertEqual(forward, backward[::-1])
+        for offset, line in forward:
+            self.assertEqual(data[offset : offset + len(line)], line)
+
+        # Starting part way through only yields the remaining lines.
+        self.assertEqual(list(iter_wal_lines(self.path, forward[5][0])), forward[5:])
+
+    def test_peek_header(self) -> None:
+        self.assertEqual(
+            peek_header(b'{"LSN": 7, "type": "COMMIT", "tx": "T1"}'), (7, "COMMIT")
+        )
+        self.assertEqual(peek_header(b' {"LSN":-3,"type":"CLR"}'), (-3, "CLR"))
+        # Anything laid out differently has to be parsed.
+        self.assertIsNone(peek_header(b'{"type": "COMMIT", "LSN": 7}'))
+        self.assertIsNone(peek_header(b'{"LSN": 7.5, "type": "COMMIT"}'))
+        self.assertIsNone(peek_header(b'{"LSN": 7, "tx": "T1", "type": "COMMIT"}'))
+
+    def test_scan_lazy(self) -> None:
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"type": "END", "tx": "T2", "LSN": 21}) + "\n")
+        wal = WalFile(self.path, chunk_size=7)
+        expected = list(wal.scan())
+        wal.decoded = 0
+
+        scanned = list(wal.scan_lazy())
+        self.assertEqual(
+            [
+                (offset, end, lsn, record_type)
+                for offset, end, lsn, record_type, _ in scanned
+            ],
+            [(offset, end, r["LSN"], r["type"]) for offset, end, r in expected],
+        )
+        # Only the line that doesn't start with its LSN and type was parsed.
+        self.assertEqual((wal.decoded, wal.skimmed), (1, len(WAL)))
+        self.assertEqual(
+            [wal.decode_raw(raw) for *_, raw in scanned], [r for *_, r in expected]
+        )
+        self.assertEqual(wal.decoded, len(WAL) + 1)
+
+    def test_missing_trailing_newline_and_blank_lines(self) -> None:
+        with open(self.path, "w") as f:
+            f.write(json.dumps(WAL[0]) + "\n\n" + json.dumps(WAL[1]))
+
+        self.assertEqual(list(WalFile(self.path, chunk_size=3)), WAL[:2])
+        self.assertEqual(list(reversed(WalFile(self.path, chunk_size=3))), WAL[1::-1])
+
+    def test_recovery_matches_in_memory_list(self) -> None:
+        wal_list = [dict(record) for record in WAL]
+        wal_file = WalFile(self.path, chunk_size=16)
+
+        list_pages, file_pages = _pages(), _pages()
+
+        list_tt, list_dpt, list_ended = analysis(wal_list)
+        file_tt, file_dpt, file_ended = analysis(wal_file)
+        self.assertEqual(
+            (list_tt, list_dpt, list_ended), (file_tt, file_dpt, file_ended)
+        )
+
+        self.assertEqual(
+            redo(wal_list, list_dpt, list_pages), redo(wal_file, file_dpt, file_pages)
+        )
+        self.assertEqual(
+            undo(wal_list, list_tt, list_pages), undo(wal_file, file_tt, file_pages)
+        )
+        self.assertEqual(list_pages, file_pages)
+
+        # CLRs are kept in memory after the on-disk records.
+        self.assertEqual(list(wal_file), wal_list)
+
+
+if __name__ == "__main__":
+    unittest.main()
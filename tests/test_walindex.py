@@ -0,0 +1,143 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from aries import analysis, redo
+from binwal import BinaryWal, convert_jsonl_to_binary
+from walfile import WalFile
+from walindex import WalIndex, index_path_for
+
+
+def _wal(count, checkpoint_every):
+    # One long transaction per page, with a checkpoint every so often.
+    records = [{"LSN": 1, "type": "BEGIN", "tx": "T1"}]
+    dpt = {}
+    for lsn in range(2, count + 2):
+        if lsn % checkpoint_every == 0:
+            records.append(
+                {
+                    "LSN": lsn,
+                    "type": "CHECKPOINT",
+                    "DPT": dict(dpt),
+                    "TT": {"T1": {"status": "RUNNING", "lastLSN": lsn - 1}},
+                }
+            )
+            continue
+        page = f"P{lsn % 5}"
+        dpt.setdefault(page, lsn)
+        records.append(
+            {
+                "LSN": lsn,
+                "type": "UPDATE",
+                "tx": "T1",
+                "page": page,
+                "before": lsn - 1,
+                "after": lsn,
+            }
+        )
+    return records
+
+
+class TestWalIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "wal.jsonl")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, records, mode="w"):
+        with open(self.path, mode) as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+    def test_seeks_to_last_checkpoint(self) -> None:
+        records = _wal(200, checkpoint_every=50)
+        self._write(records)
+
+        wal = WalFile(self.path)
+        index = WalIndex.open(wal, sample_interval=16)
+
+        self.assertEqual([lsn for lsn, _ in index.checkpoints], [50, 100, 150, 200])
+        from_checkpoint = list(wal.records_from(index.last_checkpoint_offset()))
+        self.assertEqual(from_checkpoint[0]["LSN"], 200)
+        self.assertEqual(analysis(from_checkpoint), analysis(records))
+
+    def test_offset_for_lsn_never_skips_needed_records(self) -> None:
+        records = _wal(200, checkpoint_every=1000)
+        # LSNs are not always increasing in the log.
+        records.insert(100, {"LSN": 500, "type": "COMMITTED", "tx": "T1"})
+        self._write(records)
+
+        wal = WalFile(self.path)
+        index = WalIndex.open(wal, sample_interval=8)
+
+        for lsn in (1, 37, 99, 150, 501):
+            skipped = len(records) - len(
+                list(wal.records_from(index.offset_for_lsn(lsn)))
+            )
+            self.assertTrue(all(record["LSN"] < lsn for record in records[:skipped]))
+
+        # Something is actually skipped.
+        self.assertIsNotNone(index.offset_for_lsn(90))
+
+        pages = {f"P{i}": {"pageLSN": 0, "value": 0} for i in range(5)}
+        seek_pages = {f"P{i}": {"pageLSN": 0, "value": 0} for i in range(5)}
+        dpt = {"P1": 150, "P2": 160}
+        self.assertEqual(
+            redo(records, dpt, pages),
+            redo(wal.records_from(index.offset_for_lsn(150)), dpt, seek_pages),
+        )
+        self.assertEqual(pages, seek_pages)
+
+    def test_incremental_catch_up(self) -> None:
+        records = _wal(100, checkpoint_every=40)
+        self._write(records[:60])
+        WalIndex.open(WalFile(self.path), sample_interval=8)
+
+        # Reopening an up to date index reads nothing.
+        index = WalIndex.load(index_path_for(self.path))
+        self.assertTrue(index.matches(self.path))
+        self.assertEqual(index.catch_up(WalFile(self.path)), 0)
+
+        # Only appended records get scanned.
+        self._write(records[60:], mode="a")
+        self.assertEqual(index.catch_up(WalFile(self.path)), len(records) - 60)
+
+        fresh = WalIndex(sample_interval=8)
+        fresh.catch_up(WalFile(self.path))
+        self.assertEqual(index.checkpoints, fresh.checkpoints)
+        self.assertEqual(index.sample_offsets, fresh.sample_offsets)
+        self.assertEqual(index.sample_lsns, fresh.sample_lsns)
+
+    def test_rebuilds_when_wal_rewritten(self) -> None:
+        records = _wal(100, checkpoint_every=40)
+        self._write(records)
+        WalIndex.open(WalFile(self.path))
+
+        # Drop the prefix, as truncation would.
+        self._write(records[50:])
+        self.assertFalse(WalIndex.load(index_path_for(self.path)).matches(self.path))
+
+        index = WalIndex.open(WalFile(self.path))
+        self.assertEqual([lsn for lsn, _ in index.checkpoints], [80])
+
+    def test_binary_wal(self) -> None:
+        records = _wal(120, checkpoint_every=50)
+        self._write(records)
+        bin_path = os.path.join(self.tmp_dir, "wal.bin")
+        convert_jsonl_to_binary(self.path, bin_path)
+
+        with BinaryWal(bin_path) as wal:
+            index = WalIndex.open(wal, sample_interval=10)
+            from_checkpoint = list(wal.records_from(index.last_checkpoint_offset()))
+            self.assertEqual(from_checkpoint[0]["LSN"], 100)
+            self.assertEqual(
+                list(wal.records_from(index.offset_for_lsn(60)))[0]["LSN"], 51
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import contextlib
+import copy
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from aries import analysis, main, redo, undo
+from benchmark import PHASES, compare, run_benchmark
+from pagestore import PageStore
+from workload import Workload, write_workload
+
+
+def _recover(records, disk_pages):
+    pages = copy.deepcopy(disk_pages)
+    tt, dpt, _ = analysis(records)
+    redo(records, dpt, pages)
+    undo(list(records), tt, pages)
+    return {page: info["value"] for page, info in pages.items()}
+
+
+class TestWorkload(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def test_same_seed_same_log(self) -> None:
+        first = list(Workload(transactions=50, seed=7).records())
+        self.assertEqual(first, list(Workload(transactions=50, seed=7).records()))
+        self.assertNotEqual(first, list(Workload(transactions=50, seed=8).records()))
+
+        # LSNs are dense and every transaction began.
+        self.assertEqual([r["LSN"] for r in first], list(range(1, len(first) + 1)))
+        self.assertEqual(sum(r["type"] == "BEGIN" for r in first), 50)
+
+    def test_ratios(self) -> None:
+        workload = Workload(transactions=400, abort_ratio=0.25, loser_ratio=0.1)
+        records = list(workload.records())
+
+        tt, _, _ = analysis(records)
+        self.assertEqual(len(tt), 40)
+        aborts = sum(r["type"] == "ABORT" for r in records)
+        self.assertGreater(aborts, 60)
+        self.assertLess(aborts, 140)
+
+    def test_recovery_restores_committed_values(self) -> None:
+        for options in (
+            {},
+            {"skew": "zipf", "pages": 40, "concurrency": 16},
+            {"checkpoint_interval": 50, "abort_ratio": 0.3, "loser_ratio": 0.2},
+        ):
+            workload = Workload(transactions=300, seed=1, **options)
+            records = list(workload.records())
+            self.assertEqual(
+                _recover(records, workload.disk_pages), workload.expected_values
+            )
+
+    def test_zipf_prefers_hot_pages(self) -> None:
+        workload = Workload(transactions=500, pages=100, skew="zipf", loser_ratio=0)
+        pages = [r["page"] for r in workload.records() if r["type"] == "UPDATE"]
+        self.assertGreater(pages.count("P0"), pages.count("P50") * 5)
+
+    def test_recover_written_files(self) -> None:
+        wal_path = os.path.join(self.tmp_dir, "wal.bin")
+        pages_path = os.path.join(self.tmp_dir, "pages.bin")
+        workload = Workload(transactions=200, checkpoint_interval=100, seed=2)
+        written = write_workload(
+            workload, wal_path, pages_path, binary=True, page_store=True
+        )
+        self.assertEqual(written, workload.record_count)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            main(["--wal", wal_path, "--pages", pages_path])
+
+        with PageStore(pages_path) as store:
+            values = {page: info["value"] for page, info in store.items()}
+        self.assertEqual(values, workload.expected_values)
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_run_and_compare(self) -> None:
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        run = run_benchmark(
+            Workload(transactions=100, checkpoint_interval=100), tmp_dir
+        )
+        json.dumps(run)
+        self.assertTrue(run["correct"])
+        self.assertEqual(tuple(run["phases"]), PHASES)
+        self.assertGreater(run["phases"]["analysis"]["peak_rss_bytes"], 0)
+        # Each phase's rate is over the records it read, not the whole log.
+        phases = run["phases"]
+        self.assertIsNone(phases["load"]["records_per_second"])
+        self.assertGreater(phases["analysis"]["records"], 0)
+        self.assertLess(phases["analysis"]["records"], run["records"])
+        self.assertGreater(run["records_per_second"], 0)
+
+        run["target_records"] = 1000
+        slower = copy.deepcopy(run)
+        slower["phases"]["redo"]["wall_seconds"] *= 2
+        regressions = compare({"runs": [run]}, {"runs": [slower]}, 1.5)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn("redo", regressions[0])
+
+    def test_page_store_run_logs_undo(self) -> None:
+        # Undo's CLRs reach the WAL file before the page store is flushed, so
+        # recovering the same files again finds nothing left to undo.
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        workload = Workload(transactions=200, loser_ratio=0.2, seed=3)
+        run = run_benchmark(workload, tmp_dir, page_store=True)
+        self.assertTrue(run["correct"])
+        self.assertGreater(run["undone"], 0)
+
+        wal_path = os.path.join(tmp_dir, "wal.jsonl")
+        with open(wal_path) as f:
+            records = [json.loads(line) for line in f]
+        clrs = [r for r in records[run["records"] :] if r["type"] == "CLR"]
+        self.assertEqual(len(clrs), run["undone"])
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            main(["--wal", wal_path, "--pages", os.path.join(tmp_dir, "pages.bin")])
+        undone = out.getvalue().split("Undone WAL Enrties By LSN:")[1]
+        self.assertEqual(undone.split("Flushed")[0].split(), [])
+        self.assertIn("Flushed 0 modified pages", undone)
+        with PageStore(os.path.join(tmp_dir, "pages.bin")) as store:
+            values = {page: info["value"] for page, info in store.items()}
+        self.assertEqual(values, workload.expected_values)
+
+
+if __name__ == "__main__":
+    unittest.main()
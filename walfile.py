@@ -0,0 +1,202 @@
+import json
+import os
+import re
+from typing import Iterator
+
+# Streaming access to a JSONL write-ahead log.
+#
+# Recovery used to json.loads every line of the WAL into one big list before
+# analysis even started, so memory grew with the length of the log. Here the
+# file is read in large buffered chunks and records are decoded one at a time,
+# either forward (analysis, redo) or backward (undo). Peak memory is one read
+# buffer plus whatever the caller keeps around (TT/DPT).
+#
+# Most of what recovery reads it only needs the LSN and type of (building the
+# index, skipping records below the smallest recLSN, looking for an LSN in
+# undo). scan_lazy reads those two straight from the bytes of each line and
+# leaves parsing the rest to decode_raw, for the records that need it.
+
+WAL_CHUNK_SIZE = 1 << 20  # 1 MiB per read.
+
+# A line that starts with the LSN and type, the way json.dumps writes our records.
+_HEADER = re.compile(rb'\s*\{"LSN":\s*(-?\d+),\s*"type":\s*"([A-Za-z_]+)"')
+
+
+def peek_header(line: bytes) -> tuple[int, str] | None:
+    # The LSN and type of a JSONL record without parsing it, or None if the
+    # line isn't laid out the usual way (then it has to be parsed).
+    match = _HEADER.match(line)
+    if match is None:
+        return None
+    return int(match[1]), match[2].decode()
+
+
+def iter_wal_lines(
+    path: str,
+    start_offset: int = 0,
+    chunk_size: int = WAL_CHUNK_SIZE,
+    end_offset: int | None = None,
+) -> Iterator[tuple[int, bytes]]:
+    # Yield (byte offset, raw line) for every non-blank line from start_offset
+    # to end_offset (default: EOF).
+    with open(path, "rb") as f:
+        f.seek(start_offset)
+        offset = start_offset
+        pending = b""
+
+        while True:
+            if end_offset is None:
+                chunk = f.read(chunk_size)
+            else:
+                chunk = f.read(max(0, min(chunk_size, end_offset - f.tell())))
+            if not chunk:
+                break
+
+            buffer = pending + chunk
+            line_start = 0
+            while True:
+                newline = buffer.find(b"\n", line_start)
+                if newline == -1:
+                    break
+                line = buffer[line_start:newline]
+                if line.strip():
+                    yield offset + line_start, line
+                line_start = newline + 1
+
+            # Keep the partial last line around until the next chunk completes it.
+            offset += line_start
+            pending = buffer[line_start:]
+
+        if pending.strip():
+            # Last line without a trailing newline.
+            yield offset, pending
+
+
+def iter_wal_lines_reversed(
+    path: str, end_offset: int | None = None, chunk_size: int = WAL_CHUNK_SIZE
+) -> Iterator[tuple[int, bytes]]:
+    # Yield (byte offset, raw line) for every non-blank line before end_offset, last line first.
+    with open(path, "rb") as f:
+        position = os.fstat(f.fileno()).st_size if end_offset is None else end_offset
+        pending = b""
+
+        while position > 0:
+            read_size = min(chunk_size, position)
+            position -= read_size
+            f.seek(position)
+            buffer = f.read(read_size) + pending
+
+            # Everything after the first newline in the buffer is made of whole lines.
+            # The part before it may continue in the previous chunk, so hold on to it.
+            line_end = len(buffer)
+            while True:
+                newline = buffer.rfind(b"\n", 0, line_end)
+                if newline == -1:
+                    break
+                line = buffer[newline + 1 : line_end]
+                if line.strip():
+                    yield position + newline + 1, line
+                line_end = newline
+
+            pending = buffer[:line_end]
+
+        if pending.strip():
+            # First line of the file.
+            yield 0, pending
+
+
+def append_records(path: str, records: list[dict]) -> None:
+    # Append records to a JSONL WAL file, one per line.
+    with open(path, "ab+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                # Don't glue the first record onto an unterminated last line.
+                f.write(b"\n")
+        f.write(b"".join(json.dumps(record).encode() + b"\n" for record in records))
+
+
+class WalFile:
+    """A JSONL WAL that is streamed from disk instead of loaded into memory.
+
+    Supports the parts of the list interface recovery relies on: forward
+    iteration, reversed() and append(). Appended records (the CLRs written by
+    undo) are kept in memory after the on-disk records; append() never
+    writes the file (see checkpoint.WalAppender for that).
+    """
+
+    def __init__(self, path: str, chunk_size: int = WAL_CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        # Bytes on disk at open. Records written to the file after that (e.g.
+        # undo's CLRs, which are also in tail) aren't read back from it.
+        self.size = os.path.getsize(path) if os.path.exists(path) else None
+        self.tail: list[dict] = []
+        # Records parsed from disk so far, and records scan_lazy went past
+        # without parsing them (yet), for instrumentation.
+        self.decoded = 0
+        self.skimmed = 0
+
+    def close(self) -> None:
+        # Nothing is held open between reads; here to match BinaryWal.
+        pass
+
+    def __enter__(self) -> "WalFile":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def scan(self, start_offset: int | None = None) -> Iterator[tuple[int, int, dict]]:
+        # (offset, end offset, record) for every on-disk record from start_offset on.
+        for offset, line in iter_wal_lines(
+            self.path, start_offset or 0, self.chunk_size, self.size
+        ):
+            self.decoded += 1
+            yield offset, offset + len(line), json.loads(line)
+
+    def scan_lazy(
+        self, start_offset: int | None = None, end_offset: int | None = None
+    ) -> Iterator[tuple[int, int, int, str, bytes | dict]]:
+        # (offset, end offset, LSN, type, raw) for every on-disk record from
+        # start_offset on (up to end_offset). decode_raw(raw) gives the whole record.
+        if end_offset is None or (self.size is not None and self.size < end_offset):
+            end_offset = self.size
+        for offset, line in iter_wal_lines(
+            self.path, start_offset or 0, self.chunk_size, end_offset
+        ):
+            end_offset = offset + len(line)
+            header = peek_header(line)
+            if header is None:
+                record = self.decode_raw(line)
+                yield offset, end_offset, record["LSN"], record.get("type"), record
+                continue
+            self.skimmed += 1
+            lsn, record_type = header
+            yield offset, end_offset, lsn, record_type, line
+
+    def decode_raw(self, raw: bytes | dict) -> dict:
+        if isinstance(raw, dict):
+            # Already parsed by scan_lazy.
+            return raw
+        self.decoded += 1
+        return json.loads(raw)
+
+    def records_from(self, start_offset: int | None) -> Iterator[dict]:
+        # Iterate the WAL starting at a byte offset (see walindex.py), None for the start.
+        for _, _, record in self.scan(start_offset):
+            yield record
+        yield from self.tail
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.records_from(None)
+
+    def __reversed__(self) -> Iterator[dict]:
+        yield from reversed(self.tail)
+        for _, line in iter_wal_lines_reversed(self.path, self.size, self.chunk_size):
+            self.decoded += 1
+            yield json.loads(line)
+
+    def append(self, record: dict) -> None:
+        self.tail.append(record)
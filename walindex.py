@@ -0,0 +1,226 @@
+import bisect
+import hashlib
+import json
+import os
+
+# Sidecar index over a WAL file (JSONL or binary).
+#
+# Without it analysis has to read every record up to the last checkpoint, and
+# redo has to decode every record below the smallest recLSN just to skip it.
+# The index remembers the byte offset of every checkpoint plus a sparse sample
+# of LSN -> offset, so both phases can seek straight to where their work begins.
+#
+# It is stored next to the WAL as <wal path>.idx and caught up incrementally:
+# when the WAL has grown only the new records are scanned. If the indexed part
+# of the WAL was rewritten (e.g. truncated) the index is rebuilt from scratch.
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+INDEX_SAMPLE_INTERVAL = 1024  # Records between LSN samples.
+_HEAD_BYTES = 4096  # How much of the WAL we fingerprint to notice rewrites.
+
+
+def index_path_for(wal_path: str) -> str:
+    return wal_path + INDEX_SUFFIX
+
+
+def _head_digest(path: str, length: int) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read(length)).hexdigest()
+
+
+class WalIndex:
+    """Checkpoint offsets and sparse LSN samples for one WAL file."""
+
+    def __init__(self, sample_interval: int = INDEX_SAMPLE_INTERVAL):
+        self.sample_interval = sample_interval
+
+        # End of the last indexed record, None if nothing is indexed yet.
+        self.indexed_bytes: int | None = None
+        self.head_length = 0
+        self.head_digest = ""
+
+        self.max_lsn: int | None = None
+        self.records_since_sample = 0
+
+        # (LSN, offset) of each checkpoint record, in log order.
+        self.checkpoints: list[tuple[int, int]] = []
+
+        # sample_lsns[i] is the largest LSN of any record before sample_offsets[i].
+        # Since it's a running max it never decreases, even if LSNs in the log do.
+        self.sample_lsns: list[int] = []
+        self.sample_offsets: list[int] = []
+
+    @classmethod
+    def open(cls, wal, sample_interval: int = INDEX_SAMPLE_INTERVAL) -> "WalIndex":
+        # Load the sidecar index for wal (a WalFile or BinaryWal), bring it up
+        # to date with the WAL on disk and save it again if anything changed.
+        path = index_path_for(wal.path)
+        index = cls.load(path) if os.path.exists(path) else None
+
+        if index is None or not index.matches(wal.path):
+            index = cls(sample_interval)
+
+        if index.catch_up(wal):
+            index.save(path)
+
+        return index
+
+    def matches(self, wal_path: str) -> bool:
+        # Is the part of the WAL we indexed still the same bytes?
+        if self.indexed_bytes is None:
+            return True
+        if os.path.getsize(wal_path) < self.indexed_bytes:
+            return False
+        return _head_digest(wal_path, self.head_length) == self.head_digest
+
+    def catch_up(self, wal) -> int:
+        # Index every record after the ones we already know about.
+        # Returns how many records were added.
+        added = 0
+
+        # Only checkpoints are parsed, everything else just has its LSN read.
+        for offset, end_offset, lsn, record_type, raw in wal.scan_lazy(
+            self.indexed_bytes
+        ):
+            if self.records_since_sample >= self.sample_interval:
+                self.sample_lsns.append(self.max_lsn)
+                self.sample_offsets.append(offset)
+                self.records_since_sample = 0
+
+            if record_type == "CHECKPOINT":
+                match wal.decode_raw(raw):
+                    case {"type": "CHECKPOINT", "DPT": _, "TT": _}:
+                        self.checkpoints.append((lsn, offset))
+
+            if self.max_lsn is None or lsn > self.max_lsn:
+                self.max_lsn = lsn
+            self.records_since_sample += 1
+            self.indexed_bytes = end_offset
+            added += 1
+
+        if added and self.head_length < _HEAD_BYTES:
+            self.head_length = min(_HEAD_BYTES, self.indexed_bytes)
+            self.head_digest = _head_digest(wal.path, self.head_length)
+
+        return added
+
+    def last_checkpoint_offset(self) -> int | None:
+        # Where analysis can start, None meaning the start of the log.
+        if not self.checkpoints:
+            return None
+        return self.checkpoints[-1][1]
+
+    def offset_for_lsn(self, lsn: int) -> int | None:
+        # An offset such that every record before it has an LSN below lsn, as
+        # late in the log as the samples allow. None means the start of the log.
+        i = bisect.bisect_left(self.sample_lsns, lsn)
+        if i == 0:
+            return None
+        return self.sample_offsets[i - 1]
+
+    def split_offsets(self, start_offset: int | None) -> list[int]:
+        # Record offsets past start_offset where the log can be cut into
+        # ranges that each begin on a record (the LSN samples), in log order.
+        i = 0
+        if start_offset is not None:
+            i = bisect.bisect_right(self.sample_offsets, start_offset)
+        return self.sample_offsets[i:]
+
+    def save(self, path: str) -> None:
+        state = {
+            "version": INDEX_VERSION,
+            "sample_interval": self.sample_interval,
+            "indexed_bytes": self.indexed_bytes,
+            "head_length": self.head_length,
+            "head_digest": self.head_digest,
+            "max_lsn": self.max_lsn,
+            "records_since_sample": self.records_since_sample,
+            "checkpoints": self.checkpoints,
+            "sample_lsns": self.sample_lsns,
+            "sample_offsets": self.sample_offsets,
+        }
+        # Write to the side and rename so a crash never leaves half an index behind.
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "WalIndex | None":
+        # None if the file isn't an index we understand; the caller rebuilds it.
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(state, dict) or state.get("version") != INDEX_VERSION:
+            return None
+
+        index = cls(state["sample_interval"])
+        index.indexed_bytes = state["indexed_bytes"]
+        index.head_length = state["head_length"]
+        index.head_digest = state["head_digest"]
+        index.max_lsn = state["max_lsn"]
+        index.records_since_sample = state["records_since_sample"]
+        index.checkpoints = [tuple(entry) for entry in state["checkpoints"]]
+        index.sample_lsns = state["sample_lsns"]
+        index.sample_offsets = state["sample_offsets"]
+        return index
+
+
+class LsnLookup:
+    """Finds WAL records by LSN, for following prevLSN chains.
+
+    With a WalIndex the lookup seeks to the nearest LSN sample and scans
+    forward from there, so the cost doesn't depend on the length of the log.
+    The records passed along the way are remembered undecoded, since undo
+    tends to look up several LSNs close to each other, and only the ones asked
+    for are decoded. Without an index (an in-memory list) we just map every LSN
+    once. A ColumnarWal or SegmentedWal finds records by itself.
+    """
+
+    def __init__(self, wal, wal_index: WalIndex | None = None):
+        self.wal = wal
+        self.wal_index = wal_index
+        self._start_offset: int | None = None
+        # LSN -> record, or its raw form (see scan_lazy) until it is asked for.
+        self._records: dict[int, object] | None = None
+        self._record_for_lsn = getattr(wal, "record_for_lsn", None)
+
+    def __call__(self, lsn: int) -> dict:
+        # Raises KeyError if no record has this LSN.
+        if self._record_for_lsn is not None:
+            return self._record_for_lsn(lsn)
+        if self.wal_index is None:
+            if self._records is None:
+                self._records = {record["LSN"]: record for record in self.wal}
+            return self._records[lsn]
+
+        start_offset = self.wal_index.offset_for_lsn(lsn)
+        if (
+            self._records is None
+            or start_offset != self._start_offset
+            or lsn not in self._records
+        ):
+            self._start_offset = start_offset
+            self._records = self._scan(start_offset, lsn)
+
+        record = self._records[lsn]
+        if not isinstance(record, dict):
+            record = self._records[lsn] = self.wal.decode_raw(record)
+        return record
+
+    def _scan(self, start_offset: int | None, lsn: int) -> dict[int, object]:
+        # Raw records from start_offset up to lsn (or CLRs appended in memory).
+        records: dict[int, object] = {}
+        for _, _, record_lsn, _, raw in self.wal.scan_lazy(start_offset):
+            records.setdefault(record_lsn, raw)
+            if record_lsn == lsn:
+                return records
+        for record in getattr(self.wal, "tail", ()):
+            records.setdefault(record["LSN"], record)
+            if record["LSN"] == lsn:
+                return records
+        raise KeyError(lsn)
@@ -0,0 +1,376 @@
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import random
+from typing import Iterator
+
+from binwal import BinaryWalWriter
+from pagestore import create_page_store
+from walindex import index_path_for
+
+# Synthetic WALs for measuring how recovery scales.
+#
+# Workload simulates a small database up to a crash: transactions run
+# concurrently (holding a write lock on every page they touch until they finish,
+# as strict 2PL would), a background writer flushes the oldest dirty page now
+# and then, and a CHECKPOINT with the live TT/DPT is logged every so often.
+# Each transaction either commits, aborts (rolling back with CLRs before its
+# END) or is still in flight when the log stops, which makes it a loser.
+#
+# Besides the log, it produces the pages as they were on disk at the crash and
+# the value every page should have once recovery is done, i.e. what the
+# committed transactions wrote.
+
+SKEWS = ("uniform", "zipf")
+
+# How many pages a transaction draws before giving up on finding one that
+# isn't locked by someone else (and finishing early instead).
+_LOCK_ATTEMPTS = 16
+
+
+class _Transaction:
+    __slots__ = ("tx", "fate", "remaining", "last_lsn", "writes")
+
+    def __init__(self, tx: str, fate: str, updates: int):
+        self.tx = tx
+        self.fate = fate  # "commit", "abort" or "loser"
+        self.remaining = updates
+        self.last_lsn = None
+        # (LSN, prevLSN, page, before) of every update, for rolling back an abort.
+        self.writes: list[tuple[int, int, str, int]] = []
+
+
+class Workload:
+    """A seeded synthetic crash: the WAL, the pages on disk, and the recovered values."""
+
+    def __init__(
+        self,
+        transactions: int = 1000,
+        updates_per_tx: int = 4,
+        pages: int = 1000,
+        skew: str = "uniform",
+        zipf_s: float = 1.1,
+        abort_ratio: float = 0.05,
+        loser_ratio: float = 0.05,
+        checkpoint_interval: int = 0,
+        concurrency: int = 8,
+        flush_probability: float = 0.1,
+        seed: int = 0,
+    ):
+        # commit ratio is whatever abort_ratio and loser_ratio leave over.
+        # checkpoint_interval is in log records, 0 for no checkpoints.
+        if skew not in SKEWS:
+            raise ValueError(f"unknown skew {skew!r}, use one of {SKEWS}")
+        if abort_ratio < 0 or loser_ratio < 0 or abort_ratio + loser_ratio > 1:
+            raise ValueError("abort_ratio and loser_ratio must add up to at most 1")
+        if transactions < 0 or updates_per_tx < 1 or pages < 1 or concurrency < 1:
+            raise ValueError(
+                "transactions can't be negative and updates_per_tx, pages and "
+                "concurrency must be at least 1"
+            )
+
+        self.transactions = transactions
+        self.updates_per_tx = updates_per_tx
+        self.pages = pages
+        self.skew = skew
+        self.zipf_s = zipf_s
+        self.abort_ratio = abort_ratio
+        self.loser_ratio = loser_ratio
+        self.checkpoint_interval = checkpoint_interval
+        self.concurrency = concurrency
+        self.flush_probability = flush_probability
+        self.seed = seed
+
+        # Filled in once records() has run to the end.
+        self.disk_pages: dict[str, dict] = {}
+        self.expected_values: dict[str, int] = {}
+        self.record_count = 0
+
+    def spec(self) -> dict:
+        return {
+            "transactions": self.transactions,
+            "updates_per_tx": self.updates_per_tx,
+            "pages": self.pages,
+            "skew": self.skew,
+            "zipf_s": self.zipf_s,
+            "abort_ratio": self.abort_ratio,
+            "loser_ratio": self.loser_ratio,
+            "checkpoint_interval": self.checkpoint_interval,
+            "concurrency": self.concurrency,
+            "flush_probability": self.flush_probability,
+            "seed": self.seed,
+        }
+
+    def _page_sampler(self, rng: random.Random):
+        names = [f"P{i}" for i in range(self.pages)]
+        if self.skew == "uniform":
+            return lambda: names[rng.randrange(self.pages)]
+
+        # Zipf: P0 is the hottest page, the k-th page is chosen with weight 1/k^s.
+        cum_weights = list(
+            itertools.accumulate(1 / k**self.zipf_s for k in range(1, self.pages + 1))
+        )
+        return lambda: rng.choices(names, cum_weights=cum_weights)[0]
+
+    def records(self) -> Iterator[dict]:
+        # The WAL in LSN order, generated as it is consumed.
+        rng = random.Random(self.seed)
+        draw_page = self._page_sampler(rng)
+
+        losers = round(self.transactions * self.loser_ratio)
+        finishers = self.transactions - losers
+        abort_chance = self.abort_ratio / (1 - self.loser_ratio) if finishers else 0
+
+        # Losers are the last transactions to begin, so they are the ones the
+        # crash catches in flight.
+        fates = iter(
+            [
+                "abort" if rng.random() < abort_chance else "commit"
+                for _ in range(finishers)
+            ]
+            + ["loser"] * losers
+        )
+        next_tx = 1
+
+        lsn = 0
+        memory = {}  # page -> [pageLSN, value], for pages changed since startup
+        disk = {f"P{i}": {"pageLSN": 0, "value": 0} for i in range(self.pages)}
+        dirty = {}  # page -> recLSN, oldest first
+        committed = {}  # page -> value
+        owner = {}  # page -> tx holding its write lock
+        active: list[_Transaction] = []
+        in_flight: list[_Transaction] = (
+            []
+        )  # losers done updating, waiting for the crash
+        since_checkpoint = 0
+
+        def log(record: dict) -> dict:
+            nonlocal since_checkpoint
+            since_checkpoint += 1
+            self.record_count += 1
+            return record
+
+        def write_page(txn: _Transaction, page: str, value: int) -> None:
+            memory[page] = [lsn, value]
+            dirty.setdefault(page, lsn)
+            txn.last_lsn = lsn
+
+        self.record_count = 0
+        while True:
+            # Start transactions until we are at the concurrency limit.
+            while len(active) < self.concurrency:
+                fate = next(fates, None)
+                if fate is None:
+                    break
+                txn = _Transaction(f"T{next_tx}", fate, self.updates_per_tx)
+                next_tx += 1
+                lsn += 1
+                txn.last_lsn = lsn
+                active.append(txn)
+                yield log({"LSN": lsn, "type": "BEGIN", "tx": txn.tx})
+
+            if not active:
+                break
+
+            txn = active[rng.randrange(len(active))]
+
+            if txn.remaining > 0:
+                page = None
+                for _ in range(_LOCK_ATTEMPTS):
+                    candidate = draw_page()
+                    if owner.get(candidate, txn.tx) == txn.tx:
+                        page = candidate
+                        break
+
+                if page is None:
+                    # Everything we tried is locked, wrap up with what we have.
+                    txn.remaining = 0
+                else:
+                    txn.remaining -= 1
+                    owner[page] = txn.tx
+                    before = memory.get(page, (0, disk[page]["value"]))[1]
+                    after = rng.randrange(1_000_000)
+                    lsn += 1
+                    record = {
+                        "LSN": lsn,
+                        "type": "UPDATE",
+                        "tx": txn.tx,
+                        "prevLSN": txn.last_lsn,
+                        "page": page,
+                        "before": before,
+                        "after": after,
+                    }
+                    txn.writes.append((lsn, txn.last_lsn, page, before))
+                    write_page(txn, page, after)
+                    yield log(record)
+
+            elif txn.fate == "loser":
+                # Never finishes, and keeps its locks until the crash.
+                active.remove(txn)
+                in_flight.append(txn)
+
+            else:
+                active.remove(txn)
+                lsn += 1
+                yield log(
+                    {
+                        "LSN": lsn,
+                        "type": "COMMIT" if txn.fate == "commit" else "ABORT",
+                        "tx": txn.tx,
+                        "prevLSN": txn.last_lsn,
+                    }
+                )
+                txn.last_lsn = lsn
+
+                if txn.fate == "commit":
+                    for _, _, page, _ in txn.writes:
+                        committed[page] = memory[page][1]
+                else:
+                    # Roll back newest first, one CLR per update.
+                    for _, prev_lsn, page, before in reversed(txn.writes):
+                        lsn += 1
+                        record = {
+                            "LSN": lsn,
+                            "type": "CLR",
+                            "tx": txn.tx,
+                            "prevLSN": txn.last_lsn,
+                            "page": page,
+                            "after": before,
+                            "undoNextLSN": prev_lsn,
+                        }
+                        write_page(txn, page, before)
+                        yield log(record)
+
+                lsn += 1
+                yield log(
+                    {"LSN": lsn, "type": "END", "tx": txn.tx, "prevLSN": txn.last_lsn}
+                )
+                for _, _, page, _ in txn.writes:
+                    owner.pop(page, None)
+
+            # The background writer.
+            if dirty and rng.random() < self.flush_probability:
+                page = next(iter(dirty))
+                del dirty[page]
+                disk[page] = {"pageLSN": memory[page][0], "value": memory[page][1]}
+
+            if (
+                self.checkpoint_interval
+                and since_checkpoint >= self.checkpoint_interval
+            ):
+                lsn += 1
+                tt = {
+                    txn.tx: {"status": "RUNNING", "lastLSN": txn.last_lsn}
+                    for txn in active + in_flight
+                }
+                yield log(
+                    {"LSN": lsn, "type": "CHECKPOINT", "DPT": dict(dirty), "TT": tt}
+                )
+                since_checkpoint = 0
+
+        self.disk_pages = disk
+        self.expected_values = {page: committed.get(page, 0) for page in disk}
+
+
+def write_workload(
+    workload: Workload,
+    wal_path: str,
+    pages_path: str,
+    binary: bool = False,
+    page_store: bool = False,
+) -> int:
+    # Write the WAL (JSONL, or the binary format) and the disk pages (JSON, or a
+    # page store). Returns the number of records written.
+    # A regenerated log can start with the same bytes as the old one, so its
+    # sidecar index wouldn't notice the rest changed.
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(index_path_for(wal_path))
+
+    if binary:
+        with open(wal_path, "wb") as f:
+            writer = BinaryWalWriter(f)
+            for record in workload.records():
+                writer.append(record)
+    else:
+        with open(wal_path, "w") as f:
+            for record in workload.records():
+                f.write(json.dumps(record) + "\n")
+
+    if page_store:
+        create_page_store(pages_path, workload.disk_pages)
+    else:
+        with open(pages_path, "w") as f:
+            json.dump(workload.disk_pages, f)
+
+    return workload.record_count
+
+
+def add_workload_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--transactions", type=int, default=1000)
+    parser.add_argument("--updates-per-tx", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--skew", choices=SKEWS, default="uniform")
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="Zipf exponent")
+    parser.add_argument("--abort-ratio", type=float, default=0.05)
+    parser.add_argument(
+        "--loser-ratio",
+        type=float,
+        default=0.05,
+        help="fraction of transactions still running at the crash",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=int,
+        default=0,
+        metavar="RECORDS",
+        help="log a checkpoint every RECORDS records (default: never)",
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--flush-probability", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def workload_from_args(args: argparse.Namespace, **overrides) -> Workload:
+    options = {
+        "transactions": args.transactions,
+        "updates_per_tx": args.updates_per_tx,
+        "pages": args.pages,
+        "skew": args.skew,
+        "zipf_s": args.zipf_s,
+        "abort_ratio": args.abort_ratio,
+        "loser_ratio": args.loser_ratio,
+        "checkpoint_interval": args.checkpoint_interval,
+        "concurrency": args.concurrency,
+        "flush_probability": args.flush_probability,
+        "seed": args.seed,
+    }
+    options.update(overrides)
+    return Workload(**options)
+
+
+if __name__ == "__main__":
+    # python3 workload.py --transactions 10000 --skew zipf wal.jsonl disk_pages.json
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic WAL and disk pages."
+    )
+    add_workload_arguments(parser)
+    parser.add_argument("--binary", action="store_true", help="write a binary WAL")
+    parser.add_argument(
+        "--page-store", action="store_true", help="write the pages as a page store"
+    )
+    parser.add_argument("wal_path")
+    parser.add_argument("pages_path")
+    args = parser.parse_args()
+
+    written = write_workload(
+        workload_from_args(args),
+        args.wal_path,
+        args.pages_path,
+        binary=args.binary,
+        page_store=args.page_store,
+    )
+    print(
+        f"Wrote {written} records to {args.wal_path} and {args.pages} pages to {args.pages_path}"
+    )